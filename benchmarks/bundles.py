@@ -0,0 +1,94 @@
+"""
+Synthetic MECA bundles for benchmarks.
+
+Bundles are generated deterministically from a seed, so a scenario produces
+the same bytes on every run and results stay comparable between commits.
+"""
+
+import io
+import random
+import zipfile
+
+MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<manifest xmlns="https://manuscriptsexchange.org/schema/manifest" xmlns:xlink="http://www.w3.org/1999/xlink" manifest-version="1">
+  <item id="a-source" item-type="article-source-directory">
+    <instance media-type="application/x-directory" xlink:href="{source_dir}"/>
+  </item>
+{extra_items}</manifest>
+"""
+
+EXTRA_ITEM = """  <item id="item-{i}" item-type="supplementary-material">
+    <instance media-type="application/octet-stream" xlink:href="{href}"/>
+  </item>
+"""
+
+COMPRESSION = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+_WORDS = (
+    b"the of and to in is that for with as on by this are from model data "
+    b"results figure table notebook analysis method sample value error"
+).split()
+
+
+def _member_data(rng, size, content):
+    if content == "random":
+        return rng.randbytes(size)
+    # text compresses roughly like notebooks and markdown do
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return b" ".join(words)[:size]
+
+
+def _writestr(zf, name, data):
+    # a fixed timestamp keeps the archive bytes reproducible
+    info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0))
+    info.compress_type = zf.compression
+    zf.writestr(info, data)
+
+
+def generate_bundle(
+    members=100,
+    member_size=64 * 1024,
+    compression="deflated",
+    content="text",
+    source_dir="bundle/",
+    depth=2,
+    extra_items=1,
+    seed=0,
+):
+    """Return the bytes of a synthetic MECA bundle
+
+    `members` files of `member_size` bytes are spread over directories up to
+    `depth` levels deep under source_dir, which may itself be nested (e.g.
+    `"article/source/"`). `extra_items` manifest items point at files outside
+    the article source directory, as supplementary material does.
+    """
+    rng = random.Random(seed)
+    buf = io.BytesIO()
+    extras = "".join(
+        EXTRA_ITEM.format(i=i, href=f"supplementary/file-{i}.bin")
+        for i in range(extra_items)
+    )
+    with zipfile.ZipFile(buf, "w", compression=COMPRESSION[compression]) as zf:
+        _writestr(
+            zf,
+            "manifest.xml",
+            MANIFEST.format(source_dir=source_dir, extra_items=extras),
+        )
+        for i in range(extra_items):
+            _writestr(
+                zf,
+                f"supplementary/file-{i}.bin",
+                _member_data(rng, member_size, content),
+            )
+        for i in range(members):
+            parts = [f"dir-{rng.randrange(4)}" for _ in range(rng.randint(0, depth))]
+            name = "/".join(parts + [f"file-{i}.dat"])
+            _writestr(
+                zf, f"{source_dir}{name}", _member_data(rng, member_size, content)
+            )
+    return buf.getvalue()
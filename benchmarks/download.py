@@ -0,0 +1,59 @@
+"""
+Compare download strategies against a local HTTP stand-in.
+
+    python -m benchmarks.download --size-mb 512
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from requests import Session
+
+from meca4binder.download import download_zipfile
+from .server import LocalOrigin
+
+
+def legacy_fetch(session, url, dst_dir, chunk_size=128):
+    """The original iter_content based fetch_zipfile loop"""
+    resp = session.get(url, stream=True)
+    resp.raise_for_status()
+    with open(os.path.join(dst_dir, "meca.zip"), "wb") as dst:
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            dst.write(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument(
+        "--buffer-sizes", default="65536,1048576,4194304", help="comma separated"
+    )
+    parser.add_argument("--legacy", action="store_true", help="include chunk_size=128")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    payload = os.urandom(1024 * 1024) * args.size_mb
+    session = Session()
+    with LocalOrigin(
+        {"/meca.zip": payload}
+    ) as origin, tempfile.TemporaryDirectory() as tmpdir:
+        url = f"{origin.url}/meca.zip"
+        if args.legacy:
+            start = time.perf_counter()
+            legacy_fetch(session, url, tmpdir)
+            seconds = time.perf_counter() - start
+            print(f"iter_content(128)  {size / seconds / 1e6:8.1f} MB/s")
+        for buffer_size in (int(b) for b in args.buffer_sizes.split(",")):
+            for zero_copy in (False, True):
+                result = download_zipfile(
+                    session, url, tmpdir, buffer_size=buffer_size, zero_copy=zero_copy
+                )
+                print(
+                    f"{result.method:<9} {buffer_size:>9}  {result.mb_per_s:8.1f} MB/s"
+                )
+
+
+if __name__ == "__main__":
+    main()
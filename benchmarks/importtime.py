@@ -0,0 +1,117 @@
+"""
+Cold import cost of meca4binder on the BinderHub and repo2docker sides.
+
+    python -m benchmarks.importtime --repeat 5 --output importtime.json
+
+Each target runs in a fresh interpreter under `-X importtime`. Only modules
+not already loaded by an empty interpreter are counted, and a target fails
+if it loads a dependency that belongs to the other side. With --budget-ms
+the command also fails if a target's median import time exceeds the budget.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+TARGETS = {
+    "package": "import meca4binder",
+    "content": "from meca4binder import MecaContentProvider",
+    "repo": "from meca4binder import MecaRepoProvider",
+}
+
+# Dependencies each target must not load
+FORBIDDEN = {
+    "package": ("tornado", "validators", "requests", "traitlets", "xml.etree"),
+    "content": ("tornado", "validators", "traitlets"),
+    "repo": ("requests", "urllib3", "zipfile", "xml.etree"),
+}
+
+
+def parse_importtime(stderr):
+    """Return {module: self microseconds} from `-X importtime` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        if self_us.strip().isdigit():
+            modules[name.strip()] = int(self_us)
+    return modules
+
+
+def _importtime(statement, python=sys.executable):
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def measure(target, repeat=1, python=sys.executable):
+    """Import target `repeat` times, returning its record"""
+    baseline = set(_importtime("pass", python))
+    runs = []
+    for _ in range(repeat):
+        modules = {
+            name: us
+            for name, us in _importtime(TARGETS[target], python).items()
+            if name not in baseline
+        }
+        runs.append(modules)
+    modules = runs[-1]
+    forbidden = sorted(
+        name
+        for name in modules
+        if any(name == f or name.startswith(f"{f}.") for f in FORBIDDEN[target])
+    )
+    return {
+        "target": target,
+        "statement": TARGETS[target],
+        "median_ms": statistics.median(sum(r.values()) / 1e3 for r in runs),
+        "modules": len(modules),
+        "slowest": sorted(modules.items(), key=lambda m: m[1], reverse=True)[:10],
+        "forbidden": forbidden,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="fail above this median")
+    parser.add_argument("--output", help="write the records as JSON here")
+    parser.add_argument("targets", nargs="*", help=f"any of {', '.join(TARGETS)}")
+    args = parser.parse_args()
+    for target in args.targets:
+        if target not in TARGETS:
+            parser.error(f"unknown target {target}")
+
+    failed = False
+    records = []
+    for target in args.targets or TARGETS:
+        record = measure(target, args.repeat)
+        records.append(record)
+        print(
+            f"{target:<8} {record['median_ms']:8.1f} ms  "
+            f"{record['modules']:4d} modules  {record['statement']}"
+        )
+        for name, us in record["slowest"][:5]:
+            print(f"    {us / 1e3:8.1f} ms  {name}")
+        if record["forbidden"]:
+            print(f"    loads {', '.join(record['forbidden'])}")
+            failed = True
+        if args.budget_ms and record["median_ms"] > args.budget_ms:
+            print(f"    over the {args.budget_ms} ms budget")
+            failed = True
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(records, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
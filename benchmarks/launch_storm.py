@@ -0,0 +1,316 @@
+"""
+Launch storm against MecaRepoProvider, as BinderHub drives it.
+
+    python -m benchmarks.launch_storm --launches 5000 --concurrency 500 \\
+        --latency-ms 50 --error-rate 0.01 --output storm.json
+
+Every launch constructs a `MecaRepoProvider` and awaits `get_resolved_ref`,
+`get_resolved_spec` and `get_repo_url`, with up to --concurrency launches in
+flight on one event loop. The origin is a tornado stand-in running on its own
+thread and loop, with configurable latency, error rate and ETag behaviour, so
+it does not compete with the providers for the loop being measured.
+
+The report gives throughput, p50/p95/p99 resolution and launch latency, and
+the event loop lag seen by a task that wakes every 10 ms. With --budget-p99-ms
+the command fails if the p99 resolution latency exceeds the budget.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application, RequestHandler
+
+from meca4binder import MecaRepoProvider
+
+ETAG_MODES = ("stable", "changing", "weak", "none")
+
+# How often the lag monitor wakes up
+LAG_INTERVAL = 0.01
+
+
+class StormOrigin:
+    """A tornado origin for /bundles/<n>/meca.zip on its own thread and loop
+
+    Each request waits `latency` seconds, plus up to `jitter`, and fails with
+    a 503 with probability `error_rate`. `etag` is 'stable' (one strong ETag
+    per bundle), 'changing' (a new one on every request), 'weak' or 'none'.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        etag="stable",
+        size=10 * 1024 * 1024,
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.etag = etag
+        self.size = size
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._versions = 0
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def _headers(self, n):
+        headers = {
+            "Content-Type": "application/zip",
+            "Content-Length": str(self.size),
+            "Accept-Ranges": "bytes",
+        }
+        if self.etag == "stable":
+            headers["ETag"] = f'"bundle-{n}"'
+        elif self.etag == "weak":
+            headers["ETag"] = f'W/"bundle-{n}"'
+        elif self.etag == "changing":
+            self._versions += 1
+            headers["ETag"] = f'"bundle-{n}-{self._versions}"'
+        return headers
+
+    def _handler(self):
+        origin = self
+
+        class Handler(RequestHandler):
+            async def head(self, n):
+                origin.requests += 1
+                delay = origin.latency + origin.random.uniform(0, origin.jitter)
+                if delay:
+                    await asyncio.sleep(delay)
+                if origin.random.random() < origin.error_rate:
+                    origin.errors += 1
+                    self.set_status(503)
+                    return
+                for k, v in origin._headers(n).items():
+                    self.set_header(k, v)
+
+            async def get(self, n):
+                await self.head(n)
+                if self.get_status() == 200:
+                    self.write(bytes(origin.size))
+
+        return Handler
+
+    def _serve(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        sockets = bind_sockets(0, "127.0.0.1")
+        self.port = sockets[0].getsockname()[1]
+        app = Application(
+            [(r"/bundles/([0-9]+)/meca\.zip", self._handler())],
+            log_function=lambda handler: None,
+        )
+        server = HTTPServer(app)
+        server.add_sockets(sockets)
+        self._loop = loop
+        self._server = server
+        self._started.set()
+        loop.run_forever()
+        server.stop()
+        loop.run_until_complete(server.close_all_connections())
+        loop.close()
+
+    def __enter__(self):
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Nearest-rank percentiles of values, in milliseconds"""
+    if not values:
+        return {f"p{p}": None for p in points}
+    values = sorted(values)
+    return {
+        f"p{p}": values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))]
+        * 1e3
+        for p in points
+    }
+
+
+async def _monitor_lag(samples, stop, interval=LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def _launch(spec, config, record):
+    start = time.perf_counter()
+    try:
+        provider = MecaRepoProvider(spec=spec, **config)
+        await provider.get_resolved_ref()
+        record["resolve"] = time.perf_counter() - start
+        await provider.get_resolved_spec()
+        provider.get_repo_url()
+    except Exception as e:
+        record["error"] = type(e).__name__
+    record["launch"] = time.perf_counter() - start
+
+
+async def run_storm(url, launches, concurrency, distinct=1, config=None):
+    """Drive `launches` provider lifecycles against bundles under url
+
+    Launches cycle through `distinct` bundle URLs, with at most concurrency
+    in flight. `config` are MecaRepoProvider traits. Returns the report.
+    """
+    config = dict(config or {})
+    semaphore = asyncio.Semaphore(concurrency)
+    records = [{} for _ in range(launches)]
+    lag = []
+    stop = asyncio.Event()
+
+    async def bounded(i):
+        async with semaphore:
+            await _launch(f"{url}/bundles/{i % distinct}/meca.zip", config, records[i])
+
+    monitor = asyncio.ensure_future(_monitor_lag(lag, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(launches)))
+    seconds = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    ok = [r for r in records if "error" not in r]
+    errors = {}
+    for r in records:
+        if "error" in r:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "launches": launches,
+        "concurrency": concurrency,
+        "distinct": distinct,
+        "ok": len(ok),
+        "errors": errors,
+        "seconds": seconds,
+        "launches_per_second": launches / seconds if seconds else None,
+        "resolve_ms": percentiles([r["resolve"] for r in ok]),
+        "launch_ms": percentiles([r["launch"] for r in records]),
+        "loop_lag_ms": dict(
+            percentiles(lag), max=max(lag) * 1e3 if lag else None, samples=len(lag)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--launches", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument(
+        "--distinct", type=int, default=50, help="bundle URLs cycled through"
+    )
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--etag", choices=ETAG_MODES, default="stable")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max-clients",
+        type=int,
+        help="AsyncHTTPClient max_clients, as configured in BinderHub",
+    )
+    parser.add_argument(
+        "--resolve-cache-ttl", type=float, default=0, help="MecaRepoProvider trait"
+    )
+    parser.add_argument("--hash-scheme", default="url", help="MecaRepoProvider trait")
+    parser.add_argument(
+        "--http-retries", type=int, default=2, help="MecaRepoProvider trait"
+    )
+    parser.add_argument(
+        "--hedge-after-ms", type=float, default=0, help="http_hedge_after, in ms"
+    )
+    parser.add_argument(
+        "--hedge-percentile", type=float, default=0, help="MecaRepoProvider trait"
+    )
+    parser.add_argument("--budget-p99-ms", type=float, help="fail above this p99")
+    parser.add_argument("--output", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    if args.max_clients:
+        AsyncHTTPClient.configure(None, max_clients=args.max_clients)
+    config = {
+        "resolve_cache_ttl": args.resolve_cache_ttl,
+        "hash_scheme": args.hash_scheme,
+        "http_retries": args.http_retries,
+        "http_hedge_after": args.hedge_after_ms / 1e3,
+        "http_hedge_percentile": args.hedge_percentile,
+    }
+    with StormOrigin(
+        latency=args.latency_ms / 1e3,
+        jitter=args.jitter_ms / 1e3,
+        error_rate=args.error_rate,
+        etag=args.etag,
+        seed=args.seed,
+    ) as origin:
+        report = asyncio.run(
+            run_storm(
+                origin.url, args.launches, args.concurrency, args.distinct, config
+            )
+        )
+        report["origin_requests"] = origin.requests
+        report["origin_errors"] = origin.errors
+
+    print(
+        f"{report['ok']}/{report['launches']} ok in {report['seconds']:.1f}s "
+        f"({report['launches_per_second']:.0f} launches/s), "
+        f"{report['origin_requests']} origin requests",
+        file=sys.stderr,
+    )
+    for name in ("resolve_ms", "launch_ms", "loop_lag_ms"):
+        values = report[name]
+        print(
+            f"    {name:<12} "
+            + "  ".join(
+                f"{p} {values[p]:.1f}"
+                for p in ("p50", "p95", "p99")
+                if values[p] is not None
+            ),
+            file=sys.stderr,
+        )
+    if report["errors"]:
+        print(f"    errors {report['errors']}", file=sys.stderr)
+
+    report["meta"] = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    p99 = report["resolve_ms"]["p99"]
+    if args.budget_p99_ms and (p99 is None or p99 > args.budget_p99_ms):
+        print(f"    over the {args.budget_p99_ms} ms p99 budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
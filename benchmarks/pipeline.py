@@ -0,0 +1,219 @@
+"""
+Benchmark the MECA fetch/extract pipeline on synthetic bundles.
+
+Each phase (`detect`, `fetch_zipfile`, `extract_validate_and_identify_bundle`
+and the full provider `fetch`) runs in a forked child process against a local
+HTTP origin, so peak RSS and bytes written are attributable to that phase
+alone. Results are written as JSON for comparison between commits.
+
+    python -m benchmarks.pipeline --scenarios small-text,many-small --repeat 3 \\
+        --output results.json --env MECA_EXTRACT_WORKERS=4
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+
+from requests import Session
+
+from meca4binder.contentprovider import (
+    MecaContentProvider,
+    extract_validate_and_identify_bundle,
+    fetch_zipfile,
+)
+from .bundles import generate_bundle
+from .server import LocalOrigin
+
+SCENARIOS = {
+    "small-text": dict(members=50, member_size=16 * 1024),
+    "many-small": dict(members=2000, member_size=4 * 1024),
+    "large-stored": dict(
+        members=8, member_size=16 * 1024 * 1024, compression="stored", content="random"
+    ),
+    "large-deflated": dict(members=32, member_size=4 * 1024 * 1024),
+    "nested-manifest": dict(
+        members=200, member_size=64 * 1024, source_dir="article/source/v1/", depth=4
+    ),
+}
+
+PHASES = ("detect", "fetch_zipfile", "extract", "fetch")
+
+
+def _proc_io():
+    """Return the I/O counters of this process, or {} where unavailable"""
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+def _current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+def _run_phase(phase, url, zip_filename, workdir):
+    spec = url.replace("http", "http+meca", 1)
+    if phase == "detect":
+        MecaContentProvider().detect(spec)
+    elif phase == "fetch_zipfile":
+        fetch_zipfile(Session(), url, workdir)
+    elif phase == "extract":
+        extract_validate_and_identify_bundle(zip_filename, workdir)
+    elif phase == "fetch":
+        provider = MecaContentProvider()
+        output_dir = os.path.join(workdir, "output")
+        os.makedirs(output_dir)
+        for _ in provider.fetch(provider.detect(spec), output_dir):
+            pass
+
+
+def _child(conn, phase, url, zip_filename, env):
+    try:
+        os.environ.update(env)
+        with tempfile.TemporaryDirectory() as workdir:
+            baseline_rss = _current_rss()
+            io_before = _proc_io()
+            start = time.perf_counter()
+            _run_phase(phase, url, zip_filename, workdir)
+            seconds = time.perf_counter() - start
+            io_after = _proc_io()
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss = peak if sys.platform == "darwin" else peak * 1024
+        conn.send(
+            {
+                "seconds": seconds,
+                "baseline_rss_bytes": baseline_rss,
+                "peak_rss_bytes": peak_rss,
+                "disk_write_bytes": (
+                    io_after["write_bytes"] - io_before["write_bytes"]
+                    if io_before
+                    else None
+                ),
+                "write_syscall_bytes": (
+                    io_after["wchar"] - io_before["wchar"] if io_before else None
+                ),
+            }
+        )
+    except BaseException:
+        conn.send({"error": traceback.format_exc()})
+    finally:
+        conn.close()
+
+
+def measure(phase, url, zip_filename, env=None):
+    """Run one phase in a forked child and return its measurements"""
+    ctx = multiprocessing.get_context("fork")
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(
+        target=_child, args=(child, phase, url, zip_filename, env or {})
+    )
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    if "error" in result:
+        raise RuntimeError(f"{phase} failed:\n{result['error']}")
+    return result
+
+
+def run_scenario(name, params, phases=PHASES, repeat=3, env=None):
+    """Return one result record per phase of the scenario"""
+    data = generate_bundle(**params)
+    records = []
+    with LocalOrigin(
+        {"/meca.zip": data}
+    ) as origin, tempfile.TemporaryDirectory() as tmpdir:
+        zip_filename = os.path.join(tmpdir, "meca.zip")
+        with open(zip_filename, "wb") as f:
+            f.write(data)
+        url = f"{origin.url}/meca.zip"
+        for phase in phases:
+            runs = [measure(phase, url, zip_filename, env) for _ in range(repeat)]
+            seconds = statistics.median(r["seconds"] for r in runs)
+            records.append(
+                {
+                    "scenario": name,
+                    "params": params,
+                    "phase": phase,
+                    "bundle_bytes": len(data),
+                    "median_seconds": seconds,
+                    # detect transfers headers only
+                    "median_mb_per_s": (
+                        len(data) / seconds / 1e6
+                        if seconds and phase != "detect"
+                        else None
+                    ),
+                    "max_peak_rss_bytes": max(r["peak_rss_bytes"] for r in runs),
+                    "runs": runs,
+                }
+            )
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS), help="comma separated"
+    )
+    parser.add_argument("--phases", default=",".join(PHASES), help="comma separated")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="environment for the provider, e.g. MECA_SCRATCH=output",
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    env = dict(e.split("=", 1) for e in args.env)
+    results = []
+    for name in args.scenarios.split(","):
+        records = run_scenario(
+            name, SCENARIOS[name], args.phases.split(","), args.repeat, env
+        )
+        for r in records:
+            print(
+                f"{name:<16} {r['phase']:<14} {r['median_seconds'] * 1e3:9.1f} ms "
+                f"{r['median_mb_per_s'] or 0:8.1f} MB/s "
+                f"{r['max_peak_rss_bytes'] / 1e6:8.1f} MB peak RSS",
+                file=sys.stderr,
+            )
+        results.extend(records)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "env": env,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
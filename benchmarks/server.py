@@ -0,0 +1,66 @@
+"""
+Local HTTP stand-in origin for benchmarks.
+
+Serves in-memory payloads from a background thread so download and fetch
+benchmarks measure the client rather than the network.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalOrigin:
+    """Serve `files` (path -> bytes) on an ephemeral localhost port"""
+
+    def __init__(self, files=None, headers=None):
+        self.files = dict(files or {})
+        self.headers = dict(headers or {})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _start(self):
+                data = origin.files.get(self.path.split("?")[0])
+                if data is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return None
+                self.send_response(200)
+                self.send_header("Content-Type", "application/zip")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in origin.headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                return data
+
+            def do_HEAD(self):
+                self._start()
+
+            def do_GET(self):
+                data = self._start()
+                if data is not None:
+                    self.wfile.write(data)
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,87 @@
+"""
+Per-launch cost of the banned_specs, high_quota_specs and spec_config checks.
+
+    python -m benchmarks.spec_index --patterns 1000
+"""
+
+import argparse
+import re
+import time
+
+from traitlets.config import Config
+
+from meca4binder import MecaRepoProvider
+
+
+def legacy_checks(provider):
+    """The original per-launch loops over raw pattern strings"""
+    for banned in provider.banned_specs:
+        if re.match(banned, provider.spec, re.IGNORECASE):
+            break
+    for higher_quota in provider.high_quota_specs:
+        if re.match(higher_quota, provider.spec, re.IGNORECASE):
+            break
+    config = {}
+    for item in provider.spec_config:
+        if re.match(item["pattern"], provider.spec, re.IGNORECASE):
+            config.update(item["config"])
+    return config
+
+
+def indexed_checks(provider):
+    provider.is_banned()
+    provider.has_higher_quota()
+    return provider.repo_config({})
+
+
+def per_launch(checks, specs, config, launches):
+    """Mean microseconds per launch, with a new provider for each as BinderHub does"""
+    providers = [
+        MecaRepoProvider(spec=specs[i % len(specs)], config=config)
+        for i in range(launches)
+    ]
+    start = time.perf_counter()
+    for provider in providers:
+        checks(provider)
+    return (time.perf_counter() - start) / launches * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patterns", type=int, default=300)
+    parser.add_argument("--launches", type=int, default=100)
+    parser.add_argument(
+        "--distinct-specs", type=int, default=200, help="specs cycled through"
+    )
+    args = parser.parse_args()
+
+    journals = [f"journal-{i}" for i in range(args.patterns)]
+    config = {
+        "banned_specs": [f"^https://{j}\\.example\\.org/banned/" for j in journals],
+        "high_quota_specs": [
+            f"^https://{j}\\.example\\.org/featured/" for j in journals
+        ],
+        "spec_config": [
+            {"pattern": f"^https://{j}\\.example\\.org/", "config": {"quota": i}}
+            for i, j in enumerate(journals)
+        ],
+    }
+    specs = [
+        f"https://{journals[i * 7 % args.patterns]}.example.org/submissions/{i}/meca.zip"
+        for i in range(args.distinct_specs)
+    ]
+
+    config = Config({"MecaRepoProvider": config})
+
+    start = time.perf_counter()
+    MecaRepoProvider(spec=specs[0], config=config)
+    print(
+        f"first provider (compiles index)  {(time.perf_counter() - start) * 1e3:8.1f} ms"
+    )
+    for name, checks in (("legacy", legacy_checks), ("indexed", indexed_checks)):
+        micros = per_launch(checks, specs, config, args.launches)
+        print(f"{name:<8} {args.patterns} patterns   {micros:8.1f} us/launch")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,39 @@
-from .repoprovider import *
-from .contentprovider import *
+"""
+MECA bundle providers for BinderHub and repo2docker.
+
+The providers are imported on first access, so that repo2docker does not load
+tornado, traitlets and validators and BinderHub does not load requests, or the
+zip and XML parsers unless validate_bundle is set. `python -m
+benchmarks.importtime` measures the cost of each.
+"""
+
+import importlib
+
+_LAZY = {
+    "MecaRepoProvider": "repoprovider",
+    "MecaContentProvider": "contentprovider",
+    "extract_validate_and_identify_bundle": "contentprovider",
+    "identify_bundle": "contentprovider",
+    "fetch_zipfile": "contentprovider",
+    "stream_extract_zipfile": "contentprovider",
+    "handle_items": "contentprovider",
+    "ContentProvider": "basecontentprovider",
+    "ContentProviderException": "basecontentprovider",
+    "RepoProvider": "baseprovider",
+    "get_hashed_slug": "utils",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,253 @@
+"""
+Asynchronous download engine for MECA bundles.
+
+Bundles are fetched with tornado's `AsyncHTTPClient`, as `MecaRepoProvider`
+does, so one event loop can drive many downloads without a thread each. Body
+chunks are handed from the streaming callback to a writer task which writes
+and hashes them in an executor, so network reads overlap with disk writes.
+Once `max_buffer` bytes are waiting to be written, reading from the origin
+pauses until the writer catches up, so a slow disk does not leave the bundle
+piling up in memory. The chunk that fills the buffer is kept, so a write in
+flight and the chunks waiting behind it each hold at most `max_buffer` plus
+one read chunk (64 KB in tornado).
+
+Pausing relies on tornado's private `_HTTPConnection.data_received` and
+`SimpleAsyncHTTPClient._connection_class`; tests/test_asyncfetch.py fails if
+they change.
+"""
+
+import asyncio
+import os
+import time
+from os import path
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httputil import HTTPHeaders
+from tornado.simple_httpclient import SimpleAsyncHTTPClient, _HTTPConnection
+
+from .download import DownloadResult, _hash_algorithms, _verify, new_hashers
+
+# Seconds allowed for a whole bundle download
+DEFAULT_REQUEST_TIMEOUT = 3600
+
+# Bytes of body waiting to be written before reading from the origin pauses
+DEFAULT_MAX_BUFFER = 8 * 1024 * 1024
+
+
+class _FlowControlledConnection(_HTTPConnection):
+    def data_received(self, chunk):
+        if self._should_follow_redirect():
+            return None
+        # tornado waits for an awaitable returned here before reading on
+        return self.request.streaming_callback(chunk)
+
+
+class _FlowControlledClient(SimpleAsyncHTTPClient):
+    """The simple client, pausing reads while a streaming callback returns
+    an unfinished future"""
+
+    def _connection_class(self):
+        return _FlowControlledConnection
+
+
+class _AsyncWriter:
+    """Writes and hashes body chunks in an executor, in arrival order
+
+    Chunks that arrive while a write is in flight are batched into the next
+    one. Once `max_buffer` bytes are batched, `feed` returns a future that
+    is resolved when the next write starts, so a batch holds at most
+    `max_buffer` plus the chunk that filled it. Hashers are chosen once the
+    response headers are known, so that an MD5 advertised by the origin can
+    be checked.
+    """
+
+    def __init__(
+        self,
+        f,
+        hash_algorithms,
+        executor=None,
+        on_progress=None,
+        max_buffer=DEFAULT_MAX_BUFFER,
+    ):
+        self.f = f
+        self.hash_algorithms = hash_algorithms
+        self.executor = executor
+        self.on_progress = on_progress
+        self.headers = HTTPHeaders()
+        self.hashers = None
+        self.expected_md5 = None
+        self.nbytes = 0
+        self.max_buffer = max_buffer
+        self._pending = []
+        self._pending_bytes = 0
+        self._room = None
+        self._event = asyncio.Event()
+        self._closed = False
+        self._task = None
+
+    def header_line(self, line):
+        if line.startswith("HTTP/"):
+            # a new response, e.g. after a redirect
+            self.headers = HTTPHeaders()
+        elif line.strip():
+            self.headers.parse_line(line)
+
+    def choose_hashers(self):
+        if self.hashers is None:
+            algorithms, self.expected_md5 = _hash_algorithms(
+                self.hash_algorithms, self.headers
+            )
+            self.hashers = new_hashers(algorithms)
+
+    def feed(self, chunk):
+        if self._task is not None and self._task.done() and self._task.exception():
+            # aborts the request
+            raise self._task.exception()
+        self.choose_hashers()
+        self._pending.append(chunk)
+        self._pending_bytes += len(chunk)
+        self._event.set()
+        if self._pending_bytes < self.max_buffer:
+            return None
+        if self._room is None or self._room.done():
+            self._room = asyncio.get_running_loop().create_future()
+        return self._room
+
+    def _make_room(self):
+        if self._room is not None and not self._room.done():
+            self._room.set_result(None)
+
+    def _write(self, data):
+        self.f.write(data)
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    async def _run(self):
+        try:
+            await self._write_pending()
+        finally:
+            # never leave the request paused on a failed writer
+            self._make_room()
+
+    async def _write_pending(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            chunks, self._pending = self._pending, []
+            self._pending_bytes = 0
+            self._make_room()
+            if chunks:
+                data = b"".join(chunks)
+                await loop.run_in_executor(self.executor, self._write, data)
+                self.nbytes += len(data)
+                if self.on_progress is not None:
+                    self.on_progress(len(data))
+            if self._closed and not self._pending:
+                return
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        self._closed = True
+        self._event.set()
+        await self._task
+
+    def digests(self):
+        return {name: h.hexdigest() for name, h in self.hashers.items()}
+
+
+async def download_zipfile_async(
+    url,
+    dst_dir,
+    filename="meca.zip",
+    headers=None,
+    hash_algorithms=(),
+    on_progress=None,
+    client=None,
+    executor=None,
+    user_agent="repo2docker MECA",
+    request_timeout=DEFAULT_REQUEST_TIMEOUT,
+    max_buffer=DEFAULT_MAX_BUFFER,
+    connect_timeout=None,
+):
+    """Download the bundle at `url` into dst_dir, returning a `DownloadResult`
+
+    The async counterpart of `download_zipfile` for a single streaming GET:
+    conditional `headers`, `hash_algorithms`, `on_progress` and the check
+    against an advertised MD5 behave the same. Writes and hashing run in
+    `executor` (the loop's default if None). `client` defaults to a private
+    client without a body size limit, which stops reading from the origin
+    while more than `max_buffer` bytes wait to be written; a client passed
+    in buffers without limit.
+
+    Unlike `download_zipfile` with a `RequestPolicy`, the GET is not retried
+    and there is no timeout between body bytes: tornado only bounds the
+    whole request, by `request_timeout` seconds. `connect_timeout` defaults
+    to tornado's.
+    """
+    start = time.perf_counter()
+    dst_filename = path.join(dst_dir, filename)
+    own_client = client is None
+    if own_client:
+        client = _FlowControlledClient(force_instance=True, max_body_size=2**63 - 1)
+
+    request_headers = {"accept": "application/zip"}
+    request_headers.update(headers or {})
+    try:
+        with open(dst_filename, "wb") as f:
+            writer = _AsyncWriter(f, hash_algorithms, executor, on_progress, max_buffer)
+            writer.start()
+            req = HTTPRequest(
+                url,
+                method="GET",
+                headers=request_headers,
+                user_agent=user_agent,
+                header_callback=writer.header_line,
+                streaming_callback=writer.feed,
+                connect_timeout=connect_timeout,
+                request_timeout=request_timeout,
+            )
+            try:
+                resp = await client.fetch(req, raise_error=False)
+            finally:
+                await writer.close()
+    finally:
+        if own_client:
+            client.close()
+
+    if resp.code == 304:
+        os.remove(dst_filename)
+        return DownloadResult(
+            None, 0, time.perf_counter() - start, None, 304, resp.headers
+        )
+    if resp.error:
+        os.remove(dst_filename)
+        resp.rethrow()
+
+    # an empty body never reached the streaming callback
+    writer.choose_hashers()
+    digests = writer.digests()
+    _verify(url, dst_filename, digests, writer.expected_md5)
+    return DownloadResult(
+        dst_filename,
+        writer.nbytes,
+        time.perf_counter() - start,
+        "async",
+        resp.code,
+        resp.headers,
+        digests,
+    )
+
+
+async def head_async(url, client=None, user_agent="repo2docker MECA", policy=None):
+    """Return the response headers of a HEAD request for url, made with the
+    timeouts, retries and hedging of `policy` if given"""
+    client = client or AsyncHTTPClient()
+    if policy is not None:
+        resp = await policy.head_async(client, url, user_agent=user_agent)
+        return resp.headers
+    req = HTTPRequest(url, method="HEAD", user_agent=user_agent)
+    resp = await client.fetch(req)
+    return resp.headers
@@ -1,7 +1,11 @@
 import re
-import logging
 from traitlets.config import LoggingConfigurable
-from traitlets import Unicode, List
+from traitlets import Dict, TraitError, Unicode, List, observe, validate
+# the repo2docker base classes used to live here too
+from .basecontentprovider import ContentProvider, ContentProviderException
+from .specindex import spec_config_index, spec_pattern_list_index
+
+__all__ = ["RepoProvider", "ContentProvider", "ContentProviderException"]
 
 SHA1_PATTERN = re.compile(r"[0-9a-f]{40}")
 
@@ -69,27 +73,83 @@ class RepoProvider(LoggingConfigurable):
         config=True,
     )
 
+    # Patterns are compiled once into shared indexes when the config is loaded,
+    # so malformed entries are rejected up front rather than on a launch.
+    # Each provider keeps its indexes until the trait is assigned again.
+    _spec_indexes = Dict()
+
+    # traitlets sets a deep copy of each configured value, so the indexes are
+    # looked up by the configured lists themselves, the same for every launch
+    _spec_sources = Dict()
+    _loading_config = False
+
+    def _load_config(self, cfg, section_names=None, traits=None):
+        my_config = self._find_my_config(cfg)
+        self._spec_sources = {
+            name: my_config[name]
+            for name in ("banned_specs", "high_quota_specs", "spec_config")
+            if name in my_config and isinstance(my_config[name], list)
+        }
+        self._loading_config = True
+        try:
+            super()._load_config(cfg, section_names=section_names, traits=traits)
+        finally:
+            self._loading_config = False
+
+    def _spec_value(self, name, value):
+        if self._loading_config and name in self._spec_sources:
+            return self._spec_sources[name]
+        return value
+
+    def _spec_index(self, name):
+        index = self._spec_indexes.get(name)
+        if index is None:
+            value = self._spec_sources.get(name, getattr(self, name))
+            if name == "spec_config":
+                index = spec_config_index(value)
+            else:
+                index = spec_pattern_list_index(value)
+            self._spec_indexes[name] = index
+        return index
+
+    @observe("banned_specs", "high_quota_specs", "spec_config")
+    def _spec_patterns_changed(self, change):
+        self._spec_indexes.pop(change.name, None)
+        if not self._loading_config:
+            # no longer the configured list
+            self._spec_sources.pop(change.name, None)
+
+    @validate("banned_specs", "high_quota_specs")
+    def _validate_spec_patterns(self, proposal):
+        try:
+            spec_pattern_list_index(
+                self._spec_value(proposal.trait.name, proposal.value)
+            )
+        except (TypeError, ValueError) as e:
+            raise TraitError(f"{proposal.trait.name}: {e}") from e
+        return proposal.value
+
+    @validate("spec_config")
+    def _validate_spec_config(self, proposal):
+        try:
+            spec_config_index(self._spec_value("spec_config", proposal.value))
+        except ValueError as e:
+            raise TraitError(f"spec_config: {e}") from e
+        return proposal.value
+
     def is_banned(self):
         """
         Return true if the given spec has been banned
         """
-        for banned in self.banned_specs:
-            # Ignore case, because most git providers do not
-            # count DS-100/textbook as different from ds-100/textbook
-            if re.match(banned, self.spec, re.IGNORECASE):
-                return True
-        return False
+        # Ignore case, because most git providers do not
+        # count DS-100/textbook as different from ds-100/textbook
+        return self._spec_index("banned_specs").matches(self.spec)
 
     def has_higher_quota(self):
         """
         Return true if the given spec has a higher quota
         """
-        for higher_quota in self.high_quota_specs:
-            # Ignore case, because most git providers do not
-            # count DS-100/textbook as different from ds-100/textbook
-            if re.match(higher_quota, self.spec, re.IGNORECASE):
-                return True
-        return False
+        return self._spec_index("high_quota_specs").matches(self.spec)
 
     def repo_config(self, settings):
         """
@@ -104,25 +164,7 @@ class RepoProvider(LoggingConfigurable):
             repo_config["quota"] = settings.get("per_repo_quota")
 
         # Spec regex-based configuration
-        for item in self.spec_config:
-            pattern = item.get("pattern", None)
-            config = item.get("config", None)
-            if not isinstance(pattern, str):
-                raise ValueError(
-                    "Spec-pattern configuration expected "
-                    "a regex pattern string, not "
-                    f"type {type(pattern)}"
-                )
-            if not isinstance(config, dict):
-                raise ValueError(
-                    "Spec-pattern configuration expected "
-                    "a specification configuration dict, not "
-                    f"type {type(config)}"
-                )
-            # Ignore case, because most git providers do not
-            # count DS-100/textbook as different from ds-100/textbook
-            if re.match(pattern, self.spec, re.IGNORECASE):
-                repo_config.update(config)
+        repo_config.update(self._spec_index("spec_config").config(self.spec))
         return repo_config
 
     async def get_resolved_ref(self):
@@ -147,67 +189,3 @@ class RepoProvider(LoggingConfigurable):
     @staticmethod
     def is_valid_sha1(sha1):
         return bool(SHA1_PATTERN.match(sha1))
-    
-
-
-"""
-Base classes for repo2docker ContentProviders copied in from https://github.com/jupyterhub/repo2docker/blob/main/repo2docker/contentproviders/base.py
-until we get a better integration point
-
-ContentProviders accept a `spec` of various kinds, and
-provide the contents from the spec to a given output directory.
-"""
-
-class ContentProviderException(Exception):
-    """Exception raised when a ContentProvider can not provide content."""
-
-    pass
-
-
-class ContentProvider:
-    def __init__(self):
-        self.log = logging.getLogger("repo2docker")
-
-    @property
-    def content_id(self):
-        """A unique ID to represent the version of the content.
-        This ID is used to name the built images. If the ID is the same between
-        two runs of repo2docker we will reuse an existing image (if it exists).
-        By providing an ID that summarizes the content we can reuse existing
-        images and speed up build times. A good ID is the revision of a Git
-        repository or a hash computed from all the content.
-        The type content ID can be any string.
-        To disable this behaviour set this property to `None` in which case
-        a fresh image will always be built.
-        """
-        return None
-
-    def detect(self, repo, ref=None, extra_args=None):
-        """Determine compatibility between source and this provider.
-
-        If the provider knows how to fetch this source it will return a
-        `spec` that can be passed to `fetch`. The arguments are the `repo`
-        string passed on the command-line, the value of the --ref parameter,
-        if provided and any provider specific arguments provided on the
-        command-line.
-
-        If the provider does not know how to fetch this source it will return
-        `None`.
-        """
-        raise NotImplementedError()
-
-    def fetch(self, spec, output_dir, yield_output=False):
-        """Provide the contents of given spec to output_dir
-
-        This generator yields logging information if `yield_output=True`,
-        otherwise log output is printed to stdout.
-
-        Arguments:
-            spec -- Dict specification understood by this ContentProvider
-            output_dir {string} -- Path to output directory (must already exist)
-            yield_output {bool} -- If True, return output line by line. If not,
-                                   output just goes to stdout.
-        """
-        raise NotImplementedError()
-
-
@@ -0,0 +1,217 @@
+"""
+Resource budgets and admission control for bundle fetches.
+
+A `FetchBudget` bounds the bytes downloaded, the bytes and members extracted
+and the compression ratio of each member, so that one oversized or malicious
+bundle cannot fill a build node's disk. Sizes declared by the origin or in
+the zip central directory are checked up front, and the same limits are
+enforced on the bytes actually read and written. `FetchSlots` limits how many
+fetches run at once across the processes on a node.
+"""
+
+import fcntl
+import os
+import shutil
+import time
+from os import path
+
+from .basecontentprovider import ContentProviderException
+from .utils import env_int
+
+# Members smaller than this are not held to the compression ratio limit
+RATIO_GRACE_BYTES = 1024 * 1024
+
+# Seconds a fetch waits for a slot before giving up
+DEFAULT_QUEUE_TIMEOUT = 600
+
+# Seconds between attempts to take a slot while queued
+SLOT_POLL_SECONDS = 0.5
+
+
+class BudgetExceeded(ContentProviderException):
+    """Raised when a bundle exceeds a resource budget or cannot be admitted."""
+
+    pass
+
+
+def _too_compressed(usize, csize, ratio):
+    return ratio and usize > RATIO_GRACE_BYTES and usize > ratio * max(csize, 1)
+
+
+class FetchBudget:
+    """Limits on one bundle fetch, each disabled when 0
+
+    `min_free_bytes` is the space to leave free on the filesystems bundles
+    are downloaded and extracted to.
+    """
+
+    def __init__(
+        self,
+        max_download_bytes=0,
+        max_uncompressed_bytes=0,
+        max_members=0,
+        max_compression_ratio=0,
+        min_free_bytes=0,
+    ):
+        self.max_download_bytes = max_download_bytes
+        self.max_uncompressed_bytes = max_uncompressed_bytes
+        self.max_members = max_members
+        self.max_compression_ratio = max_compression_ratio
+        self.min_free_bytes = min_free_bytes
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_download_bytes=env_int("MECA_MAX_DOWNLOAD_BYTES", 0),
+            max_uncompressed_bytes=env_int("MECA_MAX_UNCOMPRESSED_BYTES", 0),
+            max_members=env_int("MECA_MAX_MEMBERS", 0),
+            max_compression_ratio=float(
+                os.environ.get("MECA_MAX_COMPRESSION_RATIO", 0)
+            ),
+            min_free_bytes=env_int("MECA_MIN_FREE_BYTES", 0),
+        )
+
+    def check_download_size(self, nbytes, url):
+        """Reject a bundle from the size the origin advertises for it"""
+        if self.max_download_bytes and nbytes and nbytes > self.max_download_bytes:
+            raise BudgetExceeded(
+                f"MECA bundle {url} is {nbytes} bytes, over the "
+                f"{self.max_download_bytes} byte download limit"
+            )
+
+    def download_meter(self, url, on_progress=None):
+        """Return an on_progress callback that raises `BudgetExceeded` once
+        more than max_download_bytes have been read, calling on_progress too"""
+        received = [0]
+
+        def meter(n):
+            if on_progress is not None:
+                on_progress(n)
+            received[0] += n
+            if self.max_download_bytes and received[0] > self.max_download_bytes:
+                raise BudgetExceeded(
+                    f"MECA bundle {url} is over the {self.max_download_bytes} "
+                    "byte download limit"
+                )
+
+        return meter
+
+    def check_members(self, members):
+        """Check the sizes ZipInfo `members` declare before extracting them"""
+        members = [m for m in members if not m.is_dir()]
+        if self.max_members and len(members) > self.max_members:
+            raise BudgetExceeded(
+                f"MECA bundle has {len(members)} members, over the "
+                f"limit of {self.max_members}"
+            )
+        total = sum(m.file_size for m in members)
+        if self.max_uncompressed_bytes and total > self.max_uncompressed_bytes:
+            raise BudgetExceeded(
+                f"MECA bundle expands to {total} bytes, over the "
+                f"{self.max_uncompressed_bytes} byte limit"
+            )
+        for m in members:
+            if _too_compressed(
+                m.file_size, m.compress_size, self.max_compression_ratio
+            ):
+                raise BudgetExceeded(
+                    f"{m.filename} in MECA bundle is compressed more than "
+                    f"{self.max_compression_ratio}:1"
+                )
+        return total
+
+    def extraction_meter(self):
+        return ExtractionMeter(self)
+
+    def check_free_space(self, directory, needed):
+        """Check directory's filesystem can take needed bytes and keep
+        min_free_bytes free"""
+        free = shutil.disk_usage(directory).free
+        if free - needed < self.min_free_bytes:
+            raise BudgetExceeded(
+                f"Not enough free space in {directory} for the MECA bundle: "
+                f"{needed} bytes needed, {free} free, "
+                f"{self.min_free_bytes} to be kept free"
+            )
+
+
+class ExtractionMeter:
+    """Enforces a `FetchBudget` on members as they are extracted from a stream,
+    where sizes are not known up front"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.members = 0
+        self.total = 0
+        self._name = None
+        self._written = 0
+
+    def member(self, name):
+        self._name = name
+        self._written = 0
+        if not name.endswith("/"):
+            self.members += 1
+        if self.budget.max_members and self.members > self.budget.max_members:
+            raise BudgetExceeded(
+                f"MECA bundle has more than {self.budget.max_members} members"
+            )
+
+    def output(self, nbytes, consumed):
+        """Account nbytes written for the current member, inflated from
+        consumed compressed bytes so far"""
+        self._written += nbytes
+        self.total += nbytes
+        limit = self.budget.max_uncompressed_bytes
+        if limit and self.total > limit:
+            raise BudgetExceeded(f"MECA bundle expands to more than {limit} bytes")
+        ratio = self.budget.max_compression_ratio
+        if _too_compressed(self._written, consumed, ratio):
+            raise BudgetExceeded(
+                f"{self._name} in MECA bundle is compressed more than {ratio}:1"
+            )
+
+
+class FetchSlots:
+    """At most `limit` concurrent fetches among the processes sharing directory
+
+    Each slot is an flock on a file in directory, so a slot is released when
+    the process holding it exits, however it exits.
+    """
+
+    def __init__(self, directory, limit):
+        self.directory = directory
+        self.limit = limit
+        os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        """Return a held slot, or None if all are in use"""
+        for i in range(self.limit):
+            slot = open(path.join(self.directory, f"fetch-slot-{i}.lock"), "w")
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot.close()
+                continue
+            return slot
+        return None
+
+    def acquire(self, timeout, poll=SLOT_POLL_SECONDS):
+        """Wait up to timeout seconds for a slot, raising `BudgetExceeded`"""
+        deadline = time.monotonic() + timeout
+        while True:
+            slot = self.try_acquire()
+            if slot is not None:
+                return slot
+            if time.monotonic() >= deadline:
+                raise self.timed_out(timeout)
+            time.sleep(poll)
+
+    def timed_out(self, timeout):
+        return BudgetExceeded(
+            f"Timed out after {timeout:.0f}s waiting for one of the {self.limit} "
+            "MECA fetch slots on this node"
+        )
+
+    def release(self, slot):
+        fcntl.flock(slot, fcntl.LOCK_UN)
+        slot.close()
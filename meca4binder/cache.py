@@ -0,0 +1,303 @@
+"""
+Node-local cache of downloaded MECA bundles.
+
+Compressed bundles are kept on disk keyed by their normalised URL (query
+string stripped, as for `get_hashed_slug`) together with the validators the
+origin sent. A cached bundle is revalidated with If-None-Match /
+If-Modified-Since, so a 304 skips the transfer entirely. The cache is capped
+in size and evicts least recently used bundles. Hit, miss, eviction and
+incremental fetch counts are kept in `stats.json` and rendered to `metrics.prom` in the Prometheus
+text format, for scraping by node-exporter's textfile collector.
+
+Callers hold `pin` on a URL while they use the path `fetch` returned, and
+eviction skips pinned bundles.
+"""
+
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from hashlib import md5
+from os import path
+
+from .budget import BudgetExceeded
+from .download import IncompleteDownload, download_zipfile, file_digests
+from .utils import strip_url
+
+DEFAULT_MAX_BYTES = 10 * 1024**3
+
+COUNTERS = ("hits", "misses", "evictions", "deltas")
+
+
+class BundleCache:
+    """An on-disk LRU cache of MECA bundles shared by processes on one node"""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, url):
+        return md5(strip_url(url).encode()).hexdigest()
+
+    def zip_path(self, key):
+        return path.join(self.root, f"{key}.zip")
+
+    def meta_path(self, key):
+        return path.join(self.root, f"{key}.json")
+
+    @contextmanager
+    def _locked(self, name=".lock"):
+        with open(path.join(self.root, name), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def pin_path(self, key):
+        return path.join(self.root, f"{key}.pin")
+
+    @contextmanager
+    def pin(self, url):
+        """Keep the bundle for url from being evicted while in the block"""
+        with open(self.pin_path(self.key(url)), "w") as pin:
+            fcntl.flock(pin, fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(pin, fcntl.LOCK_UN)
+
+    def _remove(self, key):
+        for filename in (self.zip_path(key), self.meta_path(key)):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def _read_meta(self, key):
+        try:
+            with open(self.meta_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, filename, data):
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, filename)
+
+    def lookup(self, url):
+        """Return the cache metadata for `url` if its bundle is present"""
+        key = self.key(url)
+        meta = self._read_meta(key)
+        if meta is None or not path.exists(self.zip_path(key)):
+            return None
+        return meta
+
+    def fetch(self, session, url, **download_options):
+        """Return (zip_filename, hit) for `url`, downloading only if the cached
+        copy is missing or the origin reports it has changed.
+
+        `download_options` are passed on to `download_zipfile`. Processes
+        fetching the same URL are serialised, so the later ones revalidate
+        the bundle the first one stored. The partial download is kept at a
+        stable name so an interrupted ranged download can resume.
+        """
+        key = self.key(url)
+        with self._locked(f"{key}.lock"):
+            return self._fetch(session, url, key, download_options)
+
+    def _fetch(self, session, url, key, download_options):
+        meta = self.lookup(url)
+        headers = {}
+        # a bundle rebuilt after a delta has the origin's members, not its bytes
+        if meta is not None and not (
+            meta.get("rebuilt") and download_options.get("hash_algorithms")
+        ):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        part = f"{key}.part"
+        try:
+            result = download_zipfile(
+                session,
+                url,
+                self.root,
+                filename=part,
+                headers=headers,
+                **download_options,
+            )
+        except BudgetExceeded:
+            # an over budget bundle is not worth resuming
+            for filename in (part, f"{part}.ranges"):
+                try:
+                    os.remove(path.join(self.root, filename))
+                except FileNotFoundError:
+                    pass
+            raise
+
+        if result.not_modified:
+            if not path.exists(self.zip_path(key)):
+                # evicted by another process since the lookup
+                return self._fetch(session, url, key, download_options)
+            meta["last_used"] = time.time()
+            self._write_json(self.meta_path(key), meta)
+            self._count("hits")
+            return self.zip_path(key), True
+
+        length = result.headers.get("Content-Length")
+        encoding = result.headers.get("Content-Encoding", "identity").lower()
+        if length and encoding in ("", "identity") and int(length) != result.bytes:
+            # never store a truncated bundle under the origin's validators
+            for filename in (result.filename, f"{result.filename}.ranges"):
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+            self._remove(key)
+            raise IncompleteDownload(
+                f"Downloaded {result.bytes} of {length} bytes of MECA bundle {url}"
+            )
+
+        os.replace(result.filename, self.zip_path(key))
+        self._write_json(
+            self.meta_path(key),
+            {
+                "url": strip_url(url),
+                "etag": result.headers.get("ETag"),
+                "last_modified": result.headers.get("Last-Modified"),
+                "size": result.bytes,
+                "digests": result.digests,
+                "last_used": time.time(),
+            },
+        )
+        self._count("misses")
+        self.evict(keep=key)
+        return self.zip_path(key), False
+
+    def delta_path(self, url):
+        """Where to rebuild the new version of the bundle for url in a delta"""
+        return path.join(self.root, f"{self.key(url)}.delta.{os.getpid()}.tmp")
+
+    def record_delta(self, url, zip_filename=None, validators=None):
+        """Count an incremental fetch of a newer version of the bundle for url
+
+        zip_filename, the new version rebuilt from the members of the cached
+        one and the changed ones, replaces the cached bundle under
+        `validators`, the new ETag and Last-Modified, so later fetches
+        revalidate against it. Without one the cached bundle is left as it is.
+        """
+        key = self.key(url)
+        with self._locked(f"{key}.lock"):
+            if zip_filename is not None:
+                validators = validators or {}
+                os.replace(zip_filename, self.zip_path(key))
+                self._write_json(
+                    self.meta_path(key),
+                    {
+                        "url": strip_url(url),
+                        "etag": validators.get("etag"),
+                        "last_modified": validators.get("last_modified"),
+                        "size": path.getsize(self.zip_path(key)),
+                        # not the origin's bytes, so not the origin's digests
+                        "digests": {},
+                        "rebuilt": True,
+                        "last_used": time.time(),
+                    },
+                )
+            else:
+                meta = self.lookup(url)
+                if meta is not None:
+                    meta["last_used"] = time.time()
+                    self._write_json(self.meta_path(key), meta)
+        self._count("deltas")
+        if zip_filename is not None:
+            self.evict(keep=key)
+
+    def digests(self, url, algorithms):
+        """Return {name: hex digest} of the cached bundle for `url`
+
+        Digests recorded when the bundle was downloaded are reused, any others
+        are computed from the cached file and recorded for next time.
+        """
+        key = self.key(url)
+        with self._locked(f"{key}.lock"):
+            meta = self.lookup(url)
+            if meta is None:
+                return {}
+            digests = meta.setdefault("digests", {})
+            missing = [a for a in algorithms if a not in digests]
+            if missing:
+                digests.update(file_digests(self.zip_path(key), missing))
+                self._write_json(self.meta_path(key), meta)
+            return {a: digests[a] for a in algorithms}
+
+    def entries(self):
+        """Return (key, meta) for every cached bundle, least recently used first"""
+        entries = []
+        for f in os.listdir(self.root):
+            if not f.endswith(".json") or f == "stats.json":
+                continue
+            key = f[: -len(".json")]
+            meta = self._read_meta(key)
+            if meta is not None:
+                entries.append((key, meta))
+        return sorted(entries, key=lambda e: e[1].get("last_used", 0))
+
+    def evict(self, keep=None):
+        """Remove least recently used bundles until the cache fits max_bytes
+
+        Pinned bundles are kept.
+        """
+        with self._locked():
+            entries = self.entries()
+            total = sum(meta.get("size", 0) for _, meta in entries)
+            evicted = 0
+            for key, meta in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                with open(self.pin_path(key), "w") as pin:
+                    try:
+                        fcntl.flock(pin, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    self._remove(key)
+                    fcntl.flock(pin, fcntl.LOCK_UN)
+                total -= meta.get("size", 0)
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+        return evicted
+
+    def stats(self):
+        try:
+            with open(path.join(self.root, "stats.json")) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        return {name: stats.get(name, 0) for name in COUNTERS}
+
+    def _count(self, name, n=1):
+        with self._locked():
+            stats = self.stats()
+            stats[name] += n
+            self._write_json(path.join(self.root, "stats.json"), stats)
+            size = sum(meta.get("size", 0) for _, meta in self.entries())
+            lines = []
+            for counter in COUNTERS:
+                metric = f"meca_bundle_cache_{counter}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {stats[counter]}")
+            lines.append("# TYPE meca_bundle_cache_bytes gauge")
+            lines.append(f"meca_bundle_cache_bytes {size}")
+            prom = path.join(self.root, "metrics.prom")
+            with open(f"{prom}.{os.getpid()}.tmp", "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(f"{prom}.{os.getpid()}.tmp", prom)
@@ -0,0 +1,244 @@
+"""
+Batch resolve and prebuild of MECA bundles, e.g. for a journal issue.
+
+    meca4binder urls.txt --output-dir /srv/bundles --concurrency 16 \\
+        --allowed-origin journals.curvenote.com --manifest manifest.json
+
+Bundles are resolved with `MecaRepoProvider`, so allowed origins and slugs
+match what BinderHub would compute, then fetched with `MecaContentProvider`
+into `<output-dir>/<slug>` or only into its cache. A JSON manifest maps each
+slug to its URL and timings.
+
+With `--hash-scheme content` and a fetch, bundles are resolved with the URL
+scheme and the content slug is taken from the MD5 computed while fetching, so
+each bundle is downloaded once rather than once to hash it and again to fetch
+it.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from os import path
+
+from .cache import BundleCache
+from .contentprovider import MecaContentProvider
+from .repoprovider import MecaRepoProvider
+from .utils import HASH_SCHEMES, get_content_slug
+
+log = logging.getLogger("meca4binder")
+
+
+async def _fetch(record, repo_provider, hash_scheme, output_dir, cache_dir):
+    content_provider = MecaContentProvider()
+    content_provider.hash_scheme = hash_scheme
+    if cache_dir:
+        content_provider.cache = BundleCache(cache_dir)
+    spec = await content_provider.detect_async(repo_provider.get_repo_url())
+
+    start = time.perf_counter()
+    if output_dir:
+        target = path.join(output_dir, record["slug"])
+        os.makedirs(target, exist_ok=True)
+        async for line in content_provider.fetch_async(spec, target):
+            log.debug(line.rstrip())
+        if hash_scheme == "content":
+            target = _move_to_content_slug(record, target, content_provider.content_id)
+        record["output_dir"] = target
+    else:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            lambda: content_provider.cache.fetch(
+                content_provider.session,
+                spec["url"],
+                **content_provider._download_options(),
+            ),
+        )
+        if hash_scheme == "content":
+            digests = await loop.run_in_executor(
+                None, content_provider.cache.digests, spec["url"], ["md5"]
+            )
+            record["slug"] = get_content_slug(digests["md5"])
+    record["fetch_seconds"] = time.perf_counter() - start
+    record["metrics"] = content_provider.metrics.as_dict()
+
+
+def _move_to_content_slug(record, target, slug):
+    """Move a bundle fetched into its URL slug directory to its content slug"""
+    record["slug"] = slug
+    content_target = path.join(path.dirname(target), slug)
+    if content_target == target:
+        return target
+    if path.exists(content_target):
+        # another URL in the batch had the same bytes
+        shutil.rmtree(target)
+        record["duplicate"] = True
+    else:
+        os.rename(target, content_target)
+    return content_target
+
+
+async def _prebuild_one(
+    url, semaphore, fetched, allowed_origins, hash_scheme, output_dir, cache_dir
+):
+    record = {"url": url, "slug": None, "status": "ok"}
+    async with semaphore:
+        try:
+            fetch = bool(output_dir or cache_dir)
+            # the fetch hashes the bundle itself, resolving need not download it
+            resolve_scheme = (
+                "url" if fetch and hash_scheme == "content" else hash_scheme
+            )
+            repo_provider = MecaRepoProvider(
+                spec=url,
+                allowed_origins=list(allowed_origins),
+                hash_scheme=resolve_scheme,
+            )
+            start = time.perf_counter()
+            record["slug"] = await repo_provider.get_resolved_ref()
+            record["resolve_seconds"] = time.perf_counter() - start
+
+            if fetch:
+                if record["slug"] in fetched:
+                    # another URL in the batch resolved to the same bundle
+                    await fetched[record["slug"]]
+                    record["duplicate"] = True
+                else:
+                    fetched[record["slug"]] = asyncio.ensure_future(
+                        _fetch(
+                            record, repo_provider, hash_scheme, output_dir, cache_dir
+                        )
+                    )
+                    await fetched[record["slug"]]
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+    log.info(f"{record['status']:<5} {record['slug']} {url}")
+    return record
+
+
+async def prebuild(
+    urls,
+    concurrency=8,
+    allowed_origins=(),
+    hash_scheme="url",
+    output_dir=None,
+    cache_dir=None,
+):
+    """Resolve, and with output_dir or cache_dir fetch, every bundle in urls
+
+    At most `concurrency` bundles are processed at once. Returns the manifest,
+    with one record per URL in the order given and a summary.
+    """
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    fetched = {}
+    records = await asyncio.gather(
+        *(
+            _prebuild_one(
+                url,
+                semaphore,
+                fetched,
+                allowed_origins,
+                hash_scheme,
+                output_dir,
+                cache_dir,
+            )
+            for url in urls
+        )
+    )
+    seconds = time.perf_counter() - start
+    ok = sum(1 for r in records if r["status"] == "ok")
+    return {
+        "bundles": records,
+        "summary": {
+            "count": len(records),
+            "ok": ok,
+            "failed": len(records) - ok,
+            "seconds": seconds,
+            "bundles_per_second": len(records) / seconds if seconds else None,
+        },
+    }
+
+
+def _read_urls(sources):
+    urls = []
+    for source in sources:
+        if source == "-" or path.exists(source):
+            f = sys.stdin if source == "-" else open(source)
+            with f:
+                urls.extend(
+                    line.strip()
+                    for line in f
+                    if line.strip() and not line.startswith("#")
+                )
+        else:
+            urls.append(source)
+    return urls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="meca4binder",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "sources",
+        nargs="+",
+        help="bundle URLs, or files listing one URL per line ('-' for stdin)",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--allowed-origin",
+        action="append",
+        default=[],
+        dest="allowed_origins",
+        help="hostname bundles may be fetched from, may be repeated",
+    )
+    parser.add_argument(
+        "--hash-scheme",
+        choices=HASH_SCHEMES,
+        default=os.environ.get("MECA_HASH_SCHEME", "url"),
+    )
+    parser.add_argument("--output-dir", help="extract bundles into OUTPUT_DIR/<slug>")
+    parser.add_argument(
+        "--cache-dir", help="fetch bundles into this MECA_CACHE_DIR style cache"
+    )
+    parser.add_argument(
+        "--manifest", help="write the JSON manifest here (default stdout)"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(message)s",
+        stream=sys.stderr,
+    )
+    manifest = asyncio.run(
+        prebuild(
+            _read_urls(args.sources),
+            concurrency=args.concurrency,
+            allowed_origins=args.allowed_origins,
+            hash_scheme=args.hash_scheme,
+            output_dir=args.output_dir,
+            cache_dir=args.cache_dir,
+        )
+    )
+
+    if args.manifest:
+        with open(args.manifest, "w") as f:
+            json.dump(manifest, f, indent=2)
+    else:
+        json.dump(manifest, sys.stdout, indent=2)
+    summary = manifest["summary"]
+    log.info(
+        f"{summary['ok']} of {summary['count']} bundles in {summary['seconds']:.1f}s"
+    )
+    return 1 if summary["failed"] else 0
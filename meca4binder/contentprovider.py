@@ -1,61 +1,258 @@
+import asyncio
 import re
-from .baseprovider import ContentProvider
-from requests import HTTPError, Session
+from functools import partial
+from .basecontentprovider import ContentProvider, ContentProviderException
+from requests import HTTPError
 import os
 from os import path
 import tempfile
 import shutil
-import xml.etree.ElementTree as ET
+import time
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from zipfile import ZipFile, is_zipfile
-from .utils import get_hashed_slug
+from .budget import (
+    DEFAULT_QUEUE_TIMEOUT,
+    SLOT_POLL_SECONDS,
+    FetchBudget,
+    FetchSlots,
+)
+from .cache import DEFAULT_MAX_BYTES, BundleCache
+from .delta import DeltaUnsupported, delta_extract
+from .download import (
+    DEFAULT_BUFFER_SIZE,
+    HashingReader,
+    IntegrityError,
+    download_zipfile,
+    file_digests,
+    new_hashers,
+)
+from .extract import extract_members, member_target, relocate_members
+from .httppolicy import LatencyWindow, RequestPolicy, shared_session
+from .localstore import LocalMounts, mapped_digests, mapped_zipfile, stat_headers
+from .manifest import (
+    MANIFEST_NAME,
+    ManifestError,
+    MecaManifest,
+    manifest_cache,
+    source_dir_prefix,
+)
+from .metrics import FetchMetrics, ProgressCounter, load_hook
+from .prefetch import PrefetchStore
+from .staging import DEFAULT_TTL, StagingArea, copy_tree
+from .streamzip import StreamingUnsupported, stream_extract
+from .utils import (
+    advertised_content_md5,
+    env_flag,
+    env_int,
+    get_content_slug,
+    get_slug,
+)
 from urllib.parse import urlparse, urlunparse, unquote
 
+# HEAD latencies of all providers in the process, for hedge_percentile
+_head_latencies = LatencyWindow()
 
-def fetch_zipfile(session, url, dst_dir):
-    resp = session.get(url, headers={"accept": "application/zip"}, stream=True)
-    resp.raise_for_status()
 
-    dst_filename = path.join(dst_dir, "meca.zip")
-    with open(dst_filename, "wb") as dst:
-        for chunk in resp.iter_content(chunk_size=128):
-            dst.write(chunk)
+def fetch_zipfile(
+    session,
+    url,
+    dst_dir,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+    zero_copy=False,
+    policy=None,
+):
+    return download_zipfile(
+        session,
+        url,
+        dst_dir,
+        buffer_size=buffer_size,
+        zero_copy=zero_copy,
+        policy=policy,
+    ).filename
+
+
+def stream_extract_zipfile(
+    session, url, dst_dir, hashers=(), on_progress=None, meter=None, policy=None
+):
+    """Extract the MECA bundle at `url` into dst_dir as the response arrives,
+    without writing meca.zip to disk first.
+
+    The whole archive, central directory included, is fed to `hashers`, and
+    `IntegrityError` is raised if it does not match an MD5 the origin
+    advertised. Raises `StreamingUnsupported` if the archive needs central
+    directory access, in which case dst_dir may hold a partial extraction.
+    `on_progress` is called with the number of bytes of each read, and
+    `meter`, a `budget.ExtractionMeter`, with what is extracted. The GET is
+    made with the timeouts and retries of `policy`, a `RequestPolicy`, if given.
+    """
+    request_headers = {"accept": "application/zip"}
+    if policy is not None:
+        resp = policy.get(session, url, headers=request_headers, stream=True)
+    else:
+        resp = session.get(url, headers=request_headers, stream=True)
+    resp.raise_for_status()
+    resp.raw.decode_content = True
+    hashers = list(hashers)
+    expected_md5 = None
+    if resp.headers.get("Content-Encoding", "identity").lower() in ("", "identity"):
+        expected_md5 = advertised_content_md5(resp.headers)
+        if expected_md5:
+            checker = new_hashers(["md5"])["md5"]
+            hashers.append(checker)
+    try:
+        if not hashers and on_progress is None:
+            return stream_extract(resp.raw, dst_dir, meter=meter)
+        reader = HashingReader(resp.raw, hashers, on_progress)
+        names = stream_extract(reader, dst_dir, meter=meter)
+        reader.drain()
+    finally:
+        resp.close()
 
-    return dst_filename
+    if expected_md5 and checker.hexdigest() != expected_md5:
+        raise IntegrityError(
+            f"MECA bundle {url} is corrupt: MD5 {checker.hexdigest()} does not "
+            f"match the {expected_md5} advertised by the origin"
+        )
+    return names
 
 
 def handle_items(_, item):
     print(item)
 
 
-def extract_validate_and_identify_bundle(zip_filename, dst_dir):
+def _extract(zip_ref, members, dst_dir, workers, metrics, budget):
+    if budget is not None:
+        budget.check_free_space(dst_dir, budget.check_members(members))
+    files, nbytes = extract_members(zip_ref, members, dst_dir, workers)
+    if metrics is not None:
+        metrics.count("extracted_members", files)
+        metrics.count("extracted_bytes", nbytes)
+
+
+def extract_validate_and_identify_bundle(
+    zip_filename,
+    dst_dir,
+    selective=False,
+    workers=1,
+    flatten=False,
+    metrics=None,
+    manifest_key=None,
+    budget=None,
+    mapped=False,
+):
+    """Extract a MECA bundle into dst_dir and locate its article source directory
+
+    With `selective`, manifest.xml is read straight from the archive and only
+    members under the article source directory are extracted. Archives without
+    a usable manifest are extracted in full. `workers` > 1 decompresses members
+    in parallel. `flatten` implies `selective` and writes the contents of the
+    article source directory to the top of dst_dir, which is then returned as
+    the bundle directory. The number and size of the files extracted are
+    counted on `metrics`, a `FetchMetrics`, if given. The parsed manifest is
+    kept in `manifest_cache` under `manifest_key`, e.g. the bundle's slug.
+    With a `FetchBudget`, the members to extract and the free space needed
+    for them are checked before anything is written. With `mapped`, the
+    archive is read through an mmap instead of file reads. A manifest whose
+    article source directory leads out of the bundle raises RuntimeError.
+    """
     if not os.path.exists(zip_filename):
         raise RuntimeError("Download MECA bundle not found")
 
     if not is_zipfile(zip_filename):
         raise RuntimeError("MECA bundle is not a zip file")
 
-    with ZipFile(zip_filename, "r") as zip_ref:
-        zip_ref.extractall(dst_dir)
+    with (
+        mapped_zipfile(zip_filename) if mapped else ZipFile(zip_filename, "r")
+    ) as zip_ref:
+        if selective or flatten:
+            try:
+                manifest = manifest_cache.get(
+                    manifest_key, lambda: MecaManifest.from_zip(zip_ref)
+                )
+                article_source_dir = manifest.article_source_directory
+            except ManifestError:
+                article_source_dir = None
 
-    try:
-        manifest = path.join(dst_dir, "manifest.xml")
-        if not os.path.exists(manifest):
-            raise RuntimeError("MECA bundle is missing manifest.xml")
-        article_source_dir = "bundle/"
+            if article_source_dir is not None:
+                try:
+                    prefix = source_dir_prefix(article_source_dir)
+                except ManifestError as e:
+                    raise RuntimeError(str(e)) from e
+                if flatten:
+                    members = relocate_members(zip_ref.infolist(), prefix)
+                    _extract(zip_ref, members, dst_dir, workers, metrics, budget)
+                    return True, dst_dir
+                members = [
+                    m for m in zip_ref.infolist() if m.filename.startswith(prefix)
+                ]
+                _extract(zip_ref, members, dst_dir, workers, metrics, budget)
+                bundle_dir = path.join(dst_dir, prefix)
+                os.makedirs(bundle_dir, exist_ok=True)
+                return True, bundle_dir
+
+        _extract(zip_ref, zip_ref.infolist(), dst_dir, workers, metrics, budget)
+
+    if flatten:
+        return False, dst_dir
+    return identify_bundle(dst_dir, manifest_key)
 
-        tree = ET.parse(manifest)
-        root = tree.getroot()
 
-        bundle_instance = root.findall(
-            "{*}item[@item-type='article-source-directory']/{*}instance"
+def identify_bundle(dst_dir, manifest_key=None):
+    """Locate the article source directory of a MECA bundle extracted into dst_dir
+
+    Returns (False, dst_dir) if the bundle has no well formed manifest.xml or
+    the manifest names no article source directory.
+    """
+    filename = path.join(dst_dir, MANIFEST_NAME)
+    if not os.path.exists(filename):
+        return False, dst_dir
+    try:
+        manifest = manifest_cache.get(
+            manifest_key, lambda: MecaManifest.parse(filename)
         )
-        for attr in bundle_instance[0].attrib:
-            if attr.endswith("href"):
-                article_source_dir = bundle_instance[0].get(attr)
+    except ManifestError:
+        return False, dst_dir
 
-        return True, path.join(dst_dir, article_source_dir)
-    except:
+    article_source_dir = manifest.article_source_directory
+    if article_source_dir is None:
         return False, dst_dir
+    return True, path.join(dst_dir, article_source_dir)
+
+
+def file_md5(filename, buffer_size=DEFAULT_BUFFER_SIZE):
+    return file_digests(filename, ["md5"], buffer_size)["md5"]
+
+
+def _spec_url(spec):
+    """Return the bundle URL of a http[s]+meca spec, or None for other specs"""
+    parsed = urlparse(unquote(spec))
+    if not parsed.scheme.endswith("+meca"):
+        return None
+    return urlunparse(parsed._replace(scheme=parsed.scheme[:-5]))
+
+
+def _progress_line(nbytes, total, seconds):
+    rate = nbytes / seconds / 1e6 if seconds > 0 else 0
+    if total:
+        return (
+            f"Downloaded {nbytes / 1e6:.1f} of {total / 1e6:.1f} MB "
+            f"({100 * nbytes / total:.0f}%), {rate:.1f} MB/s.\n"
+        )
+    return f"Downloaded {nbytes / 1e6:.1f} MB, {rate:.1f} MB/s.\n"
+
+
+def _same_device(a, b):
+    return os.stat(a).st_dev == os.stat(b).st_dev
+
+
+def _clear_directory(dirname):
+    for f in os.listdir(dirname):
+        target = path.join(dirname, f)
+        if path.isdir(target) and not path.islink(target):
+            shutil.rmtree(target)
+        else:
+            os.remove(target)
 
 
 class MecaContentProvider(ContentProvider):
@@ -63,7 +260,84 @@ class MecaContentProvider(ContentProvider):
 
     def __init__(self):
         super().__init__()
-        self.session = Session()
+        # Extract while downloading rather than writing meca.zip to disk first
+        self.stream_extract = env_flag("MECA_STREAM_EXTRACT")
+        self.buffer_size = env_int("MECA_DOWNLOAD_BUFFER_SIZE", DEFAULT_BUFFER_SIZE)
+        # Splice the socket straight into meca.zip when the transport allows it
+        self.zero_copy = env_flag("MECA_ZERO_COPY")
+        # Concurrent byte-range segments per download when the origin allows it
+        self.download_segments = env_int("MECA_DOWNLOAD_SEGMENTS", 1)
+        # Only decompress the article-source-directory named in manifest.xml
+        self.selective_extract = env_flag("MECA_SELECTIVE_EXTRACT")
+        self.extract_workers = env_int("MECA_EXTRACT_WORKERS", 1)
+        cache_dir = os.environ.get("MECA_CACHE_DIR")
+        self.cache = (
+            BundleCache(cache_dir, env_int("MECA_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+            if cache_dir
+            else None
+        )
+        # Bundles read in place from mounted storage, see meca4binder.localstore
+        self.local = LocalMounts.from_env()
+        # Fetch only the changed members of a new version of a cached bundle
+        self.delta_fetch = env_flag("MECA_DELTA_FETCH")
+        # Limits on download size, extracted size, members, compression ratio
+        # and free disk space, see meca4binder.budget
+        self.budget = FetchBudget.from_env()
+        # At most this many fetches at once on the node, coordinated through
+        # lock files in MECA_FETCH_SLOTS_DIR (default the cache directory)
+        max_fetches = env_int("MECA_MAX_CONCURRENT_FETCHES", 0)
+        slots_dir = (
+            os.environ.get("MECA_FETCH_SLOTS_DIR")
+            or cache_dir
+            or path.join(tempfile.gettempdir(), "meca4binder-slots")
+        )
+        self.fetch_slots = FetchSlots(slots_dir, max_fetches) if max_fetches else None
+        # Seconds to wait for a fetch slot before failing the build
+        self.fetch_queue_timeout = float(
+            os.environ.get("MECA_FETCH_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT)
+        )
+        # Bundles downloaded ahead of the build by MecaRepoProvider.prefetch_dir
+        prefetch_dir = os.environ.get("MECA_PREFETCH_DIR")
+        self.prefetch = PrefetchStore(prefetch_dir) if prefetch_dir else None
+        # Seconds to wait for a prefetch that is still in progress
+        self.prefetch_wait = float(os.environ.get("MECA_PREFETCH_WAIT", 30))
+        # One fetch per bundle among the processes sharing MECA_STAGING_DIR,
+        # the others copy its result, see meca4binder.staging
+        staging_dir = os.environ.get("MECA_STAGING_DIR")
+        self.staging = (
+            StagingArea(staging_dir, ttl=env_int("MECA_STAGING_TTL", DEFAULT_TTL))
+            if staging_dir
+            else None
+        )
+        # Seconds to wait for another process's fetch before fetching directly
+        self.staging_wait = float(os.environ.get("MECA_STAGING_WAIT", 600))
+        # "url", "cloud" or "content", see MecaRepoProvider.hash_scheme
+        self.hash_scheme = os.environ.get("MECA_HASH_SCHEME", "url").lower()
+        # Where bundles are unpacked: "tmp" (the system temporary directory),
+        # "output" (scratch inside output_dir, so moving the bundle is a rename)
+        # or "direct" (the article source directory is written straight into
+        # output_dir)
+        self.scratch = os.environ.get("MECA_SCRATCH", "tmp").lower()
+        # md5, sha256 or blake2b digest of the bundle computed while fetching it
+        self.hash_algorithm = os.environ.get("MECA_HASH_ALGORITHM", "").lower() or None
+        self.digests = {}
+        self.content_md5 = None
+        # Seconds between download progress lines in the build log
+        self.progress_interval = float(os.environ.get("MECA_PROGRESS_INTERVAL", 5))
+        # "package.module:factory" returning a hook, see meca4binder.metrics
+        hook = os.environ.get("MECA_METRICS_HOOK")
+        self.metrics_hooks = [load_hook(hook)] if hook else []
+        self.metrics = FetchMetrics(self.metrics_hooks)
+        self.content_length = None
+        # The MecaManifest of the fetched bundle
+        self.manifest = None
+        # ETag and Last-Modified of the bundle, from detect
+        self.validators = {}
+        # Timeouts, retries and hedging of the HEAD and GET, from the
+        # MECA_HTTP_* variables, see meca4binder.httppolicy
+        self.http = RequestPolicy.from_env(_head_latencies)
+        # Connections are kept alive across the providers in the process
+        self.session = shared_session()
         self.session.headers.update(
             {
                 "user-agent": f"repo2docker MECA",
@@ -78,48 +352,662 @@ class MecaContentProvider(ContentProvider):
         An other HEAD check in made here in order to get the content-length header
         """
         self.log.info(f"Detecting MECA bundle at {unquote(spec)}")
-        parsed = urlparse(unquote(spec))
-        if not parsed.scheme.endswith("+meca"):
+        url = _spec_url(spec)
+        if url is None:
+            return None
+
+        self.metrics = FetchMetrics(self.metrics_hooks)
+        with self.metrics.phase("detect"):
+            local = self._local_path(url)
+            if local is not None:
+                return self._detected(url, stat_headers(local), local)
+            r = self.http.head(self.session, url)
+        return self._detected(url, r.headers)
+
+    async def detect_async(self, spec, ref=None, extra_args=None):
+        """Async counterpart of `detect`"""
+        from .asyncfetch import head_async
+
+        self.log.info(f"Detecting MECA bundle at {unquote(spec)}")
+        url = _spec_url(spec)
+        if url is None:
+            return None
+
+        self.metrics = FetchMetrics(self.metrics_hooks)
+        with self.metrics.phase("detect"):
+            local = self._local_path(url)
+            if local is not None:
+                return self._detected(url, stat_headers(local), local)
+            headers = await head_async(
+                url, user_agent=self.session.headers["user-agent"], policy=self.http
+            )
+        return self._detected(url, headers)
+
+    def _local_path(self, url):
+        """Return the path of the bundle at url on mounted storage, or None"""
+        if self.local is None:
+            if urlparse(url).scheme == "file":
+                raise ContentProviderException(
+                    "Local MECA bundles are not enabled, set MECA_LOCAL_ROOTS"
+                )
+            return None
+        return self.local.resolve(url)
+
+    def _detected(self, url, headers, local=None):
+        content_length = headers.get("Content-Length")
+        self.content_length = int(content_length) if content_length else None
+        self.budget.check_download_size(self.content_length, url)
+        self.validators = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+
+        self.hashed_slug = get_slug(url, headers, self.hash_scheme)
+
+        spec = {"url": url, "slug": self.hashed_slug}
+        if local is not None:
+            spec["path"] = local
+        return spec
+
+    @property
+    def digest(self):
+        """Hex digest of the fetched bundle using `hash_algorithm`, if set"""
+        if self.hash_algorithm is None:
             return None
-        parsed = parsed._replace(scheme=parsed.scheme[:-5])
-        url = urlunparse(parsed)
+        return self.digests.get(self.hash_algorithm)
+
+    def _hash_algorithms(self):
+        algorithms = []
+        if self.hash_algorithm:
+            algorithms.append(self.hash_algorithm)
+        if self.hash_scheme == "content" and "md5" not in algorithms:
+            algorithms.append("md5")
+        return algorithms
+
+    def _download_options(self):
+        return {
+            "buffer_size": self.buffer_size,
+            "zero_copy": self.zero_copy,
+            "segments": self.download_segments,
+            "hash_algorithms": self._hash_algorithms(),
+            "policy": self.http,
+        }
 
-        r = self.session.head(url)
-        changes_with_content = r.headers.get("ETag") or r.headers.get("Content-Length")
+    def _with_progress(self, fn, counter):
+        """Run fn in a thread, yielding a progress line every progress_interval
+        seconds from the bytes on `counter`, and return its result"""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(fn)
+            while True:
+                try:
+                    return future.result(timeout=self.progress_interval)
+                except TimeoutError:
+                    yield _progress_line(
+                        counter.value,
+                        self.content_length,
+                        time.perf_counter() - start,
+                    )
 
-        self.hashed_slug = get_hashed_slug(url, changes_with_content)
+    def _fetch_zipfile(self, url, tmpdir):
+        """Yield progress while making the bundle available as a local zip file,
+        returning the zip filename"""
+        counter = ProgressCounter()
+        options = self._download_options()
+        options["on_progress"] = self.budget.download_meter(url, counter)
+        if self.cache is not None:
+            yield f"Fetching MECA Bundle {url} via cache {self.cache.root}.\n"
+            zip_filename, hit = yield from self._with_progress(
+                lambda: self.cache.fetch(self.session, url, **options), counter
+            )
+            self.metrics.count("downloaded_bytes", counter.value)
+            if hit:
+                yield f"Cached MECA Bundle is up to date, skipping download.\n"
+            self.digests = self.cache.digests(url, self._hash_algorithms())
+            return zip_filename
+
+        yield f"Fetching MECA Bundle {url}.\n"
+        download = yield from self._with_progress(
+            lambda: download_zipfile(self.session, url, tmpdir, **options), counter
+        )
+        self.metrics.count("downloaded_bytes", download.bytes)
+        yield (
+            f"Downloaded {download.bytes / 1e6:.1f} MB in "
+            f"{download.seconds:.1f}s ({download.mb_per_s:.1f} MB/s).\n"
+        )
+        self.digests = download.digests
+        return download.filename
+
+    def _scratch_directory(self, output_dir):
+        if self.scratch == "tmp":
+            return tempfile.TemporaryDirectory()
+        # on the same filesystem as output_dir, so moves out of it are renames
+        os.makedirs(output_dir, exist_ok=True)
+        return tempfile.TemporaryDirectory(dir=output_dir, prefix=".meca-scratch-")
+
+    def _prefetched(self, slug):
+        """Return the prefetched bundle for slug, if any, with its digests set"""
+        if self.prefetch is None:
+            return None
+        with self.metrics.phase("prefetch"):
+            zip_filename = self.prefetch.wait(slug, self.prefetch_wait)
+            if zip_filename is not None:
+                self.digests = file_digests(
+                    zip_filename, self._hash_algorithms(), self.buffer_size
+                )
+        return zip_filename
+
+    def _local_bundle(self, filename):
+        """Return the bundle at filename on mounted storage, with its digests set"""
+        algorithms = self._hash_algorithms()
+        if algorithms:
+            with self.metrics.phase("hash"):
+                self.digests = mapped_digests(filename, algorithms)
+        return filename
+
+    def _stream_extract(self, url, tmpdir):
+        """Yield progress while streaming the bundle into tmpdir"""
+        counter = ProgressCounter()
+        hashers = new_hashers(self._hash_algorithms())
+        names = yield from self._with_progress(
+            lambda: stream_extract_zipfile(
+                self.session,
+                url,
+                tmpdir,
+                hashers.values(),
+                self.budget.download_meter(url, counter),
+                self.budget.extraction_meter(),
+                self.http,
+            ),
+            counter,
+        )
+        self.digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+        self.metrics.count("downloaded_bytes", counter.value)
+        files = [
+            target
+            for target in (member_target(tmpdir, name) for name in names)
+            if path.isfile(target)
+        ]
+        self.metrics.count("extracted_members", len(files))
+        self.metrics.count("extracted_bytes", sum(path.getsize(f) for f in files))
 
-        return {"url": url, "slug": self.hashed_slug}
+    def _delta_base(self, url):
+        """Return the cached bundle to fetch changes to url against, or None
+
+        Deltas need a cached version that the origin no longer reports as
+        current, and cannot produce a digest of the whole new archive.
+        """
+        if not self.delta_fetch or self.cache is None or self._hash_algorithms():
+            return None
+        meta = self.cache.lookup(url)
+        if meta is None:
+            return None
+        if any(self.validators.values()) and all(
+            meta.get(k) == v for k, v in self.validators.items()
+        ):
+            # unchanged, revalidating the cached copy is cheaper
+            return None
+        return self.cache.zip_path(self.cache.key(url))
+
+    def _delta_extract(self, url, cached_zip, tmpdir):
+        """Yield progress while extracting the bundle into tmpdir, downloading
+        only the members that differ from cached_zip"""
+        counter = ProgressCounter()
+        delta = yield from self._with_progress(
+            lambda: delta_extract(
+                self.session,
+                url,
+                cached_zip,
+                tmpdir,
+                buffer_size=self.buffer_size,
+                on_progress=self.budget.download_meter(url, counter),
+                budget=self.budget,
+                rebuild_to=self.cache.delta_path(url),
+                policy=self.http,
+            ),
+            counter,
+        )
+        self.cache.record_delta(url, delta.rebuilt, self.validators)
+        self.metrics.count("downloaded_bytes", delta.bytes)
+        self.metrics.count("extracted_members", delta.reused + delta.changed)
+        self.metrics.count("extracted_bytes", delta.extracted_bytes)
+        yield (
+            f"Reused {delta.reused} unchanged files and downloaded {delta.changed} "
+            f"changed files ({delta.bytes / 1e6:.1f} MB in {delta.requests} "
+            "requests).\n"
+        )
+
+    def _describe_manifest(self, hashed_slug):
+        """Keep the bundle's parsed manifest and yield any notes about it"""
+        self.manifest = manifest_cache.lookup(hashed_slug)
+        if self.manifest is None:
+            return
+        source_dirs = self.manifest.source_directories
+        if len(source_dirs) > 1:
+            yield (
+                f"MECA manifest lists {len(source_dirs)} article source "
+                f"directories, using {source_dirs[0]}.\n"
+            )
+
+    def _move_contents(self, bundle_dir, output_dir):
+        """Yield progress while moving the contents of bundle_dir into output_dir"""
+        if not _same_device(bundle_dir, output_dir):
+            self.log.warning(
+                f"{bundle_dir} and {output_dir} are on different filesystems, "
+                "copying the MECA bundle. Set MECA_SCRATCH=output to avoid this."
+            )
+            yield f"Copying MECA Bundle at {bundle_dir} to {output_dir}.\n"
+        else:
+            yield f"Moving MECA Bundle at {bundle_dir} to {output_dir}.\n"
+        files = os.listdir(bundle_dir)
+        for f in files:
+            shutil.move(os.path.join(bundle_dir, f), output_dir)
+
+    @contextmanager
+    def _pinned(self, url, slug):
+        """Keep the cached or prefetched bundle for url from eviction while
+        it is used"""
+        with ExitStack() as pins:
+            if self.cache is not None:
+                pins.enter_context(self.cache.pin(url))
+            if self.prefetch is not None:
+                pins.enter_context(self.prefetch.pin(slug))
+            yield
+
+    def _preflight(self, tmpdir):
+        """Check there is room to download the bundle"""
+        if self.content_length:
+            self.budget.check_free_space(
+                self.cache.root if self.cache is not None else tmpdir,
+                self.content_length,
+            )
 
     def fetch(self, spec, output_dir, yield_output=False):
+        yield f"Fetching MECA Bundle {spec['url']}.\n"
+        if self.staging is None or "path" in spec:
+            yield from self._fetch_in_slot(spec, output_dir)
+            return
+
+        hashed_slug = spec["slug"]
+        deadline = time.monotonic() + self.staging_wait
+        while True:
+            staged = self.staging.lookup(hashed_slug)
+            if staged is None:
+                lock = self.staging.try_lock(hashed_slug)
+                if lock is not None:
+                    try:
+                        staged = self.staging.lookup(hashed_slug)
+                        if staged is None:
+                            yield from self._fetch_in_slot(spec, output_dir)
+                            yield from self._stage(spec, output_dir)
+                            return
+                    finally:
+                        lock.release()
+            if staged is not None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield (
+                    f"Gave up waiting for another process to fetch MECA Bundle "
+                    f"{hashed_slug}, fetching it directly.\n"
+                )
+                yield from self._fetch_in_slot(spec, output_dir)
+                return
+            yield f"Waiting for another process fetching MECA Bundle {hashed_slug}.\n"
+            with self.metrics.phase("wait"):
+                self.staging.wait(hashed_slug, remaining)
+
+        yield from self._copy_staged(staged, output_dir)
+
+    def _stage(self, spec, output_dir):
+        """Yield progress while publishing the bundle fetched into output_dir
+        to the staging area, hard linking its files where possible
+
+        The bundle is already in place for this build, so a failure only
+        leaves it unshared.
+        """
+        yield f"Sharing MECA Bundle through staging area {self.staging.root}.\n"
+        work = self.staging.work_dir(spec["slug"])
+        try:
+            copy_tree(output_dir, path.join(work, "tree"), link=True)
+            self._publish(spec, work)
+        except OSError as e:
+            shutil.rmtree(work, ignore_errors=True)
+            self.log.warning(f"Could not stage MECA Bundle {spec['slug']}: {e}")
+
+    def _publish(self, spec, work):
+        meta = {
+            "url": spec["url"],
+            "digests": self.digests,
+            "content_md5": self.content_md5,
+        }
+        return self.staging.publish(spec["slug"], work, meta)
+
+    def _copy_staged(self, staged, output_dir):
+        """Yield progress while copying a staged bundle into output_dir"""
+        self.digests = staged.meta.get("digests") or {}
+        self.content_md5 = staged.meta.get("content_md5")
+        yield f"Copying MECA Bundle from staging area {staged.root}.\n"
+        with self.metrics.phase("copy"):
+            copy_tree(staged.tree, output_dir)
+
+    def _fetch_in_slot(self, spec, output_dir):
+        slot = None
+        if self.fetch_slots is not None:
+            slot = self.fetch_slots.try_acquire()
+            if slot is None:
+                yield (
+                    f"Waiting for one of the {self.fetch_slots.limit} MECA fetch "
+                    "slots on this node.\n"
+                )
+                with self.metrics.phase("queue"):
+                    slot = self.fetch_slots.acquire(self.fetch_queue_timeout)
+        try:
+            yield from self._fetch_bundle(spec, output_dir)
+        finally:
+            if slot is not None:
+                self.fetch_slots.release(slot)
+
+    def _fetch_bundle(self, spec, output_dir):
         hashed_slug = spec["slug"]
         url = spec["url"]
-        yield f"Fetching MECA Bundle {url}.\n"
 
         yield f"Creating temporary directory.\n"
-        with tempfile.TemporaryDirectory() as tmpdir:
+        with self._scratch_directory(output_dir) as tmpdir, self._pinned(
+            url, hashed_slug
+        ):
             yield f"Temporary directory created at {tmpdir}.\n"
 
-            yield f"Fetching MECA Bundle {url}.\n"
-            zip_filename = fetch_zipfile(self.session, url, tmpdir)
+            metrics = self.metrics
+            local = spec.get("path")
+            if local is not None:
+                yield f"Reading MECA Bundle {local} in place.\n"
+                prefetched = self._local_bundle(local)
+            else:
+                prefetched = self._prefetched(hashed_slug)
+                if prefetched is not None:
+                    yield f"Using prefetched MECA Bundle {prefetched}.\n"
+                else:
+                    self._preflight(tmpdir)
 
-            yield f"Extracting MECA Bundle {zip_filename}.\n"
-            is_meca, bundle_dir = extract_validate_and_identify_bundle(
-                zip_filename, tmpdir
+            extracted = False
+            cached_zip = self._delta_base(url) if prefetched is None else None
+            if cached_zip is not None:
+                yield f"Fetching changes to cached MECA Bundle {url}.\n"
+                try:
+                    with metrics.phase("delta"):
+                        yield from self._delta_extract(url, cached_zip, tmpdir)
+                    is_meca, bundle_dir = identify_bundle(tmpdir, hashed_slug)
+                    extracted = True
+                except DeltaUnsupported as e:
+                    yield f"Cannot fetch only the changes ({e}), downloading instead.\n"
+                    _clear_directory(tmpdir)
+
+            if self.stream_extract and self.cache is None and prefetched is None:
+                yield f"Streaming and extracting MECA Bundle {url}.\n"
+                try:
+                    with metrics.phase("stream"):
+                        yield from self._stream_extract(url, tmpdir)
+                    is_meca, bundle_dir = identify_bundle(tmpdir, hashed_slug)
+                    extracted = True
+                except StreamingUnsupported as e:
+                    yield f"Cannot stream this bundle ({e}), downloading it instead.\n"
+                    _clear_directory(tmpdir)
+
+            if prefetched is not None:
+                zip_filename = prefetched
+            elif not extracted:
+                with metrics.phase("download"):
+                    zip_filename = yield from self._fetch_zipfile(url, tmpdir)
+
+            if not extracted:
+                direct = self.scratch == "direct"
+                yield f"Extracting MECA Bundle {zip_filename}.\n"
+                with metrics.phase("extract"):
+                    is_meca, bundle_dir = extract_validate_and_identify_bundle(
+                        zip_filename,
+                        output_dir if direct else tmpdir,
+                        selective=self.selective_extract,
+                        workers=self.extract_workers,
+                        flatten=direct,
+                        metrics=metrics,
+                        manifest_key=hashed_slug,
+                        budget=self.budget,
+                        mapped=local is not None,
+                    )
+
+            if self.hash_scheme == "content":
+                self.content_md5 = self.digests["md5"]
+            if self.digest:
+                yield f"MECA Bundle {self.hash_algorithm} digest {self.digest}.\n"
+
+            if not is_meca:
+                yield f"This doesn't look like a meca bundle, extracting everything.\n"
+            yield from self._describe_manifest(hashed_slug)
+
+            if bundle_dir != output_dir:
+                with metrics.phase("move"):
+                    yield from self._move_contents(bundle_dir, output_dir)
+
+            yield f"Removing temporary directory.\n"
+
+        yield f"{metrics.summary()}.\n"
+        yield f"MECA Bundle {hashed_slug} fetched and unpacked.\n"
+
+    async def _progress_async(self, task, counter):
+        """Yield a progress line every progress_interval seconds until task is done"""
+        start = time.perf_counter()
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=self.progress_interval)
+            if done:
+                return
+            yield _progress_line(
+                counter.value, self.content_length, time.perf_counter() - start
             )
 
+    async def fetch_async(self, spec, output_dir, yield_output=False):
+        """Async counterpart of `fetch`, as an async generator of progress lines
+
+        The bundle is downloaded on the event loop with writes, hashing,
+        extraction and moves running in the loop's default executor, so one
+        process can drive many fetches concurrently. Bundles are always
+        downloaded with a single GET (or through the cache when configured);
+        streamed extraction, delta fetches and ranged segments are only used by
+        `fetch`.
+        """
+        yield f"Fetching MECA Bundle {spec['url']}.\n"
+        if self.staging is None or "path" in spec:
+            async for line in self._fetch_in_slot_async(spec, output_dir):
+                yield line
+            return
+
+        hashed_slug = spec["slug"]
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.staging_wait
+        while True:
+            staged = self.staging.lookup(hashed_slug)
+            if staged is None:
+                lock = self.staging.try_lock(hashed_slug)
+                if lock is not None:
+                    try:
+                        staged = self.staging.lookup(hashed_slug)
+                        if staged is None:
+                            async for line in self._fetch_in_slot_async(
+                                spec, output_dir
+                            ):
+                                yield line
+                            lines = await loop.run_in_executor(
+                                None, lambda: list(self._stage(spec, output_dir))
+                            )
+                            for line in lines:
+                                yield line
+                            return
+                    finally:
+                        lock.release()
+            if staged is not None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield (
+                    f"Gave up waiting for another process to fetch MECA Bundle "
+                    f"{hashed_slug}, fetching it directly.\n"
+                )
+                async for line in self._fetch_in_slot_async(spec, output_dir):
+                    yield line
+                return
+            yield f"Waiting for another process fetching MECA Bundle {hashed_slug}.\n"
+            with self.metrics.phase("wait"):
+                await loop.run_in_executor(
+                    None, self.staging.wait, hashed_slug, remaining
+                )
+
+        lines = await loop.run_in_executor(
+            None, lambda: list(self._copy_staged(staged, output_dir))
+        )
+        for line in lines:
+            yield line
+
+    async def _fetch_in_slot_async(self, spec, output_dir):
+        slot = None
+        if self.fetch_slots is not None:
+            slot = self.fetch_slots.try_acquire()
+            if slot is None:
+                yield (
+                    f"Waiting for one of the {self.fetch_slots.limit} MECA fetch "
+                    "slots on this node.\n"
+                )
+                with self.metrics.phase("queue"):
+                    deadline = time.monotonic() + self.fetch_queue_timeout
+                    while slot is None:
+                        if time.monotonic() >= deadline:
+                            raise self.fetch_slots.timed_out(self.fetch_queue_timeout)
+                        await asyncio.sleep(SLOT_POLL_SECONDS)
+                        slot = self.fetch_slots.try_acquire()
+        try:
+            async for line in self._fetch_bundle_async(spec, output_dir):
+                yield line
+        finally:
+            if slot is not None:
+                self.fetch_slots.release(slot)
+
+    async def _fetch_bundle_async(self, spec, output_dir):
+        from .asyncfetch import download_zipfile_async
+
+        hashed_slug = spec["slug"]
+        url = spec["url"]
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics
+
+        scratch = await loop.run_in_executor(None, self._scratch_directory, output_dir)
+        pinned = self._pinned(url, hashed_slug)
+        await loop.run_in_executor(None, pinned.__enter__)
+        try:
+            tmpdir = scratch.name
+            yield f"Temporary directory created at {tmpdir}.\n"
+
+            counter = ProgressCounter()
+            local = spec.get("path")
+            if local is not None:
+                yield f"Reading MECA Bundle {local} in place.\n"
+                prefetched = await loop.run_in_executor(None, self._local_bundle, local)
+            else:
+                prefetched = await loop.run_in_executor(
+                    None, self._prefetched, hashed_slug
+                )
+                if prefetched is not None:
+                    yield f"Using prefetched MECA Bundle {prefetched}.\n"
+            if prefetched is not None:
+                zip_filename = prefetched
+            else:
+                self._preflight(tmpdir)
+                with metrics.phase("download"):
+                    if self.cache is not None:
+                        yield f"Fetching MECA Bundle {url} via cache {self.cache.root}.\n"
+                        options = self._download_options()
+                        options["on_progress"] = self.budget.download_meter(
+                            url, counter
+                        )
+                        task = loop.run_in_executor(
+                            None,
+                            partial(self.cache.fetch, self.session, url, **options),
+                        )
+                        async for line in self._progress_async(task, counter):
+                            yield line
+                        zip_filename, hit = task.result()
+                        if hit:
+                            yield f"Cached MECA Bundle is up to date, skipping download.\n"
+                        self.digests = await loop.run_in_executor(
+                            None, self.cache.digests, url, self._hash_algorithms()
+                        )
+                    else:
+                        task = asyncio.ensure_future(
+                            download_zipfile_async(
+                                url,
+                                tmpdir,
+                                hash_algorithms=self._hash_algorithms(),
+                                on_progress=self.budget.download_meter(url, counter),
+                                user_agent=self.session.headers["user-agent"],
+                                connect_timeout=self.http.connect_timeout,
+                            )
+                        )
+                        async for line in self._progress_async(task, counter):
+                            yield line
+                        download = task.result()
+                        yield (
+                            f"Downloaded {download.bytes / 1e6:.1f} MB in "
+                            f"{download.seconds:.1f}s ({download.mb_per_s:.1f} MB/s).\n"
+                        )
+                        self.digests = download.digests
+                        zip_filename = download.filename
+            metrics.count("downloaded_bytes", counter.value)
+
+            direct = self.scratch == "direct"
+            yield f"Extracting MECA Bundle {zip_filename}.\n"
+            with metrics.phase("extract"):
+                is_meca, bundle_dir = await loop.run_in_executor(
+                    None,
+                    partial(
+                        extract_validate_and_identify_bundle,
+                        zip_filename,
+                        output_dir if direct else tmpdir,
+                        selective=self.selective_extract,
+                        workers=self.extract_workers,
+                        flatten=direct,
+                        metrics=metrics,
+                        manifest_key=hashed_slug,
+                        budget=self.budget,
+                        mapped=local is not None,
+                    ),
+                )
+
+            if self.hash_scheme == "content":
+                self.content_md5 = self.digests["md5"]
+            if self.digest:
+                yield f"MECA Bundle {self.hash_algorithm} digest {self.digest}.\n"
+
             if not is_meca:
                 yield f"This doesn't look like a meca bundle, extracting everything.\n"
+            for line in self._describe_manifest(hashed_slug):
+                yield line
 
-            yield f"Copying MECA Bundle at {bundle_dir} to {output_dir}.\n"
-            files = os.listdir(bundle_dir)
-            for f in files:
-                shutil.move(os.path.join(bundle_dir, f), output_dir)
+            if bundle_dir != output_dir:
+                with metrics.phase("move"):
+                    lines = await loop.run_in_executor(
+                        None, lambda: list(self._move_contents(bundle_dir, output_dir))
+                    )
+                for line in lines:
+                    yield line
 
             yield f"Removing temporary directory.\n"
+        finally:
+            pinned.__exit__(None, None, None)
+            await loop.run_in_executor(None, scratch.cleanup)
 
+        yield f"{metrics.summary()}.\n"
         yield f"MECA Bundle {hashed_slug} fetched and unpacked.\n"
 
     @property
     def content_id(self):
+        if self.content_md5:
+            return get_content_slug(self.content_md5)
         return self.hashed_slug
@@ -0,0 +1,240 @@
+"""
+Incremental fetch of a new version of a cached MECA bundle.
+
+Revised submissions usually change a few notebooks and leave the data files
+alone. Instead of downloading the whole new archive, the remote central
+directory is read with range requests and each member is compared with the
+cached version of the bundle by name, CRC-32 and size. Only the byte ranges
+of changed members are downloaded; unchanged members are extracted from the
+cached archive. The resulting tree is the same as a full extract, and every
+member is still checked against the CRC-32 of the new archive as it is
+decompressed.
+
+The new version can also be rebuilt as an archive for the node cache, from
+the compressed data of the reused and downloaded members, so later builds
+revalidate against it instead of fetching the same changes again.
+"""
+
+import copy
+import os
+import struct
+import time
+from zipfile import ZIP64_LIMIT, BadZipFile, ZipFile
+
+from requests import RequestException
+
+from .ranged import RangeNotSupported
+from .zipindex import DEFAULT_BLOCK_SIZE, member_spans, remote_zipfile
+
+# Above this fraction of the archive changed, a full download is cheaper
+DELTA_MAX_FRACTION = 0.5
+
+
+class DeltaUnsupported(Exception):
+    """Raised when a bundle cannot, or should not, be fetched incrementally."""
+
+    pass
+
+
+# Size and signature of a zip local file header, before its name and extra
+_LOCAL_HEADER = struct.Struct("<4s22xHH")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+# Data descriptor flag of a zip member
+_DATA_DESCRIPTOR = 0x08
+
+
+class DeltaResult:
+    """Outcome of an incremental fetch"""
+
+    def __init__(
+        self, reused, changed, nbytes, requests, extracted_bytes, seconds, rebuilt
+    ):
+        # files extracted from the cached archive and from the new one
+        self.reused = reused
+        self.changed = changed
+        self.bytes = nbytes
+        self.requests = requests
+        self.extracted_bytes = extracted_bytes
+        self.seconds = seconds
+        # the rebuilt archive of the new version, or None
+        self.rebuilt = rebuilt
+
+
+def plan_delta(remote_members, cached_members):
+    """Split the file members of the new archive into (reused, changed)
+
+    A member is reused when the cached archive has a file of the same name,
+    CRC-32 and uncompressed size.
+    """
+    cached = {m.filename: m for m in cached_members if not m.is_dir()}
+    reused, changed = [], []
+    for member in remote_members:
+        if member.is_dir():
+            continue
+        old = cached.get(member.filename)
+        if old is not None and (old.CRC, old.file_size) == (
+            member.CRC,
+            member.file_size,
+        ):
+            reused.append(member)
+        else:
+            changed.append(member)
+    return reused, changed
+
+
+def coalesce(spans, gap=DEFAULT_BLOCK_SIZE):
+    """Merge sorted [start, end) spans separated by less than gap bytes"""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _copy_raw(zip_ref, member, dst, buffer_size):
+    """Copy the compressed data of member of zip_ref to the file object dst"""
+    if not member.compress_size:
+        # directories and empty files, whose headers may not have been fetched
+        return
+    fp = zip_ref.fp
+    fp.seek(member.header_offset)
+    header = fp.read(_LOCAL_HEADER.size)
+    if len(header) != _LOCAL_HEADER.size or header[:4] != _LOCAL_HEADER_SIGNATURE:
+        raise BadZipFile(f"Bad local header of {member.filename}")
+    _, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+    fp.seek(member.header_offset + _LOCAL_HEADER.size + name_length + extra_length)
+    remaining = member.compress_size
+    while remaining:
+        chunk = fp.read(min(buffer_size, remaining))
+        if not chunk:
+            raise BadZipFile(f"{member.filename} is truncated")
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+def rebuild_archive(members, dst_filename, buffer_size=1024 * 1024):
+    """Write a zip archive of `members`, (zip_ref, member) pairs, to
+    dst_filename, copying their compressed data without recompressing it
+
+    Raises ValueError for archives that would need zip64 extensions.
+    """
+    with open(dst_filename, "wb") as f, ZipFile(f, "w") as out:
+        for zip_ref, member in members:
+            if max(member.file_size, member.compress_size, f.tell()) >= ZIP64_LIMIT:
+                raise ValueError("Cannot rebuild a zip64 archive")
+            info = copy.copy(member)
+            # CRC and sizes go in the local header, without a data descriptor
+            info.flag_bits &= ~_DATA_DESCRIPTOR
+            info.header_offset = f.tell()
+            f.write(info.FileHeader())
+            _copy_raw(zip_ref, member, f, buffer_size)
+            out.filelist.append(info)
+            out.NameToInfo[info.filename] = info
+            out.start_dir = f.tell()
+
+
+def delta_extract(
+    session,
+    url,
+    cached_zip,
+    dst_dir,
+    max_fraction=DELTA_MAX_FRACTION,
+    buffer_size=1024 * 1024,
+    on_progress=None,
+    budget=None,
+    rebuild_to=None,
+    policy=None,
+):
+    """Extract the bundle at `url` into dst_dir, reusing members of cached_zip
+
+    Raises `DeltaUnsupported` if the origin does not serve byte ranges, the
+    archive cannot be read remotely, more than `max_fraction` of it would
+    have to be downloaded, or a range request fails part way; in the last
+    case dst_dir may hold part of the bundle. The members of the new archive
+    are checked against `budget`, a `FetchBudget`, if given. If `rebuild_to`
+    is given, the new version is also written there as an archive, unless
+    that fails. Range requests are made with the timeouts and retries of
+    `policy`, a `RequestPolicy`, if given. Returns a `DeltaResult`.
+    """
+    start = time.perf_counter()
+    try:
+        cached = ZipFile(cached_zip)
+    except (OSError, BadZipFile) as e:
+        raise DeltaUnsupported(f"cached bundle is unusable: {e}") from e
+
+    with cached:
+        try:
+            remote = remote_zipfile(
+                session,
+                url,
+                buffer_size=buffer_size,
+                on_progress=on_progress,
+                policy=policy,
+            )
+        except (RangeNotSupported, RequestException, BadZipFile) as e:
+            raise DeltaUnsupported(str(e)) from e
+
+        range_file = remote.range_file
+        try:
+            with remote:
+                cached_members = {m.filename: m for m in cached.infolist()}
+                if budget is not None:
+                    budget.check_free_space(
+                        dst_dir, budget.check_members(remote.infolist())
+                    )
+                reused, changed = plan_delta(remote.infolist(), cached.infolist())
+                spans = member_spans(remote)
+                wanted = [spans[m.filename] for m in changed]
+                if sum(e - s for s, e in wanted) > max_fraction * range_file.size:
+                    raise DeltaUnsupported(
+                        f"{len(changed)} of {len(reused) + len(changed)} "
+                        "members changed"
+                    )
+                reused_names = {m.filename for m in reused}
+                # in archive order, so duplicate names resolve as in extractall
+                sources = [
+                    (
+                        (cached, cached_members[m.filename])
+                        if m.filename in reused_names
+                        else (remote, m)
+                    )
+                    for m in remote.infolist()
+                ]
+                try:
+                    for span_start, span_end in coalesce(wanted):
+                        range_file.load(span_start, span_end)
+                    for zip_ref, member in sources:
+                        zip_ref.extract(member, dst_dir)
+                except (RangeNotSupported, RequestException) as e:
+                    raise DeltaUnsupported(str(e)) from e
+
+                rebuilt = None
+                if rebuild_to is not None:
+                    try:
+                        rebuild_archive(sources, rebuild_to, buffer_size)
+                        rebuilt = rebuild_to
+                    except (
+                        OSError,
+                        BadZipFile,
+                        ValueError,
+                        RangeNotSupported,
+                        RequestException,
+                    ):
+                        # the extracted tree is complete, only the cache misses out
+                        if os.path.exists(rebuild_to):
+                            os.remove(rebuild_to)
+        finally:
+            range_file.close()
+
+    return DeltaResult(
+        len(reused),
+        len(changed),
+        range_file.bytes_fetched,
+        range_file.requests,
+        sum(m.file_size for m in reused + changed),
+        time.perf_counter() - start,
+        rebuilt,
+    )
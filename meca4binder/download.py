@@ -0,0 +1,455 @@
+"""
+Download engine for MECA bundles.
+
+Copies an HTTP response body to disk with a single reusable buffer, reading
+straight from the underlying `http.client` response when the body needs no
+decoding so the hot loop performs no per-chunk allocation. On Linux a
+zero-copy path can splice the socket into the destination file when the
+transport is plain HTTP with a known length.
+
+Every chunk can also be fed through streaming hashers as it is written, so
+the bundle's digest is known when the transfer ends. A Content-MD5 (or
+x-goog-hash md5) advertised by the origin is always checked this way and a
+mismatching transfer is rejected.
+"""
+
+import hashlib
+import os
+import select
+import ssl
+import time
+from os import path
+
+from .basecontentprovider import ContentProviderException
+from .ranged import (
+    DEFAULT_RETRIES,
+    RangeNotSupported,
+    download_ranged,
+    range_validator,
+    supports_ranges,
+)
+from .utils import advertised_content_md5
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Largest amount moved through the pipe per splice call
+SPLICE_SIZE = 1024 * 1024
+
+HASH_ALGORITHMS = ("md5", "sha256", "blake2b")
+
+
+class IntegrityError(ContentProviderException):
+    """Raised when a downloaded bundle does not match the digest the origin advertised."""
+
+    pass
+
+
+class IncompleteDownload(ContentProviderException):
+    """Raised when the origin closes the connection before the whole bundle arrived."""
+
+    pass
+
+
+def new_hashers(algorithms):
+    """Return {name: hash object} for the requested algorithms"""
+    hashers = {}
+    for name in algorithms:
+        name = name.lower()
+        if name not in HASH_ALGORITHMS:
+            raise ValueError(
+                f"Unsupported hash algorithm {name!r}, expected one of {HASH_ALGORITHMS}"
+            )
+        hashers[name] = hashlib.new(name)
+    return hashers
+
+
+def _update(hashers, data):
+    for hasher in hashers:
+        hasher.update(data)
+
+
+def file_digests(filename, algorithms, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Return {name: hex digest} of the file for each of the algorithms"""
+    hashers = new_hashers(algorithms)
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(buffer_size)
+            if not chunk:
+                break
+            _update(hashers.values(), chunk)
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+
+class HashingReader:
+    """Wrap a file-like object, feeding everything read from it to `hashers`
+    and reporting the size of each read to `on_progress`"""
+
+    def __init__(self, raw, hashers, on_progress=None):
+        self.raw = raw
+        self.hashers = hashers
+        self.on_progress = on_progress
+
+    def read(self, n=-1):
+        data = self.raw.read(n)
+        _update(self.hashers, data)
+        if self.on_progress is not None and data:
+            self.on_progress(len(data))
+        return data
+
+    def drain(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Read (and hash) whatever is left of the stream"""
+        while self.read(buffer_size):
+            pass
+
+
+class DownloadResult:
+    """Outcome of downloading a bundle to disk"""
+
+    def __init__(
+        self,
+        filename,
+        nbytes,
+        seconds,
+        method,
+        status=200,
+        headers=None,
+        digests=None,
+    ):
+        self.filename = filename
+        self.bytes = nbytes
+        self.seconds = seconds
+        self.method = method
+        self.status = status
+        self.headers = headers or {}
+        # {algorithm: hex digest} of the bytes written
+        self.digests = digests or {}
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+    @property
+    def mb_per_s(self):
+        """Measured throughput in MB/s (10^6 bytes per second)"""
+        if self.seconds <= 0:
+            return 0.0
+        return self.bytes / self.seconds / 1e6
+
+    def __repr__(self):
+        return (
+            f"DownloadResult({self.filename!r}, bytes={self.bytes}, "
+            f"seconds={self.seconds:.3f}, method={self.method!r})"
+        )
+
+
+def _is_identity(resp):
+    return resp.headers.get("Content-Encoding", "identity").lower() in (
+        "",
+        "identity",
+    )
+
+
+def _http_client_response(resp):
+    """Return the http.client response under requests/urllib3 if it can be read directly"""
+    if not _is_identity(resp):
+        return None
+    fp = getattr(resp.raw, "_fp", None)
+    if fp is None or not hasattr(fp, "readinto"):
+        return None
+    return fp
+
+
+def _splice_source(resp):
+    """Return (buffered_reader, socket, length) when the body can be spliced"""
+    if not hasattr(os, "splice") or not _is_identity(resp):
+        return None
+    if "chunked" in resp.headers.get("Transfer-Encoding", "").lower():
+        return None
+    length = resp.headers.get("Content-Length")
+    fp = _http_client_response(resp)
+    connection = getattr(resp.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    buffered = getattr(fp, "fp", None)
+    if length is None or sock is None or isinstance(sock, ssl.SSLSocket):
+        return None
+    if buffered is None or not hasattr(buffered, "peek"):
+        return None
+    return buffered, sock, int(length)
+
+
+def _copy_readinto(fp, dst, buffer_size, hashers=(), on_progress=None):
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    total = 0
+    while True:
+        n = fp.readinto(view)
+        if not n:
+            break
+        dst.write(view[:n])
+        _update(hashers, view[:n])
+        total += n
+        if on_progress is not None:
+            on_progress(n)
+    return total
+
+
+def _copy_read(raw, dst, buffer_size, hashers=(), on_progress=None):
+    total = 0
+    while True:
+        chunk = raw.read(buffer_size, decode_content=True)
+        if not chunk:
+            break
+        dst.write(chunk)
+        _update(hashers, chunk)
+        total += len(chunk)
+        if on_progress is not None:
+            on_progress(len(chunk))
+    return total
+
+
+def _check_length(resp, nbytes):
+    """Raise `IncompleteDownload` if fewer than the Content-Length bytes of an
+    unchunked response were received"""
+    length = resp.headers.get("Content-Length")
+    if length is None:
+        return
+    if "chunked" in resp.headers.get("Transfer-Encoding", "").lower():
+        return
+    if nbytes < int(length):
+        raise IncompleteDownload(
+            f"Connection closed after {nbytes} of {length} bytes of MECA bundle"
+        )
+
+
+def _copy_splice(buffered, sock, length, dst, on_progress=None):
+    # http.client may already hold the start of the body in its buffer
+    head = buffered.peek(1)[:length]
+    buffered.read(len(head))
+    dst.write(head)
+    dst.flush()
+
+    remaining = length - len(head)
+    timeout = sock.gettimeout()
+    r, w = os.pipe()
+    try:
+        while remaining:
+            try:
+                n = os.splice(sock.fileno(), w, min(remaining, SPLICE_SIZE))
+            except BlockingIOError:
+                ready, _, _ = select.select([sock], [], [], timeout)
+                if not ready:
+                    raise TimeoutError("Timed out reading MECA bundle")
+                continue
+            if n == 0:
+                raise IOError(
+                    f"Connection closed with {remaining} bytes of MECA bundle unread"
+                )
+            remaining -= n
+            if on_progress is not None:
+                on_progress(n)
+            while n:
+                n -= os.splice(r, dst.fileno(), n)
+    finally:
+        os.close(r)
+        os.close(w)
+    return length
+
+
+def copy_response(
+    resp,
+    dst,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+    zero_copy=False,
+    hashers=(),
+    on_progress=None,
+):
+    """Copy the body of a streamed `requests` response into the open file `dst`
+
+    Each chunk written is also fed to the `hashers`. Spliced bytes never pass
+    through userspace, so zero copy is skipped when there is anything to hash.
+    `on_progress`, if given, is called with the size of each chunk written.
+    Returns (bytes_written, method) where method names the copy strategy used.
+    `IncompleteDownload` is raised if the body is shorter than its
+    Content-Length.
+    """
+    hashers = list(hashers)
+    if zero_copy and not hashers:
+        source = _splice_source(resp)
+        if source is not None:
+            return _copy_splice(*source, dst, on_progress), "splice"
+
+    fp = _http_client_response(resp)
+    if fp is not None:
+        nbytes = _copy_readinto(fp, dst, buffer_size, hashers, on_progress)
+        method = "readinto"
+    else:
+        nbytes = _copy_read(resp.raw, dst, buffer_size, hashers, on_progress)
+        method = "read"
+    # Content-Length counts the body as sent, before any decoding
+    _check_length(resp, nbytes if _is_identity(resp) else resp.raw.tell())
+    return nbytes, method
+
+
+def _hash_algorithms(algorithms, headers):
+    """Return the algorithms to compute and the MD5 to check, if any
+
+    Content-MD5 covers the encoded body, so it is only checked when the body
+    arrives unencoded.
+    """
+    algorithms = [a.lower() for a in algorithms]
+    expected_md5 = None
+    if headers.get("Content-Encoding", "identity").lower() in ("", "identity"):
+        expected_md5 = advertised_content_md5(headers)
+    if expected_md5 and "md5" not in algorithms:
+        algorithms.append("md5")
+    return algorithms, expected_md5
+
+
+def _verify(url, filename, digests, expected_md5):
+    if expected_md5 and digests.get("md5") != expected_md5:
+        os.remove(filename)
+        raise IntegrityError(
+            f"MECA bundle {url} is corrupt: MD5 {digests.get('md5')} does not "
+            f"match the {expected_md5} advertised by the origin"
+        )
+
+
+def _download_segmented(
+    session, url, dst_filename, headers, segments, policy=None, **kwargs
+):
+    """Try a parallel ranged download, returning (status, response headers)
+    or None if the origin cannot serve byte ranges for this bundle."""
+    if policy is not None:
+        head = policy.head(session, url, allow_redirects=True)
+    else:
+        head = session.head(url, allow_redirects=True)
+    if not head.ok:
+        return None
+    etag = head.headers.get("ETag")
+    if etag and headers.get("If-None-Match") == etag:
+        return 304, head.headers
+    if not supports_ranges(head.headers):
+        return None
+    try:
+        download_ranged(
+            session,
+            url,
+            dst_filename,
+            int(head.headers["Content-Length"]),
+            validator=range_validator(head.headers),
+            segments=segments,
+            policy=policy,
+            **kwargs,
+        )
+    except RangeNotSupported:
+        # the bundle changed under us or ranges were refused part way
+        for stale in (dst_filename, f"{dst_filename}.ranges"):
+            if path.exists(stale):
+                os.remove(stale)
+        return None
+    return 200, head.headers
+
+
+def download_zipfile(
+    session,
+    url,
+    dst_dir,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+    zero_copy=False,
+    filename="meca.zip",
+    headers=None,
+    segments=1,
+    retries=DEFAULT_RETRIES,
+    hash_algorithms=(),
+    on_progress=None,
+    policy=None,
+):
+    """Download the bundle at `url` into dst_dir, returning a `DownloadResult`
+
+    Extra request `headers` may make the request conditional, in which case a
+    304 response returns a result with `not_modified` set and no file written.
+    With `segments` > 1 and an origin that accepts byte ranges, the bundle is
+    fetched as concurrent range requests that are retried individually and
+    resume from a partial file left by an earlier interrupted call.
+
+    The result's `digests` hold the hex digest of the bundle for each of
+    `hash_algorithms`, computed while writing (after the fact for ranged
+    downloads, whose segments land out of order). `IntegrityError` is raised
+    if the bundle does not match an MD5 the origin advertised. `on_progress`
+    is called from the downloading thread(s) with each number of bytes written.
+    With a `RequestPolicy` as `policy`, requests get its timeouts and are
+    retried until the origin answers.
+    """
+    start = time.perf_counter()
+    dst_filename = path.join(dst_dir, filename)
+
+    if segments > 1:
+        segmented = _download_segmented(
+            session,
+            url,
+            dst_filename,
+            headers or {},
+            segments,
+            policy=policy,
+            retries=retries,
+            buffer_size=buffer_size,
+            on_progress=on_progress,
+        )
+        if segmented is not None:
+            status, response_headers = segmented
+            elapsed = time.perf_counter() - start
+            if status == 304:
+                return DownloadResult(None, 0, elapsed, None, 304, response_headers)
+            algorithms, expected_md5 = _hash_algorithms(
+                hash_algorithms, response_headers
+            )
+            digests = file_digests(dst_filename, algorithms, buffer_size)
+            _verify(url, dst_filename, digests, expected_md5)
+            size = os.path.getsize(dst_filename)
+            return DownloadResult(
+                dst_filename,
+                size,
+                time.perf_counter() - start,
+                "ranged",
+                200,
+                response_headers,
+                digests,
+            )
+
+    request_headers = {"accept": "application/zip"}
+    request_headers.update(headers or {})
+    if policy is not None:
+        resp = policy.get(session, url, headers=request_headers, stream=True)
+    else:
+        resp = session.get(url, headers=request_headers, stream=True)
+    try:
+        if resp.status_code == 304:
+            return DownloadResult(
+                None, 0, time.perf_counter() - start, None, 304, resp.headers
+            )
+        resp.raise_for_status()
+
+        algorithms, expected_md5 = _hash_algorithms(hash_algorithms, resp.headers)
+        hashers = new_hashers(algorithms)
+        try:
+            with open(dst_filename, "wb") as dst:
+                nbytes, method = copy_response(
+                    resp, dst, buffer_size, zero_copy, hashers.values(), on_progress
+                )
+        except Exception:
+            os.remove(dst_filename)
+            raise
+    finally:
+        resp.close()
+
+    digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+    _verify(url, dst_filename, digests, expected_md5)
+    return DownloadResult(
+        dst_filename,
+        nbytes,
+        time.perf_counter() - start,
+        method,
+        resp.status_code,
+        resp.headers,
+        digests,
+    )
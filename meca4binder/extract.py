@@ -0,0 +1,91 @@
+"""
+Extraction of MECA bundle members from a zip archive on disk.
+"""
+
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from zipfile import ZipFile
+
+
+def member_target(dst_dir, name):
+    """Map an archive member name onto dst_dir the same way ZipFile.extract does"""
+    arcname = name.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid_path_parts = ("", os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(
+        x for x in arcname.split(os.path.sep) if x not in invalid_path_parts
+    )
+    return path.join(dst_dir, arcname)
+
+
+def relocate_members(members, prefix):
+    """Return copies of the `members` under prefix, renamed to drop the prefix
+
+    Extracting the copies writes the subtree straight to the top of the
+    destination instead of extracting it nested and moving it up afterwards.
+    """
+    relocated = []
+    for member in members:
+        if not member.filename.startswith(prefix):
+            continue
+        name = member.filename[len(prefix) :]
+        if not name:
+            continue
+        member = copy.copy(member)
+        member.filename = name
+        relocated.append(member)
+    return relocated
+
+
+def extract_members(zip_ref, members, dst_dir, workers=1):
+    """Extract `members` (ZipInfo objects) of the open ZipFile zip_ref into dst_dir
+
+    With more than one worker, members are spread over a thread pool, largest
+    first. zlib releases the GIL while inflating, so deflated members decompress
+    on separate cores. Each worker reads through its own ZipFile handle and
+    streams members to disk in bounded chunks, so memory use does not grow with
+    member size. A zip_ref with a `reopen` method, such as one from
+    `mapped_zipfile`, provides the worker handles. The resulting tree is identical to `ZipFile.extractall`.
+
+    Returns (files, bytes) extracted, not counting directories.
+    """
+    members = list(members)
+    files = [m for m in members if not m.is_dir()]
+    extracted = len(files), sum(m.file_size for m in files)
+    workers = max(1, min(workers, len(members), os.cpu_count() or 1))
+    if workers == 1:
+        zip_ref.extractall(dst_dir, members=members)
+        return extracted
+
+    # Create directories up front so workers never race on makedirs
+    for member in members:
+        target = member_target(dst_dir, member.filename)
+        os.makedirs(target if member.is_dir() else path.dirname(target), exist_ok=True)
+
+    handles = []
+    local = threading.local()
+
+    def extract(member):
+        handle = getattr(local, "handle", None)
+        if handle is None:
+            reopen = getattr(zip_ref, "reopen", None)
+            handle = local.handle = (
+                reopen() if reopen is not None else ZipFile(zip_ref.filename, "r")
+            )
+            handles.append(handle)
+        handle.extract(member, dst_dir)
+
+    files = sorted(files, key=lambda m: m.compress_size, reverse=True)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(extract, files):
+                pass
+    finally:
+        for handle in handles:
+            handle.close()
+    return extracted
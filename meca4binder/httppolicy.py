@@ -0,0 +1,303 @@
+"""
+Timeouts, retries and hedging for the requests made to bundle origins.
+
+A `RequestPolicy` gives each phase of a request its own timeout: connecting,
+answering a HEAD, and the gaps between body bytes of a GET. Requests failing
+with a connection error, a timeout or a 429/5xx status are retried after an
+exponential backoff with full jitter, so that launches retrying against a
+struggling origin do not arrive in lockstep. A HEAD still unanswered after
+`hedge_after` seconds, or after the `hedge_percentile` of recent HEAD
+latencies, is raced against a second one and the first answer wins.
+
+`head` and `get` take a requests `Session`, as used by MecaContentProvider,
+and `head_async` a tornado `AsyncHTTPClient`, as used by MecaRepoProvider;
+neither library is imported here until used. `shared_session` is a keep-alive
+connection pool for all the providers in a process.
+"""
+
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from .utils import env_int
+
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_HEAD_TIMEOUT = 20
+
+# Seconds without a body byte before a GET is abandoned
+DEFAULT_READ_TIMEOUT = 60
+
+# Further attempts after the first
+DEFAULT_RETRIES = 2
+
+# Upper bound of the first retry's jittered delay, doubled for each retry
+DEFAULT_BACKOFF = 0.25
+MAX_BACKOFF = 5
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# HEAD latencies kept for hedge_percentile, and the fewest it is derived from
+LATENCY_WINDOW = 256
+MIN_LATENCY_SAMPLES = 20
+
+# Connections kept alive per origin by the shared session
+POOL_SIZE = 32
+
+
+class LatencyWindow:
+    """The most recent request latencies, in seconds"""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """Nearest-rank percentile p of the latencies, or None if there are none"""
+        with self._lock:
+            values = sorted(self._samples)
+        if not values:
+            return None
+        return values[
+            min(len(values) - 1, max(0, math.ceil(p * len(values) / 100) - 1))
+        ]
+
+
+def _env_seconds(name, default):
+    """Read a timeout from the environment, 0 meaning no limit"""
+    value = float(os.environ.get(name, default))
+    return value or None
+
+
+def _retryable(error):
+    # tornado's HTTPClientError has the status, or 599 for a timeout
+    code = getattr(error, "code", None)
+    if code is not None:
+        return code == 599 or code in RETRY_STATUSES
+    return isinstance(error, OSError)
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class RequestPolicy:
+    """Timeouts, retries and hedging of the requests to bundle origins
+
+    Timeouts are in seconds, None for no limit. `retries` is the number of
+    attempts after the first. `hedge_after` hedges HEADs after a fixed delay
+    and `hedge_percentile` (e.g. 95) after that percentile of the HEAD
+    latencies in `latencies`, whichever is shorter; 0 disables either.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        head_timeout=DEFAULT_HEAD_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        max_backoff=MAX_BACKOFF,
+        hedge_after=0,
+        hedge_percentile=0,
+        latencies=None,
+        rng=None,
+    ):
+        self.connect_timeout = connect_timeout
+        self.head_timeout = head_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.hedge_percentile = hedge_percentile
+        self.latencies = latencies if latencies is not None else LatencyWindow()
+        self.random = rng or random.Random()
+
+    @classmethod
+    def from_env(cls, latencies=None):
+        """A policy from the MECA_HTTP_* environment variables"""
+        return cls(
+            connect_timeout=_env_seconds(
+                "MECA_HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT
+            ),
+            head_timeout=_env_seconds("MECA_HTTP_HEAD_TIMEOUT", DEFAULT_HEAD_TIMEOUT),
+            read_timeout=_env_seconds("MECA_HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+            retries=env_int("MECA_HTTP_RETRIES", DEFAULT_RETRIES),
+            hedge_after=float(os.environ.get("MECA_HTTP_HEDGE_AFTER", 0)),
+            hedge_percentile=float(os.environ.get("MECA_HTTP_HEDGE_PERCENTILE", 0)),
+            latencies=latencies,
+        )
+
+    @property
+    def get_timeout(self):
+        """The requests timeout of a GET, (connect, between body bytes)"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt, counting from 0"""
+        return self.random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def hedge_delay(self):
+        """Seconds after which a HEAD is hedged, or None not to hedge"""
+        delays = []
+        if self.hedge_after:
+            delays.append(self.hedge_after)
+        if self.hedge_percentile and len(self.latencies) >= MIN_LATENCY_SAMPLES:
+            delays.append(self.latencies.percentile(self.hedge_percentile))
+        return min(delays) if delays else None
+
+    def _retry(self, attempt, errors):
+        for n in range(self.retries + 1):
+            last = n == self.retries
+            try:
+                resp = attempt()
+            except errors:
+                if last:
+                    raise
+            else:
+                if last or resp.status_code not in RETRY_STATUSES:
+                    return resp
+                resp.close()
+            time.sleep(self.delay(n))
+
+    def _timed(self, request):
+        start = time.perf_counter()
+        resp = request()
+        self.latencies.add(time.perf_counter() - start)
+        return resp
+
+    def _hedged(self, attempt):
+        delay = self.hedge_delay()
+        if delay is None:
+            return attempt()
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            first = pool.submit(attempt)
+            if wait([first], timeout=delay).done:
+                return first.result()
+            futures = [first, pool.submit(attempt)]
+            error = None
+            for future in as_completed(futures):
+                try:
+                    resp = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                for other in futures:
+                    if other is not future:
+                        other.add_done_callback(_close_response)
+                return resp
+            raise error
+        finally:
+            # the slower request finishes in the background
+            pool.shutdown(wait=False)
+
+    def head(self, session, url, **kwargs):
+        """HEAD url with a requests session, retried and hedged, returning the
+        response, which may have a retryable status once retries run out"""
+        from requests import ConnectionError, Timeout
+
+        kwargs.setdefault("timeout", (self.connect_timeout, self.head_timeout))
+        return self._retry(
+            lambda: self._hedged(
+                lambda: self._timed(lambda: session.head(url, **kwargs))
+            ),
+            (ConnectionError, Timeout),
+        )
+
+    def get(self, session, url, **kwargs):
+        """GET url with a requests session, retried until a response arrives
+
+        Only the request is retried: with `stream=True` a body that fails part
+        way is left to the caller.
+        """
+        from requests import ConnectionError, Timeout
+
+        kwargs.setdefault("timeout", self.get_timeout)
+        return self._retry(
+            lambda: session.get(url, **kwargs), (ConnectionError, Timeout)
+        )
+
+    async def _hedged_async(self, attempt):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await attempt()
+        first = asyncio.ensure_future(attempt())
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done:
+            return first.result()
+        tasks = [first, asyncio.ensure_future(attempt())]
+        error = None
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    return await task
+                except Exception as e:
+                    error = error or e
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+                # the loser's error, if any, is not of interest
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def head_async(self, client, url, **request):
+        """HEAD url with a tornado client, retried and hedged, returning the
+        response; `request` are further `HTTPRequest` arguments
+
+        Raises the error of the last attempt as `client.fetch` does.
+        """
+        from tornado.httpclient import HTTPRequest
+
+        # tornado applies its own defaults to timeouts left as None
+        if self.connect_timeout:
+            request.setdefault("connect_timeout", self.connect_timeout)
+        if self.head_timeout:
+            request.setdefault("request_timeout", self.head_timeout)
+
+        async def attempt():
+            start = time.perf_counter()
+            resp = await client.fetch(HTTPRequest(url, method="HEAD", **request))
+            self.latencies.add(time.perf_counter() - start)
+            return resp
+
+        for n in range(self.retries + 1):
+            try:
+                return await self._hedged_async(attempt)
+            except Exception as e:
+                if n == self.retries or not _retryable(e):
+                    raise
+            await asyncio.sleep(self.delay(n))
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def shared_session():
+    """The requests Session shared by the providers in this process, so that
+    connections to an origin are kept alive from detect to fetch"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            from requests import Session
+            from requests.adapters import HTTPAdapter
+
+            session = Session()
+            for scheme in ("http://", "https://"):
+                session.mount(scheme, HTTPAdapter(pool_maxsize=POOL_SIZE))
+            _session = session
+    return _session
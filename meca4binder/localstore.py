@@ -0,0 +1,187 @@
+"""
+Bundles read in place from storage mounted on the build node.
+
+Bundles that live on NFS or a PVC also mounted on the build nodes need not be
+fetched over HTTP. `LocalMounts` maps `file+meca:///...` specs, and bundle
+URLs under a configured prefix, onto files below allow-listed roots. Such a
+bundle is identified from a `stat` of the file, and is opened with mmap and
+extracted straight from the mapped pages: nothing is downloaded and no
+temporary copy of the archive is written.
+"""
+
+import io
+import mmap
+import os
+from contextlib import contextmanager
+from os import path
+from urllib.parse import unquote, urlparse
+from zipfile import ZipFile
+
+from .basecontentprovider import ContentProviderException
+from .download import _update, new_hashers
+
+# Bytes hashed per call, so a huge mapping is not hashed in one go
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class LocalBundleNotAllowed(ContentProviderException):
+    """Raised for a local bundle outside the allowed roots."""
+
+    pass
+
+
+def _inside(filename, root):
+    return path.commonpath([filename, root]) == root
+
+
+class LocalMounts:
+    """URL prefixes mapped to mount paths, and the roots local bundles may be in
+
+    `mounts` is a list of (url_prefix, mount_path). `roots` are directories
+    `file+meca` specs may point into; each mount path is a root too. Paths are
+    compared after resolving symlinks, so a link cannot lead out of a root.
+    """
+
+    def __init__(self, mounts=(), roots=()):
+        self.mounts = [(prefix, path.realpath(mount)) for prefix, mount in mounts]
+        self.roots = [path.realpath(r) for r in roots] + [m for _, m in self.mounts]
+
+    @classmethod
+    def from_env(cls):
+        """Read MECA_LOCAL_MOUNTS, whitespace separated `url_prefix=path`
+        entries, and MECA_LOCAL_ROOTS, a os.pathsep separated list, or return
+        None if neither is set"""
+        mounts = [
+            tuple(entry.split("=", 1))
+            for entry in os.environ.get("MECA_LOCAL_MOUNTS", "").split()
+        ]
+        for entry in mounts:
+            if len(entry) != 2:
+                raise ValueError(f"MECA_LOCAL_MOUNTS entry {entry[0]} has no '='")
+        roots = [
+            r for r in os.environ.get("MECA_LOCAL_ROOTS", "").split(os.pathsep) if r
+        ]
+        if not mounts and not roots:
+            return None
+        return cls(mounts, roots)
+
+    def _allowed(self, filename):
+        filename = path.realpath(filename)
+        if not any(_inside(filename, root) for root in self.roots):
+            raise LocalBundleNotAllowed(
+                f"{filename} is not in an allowed MECA bundle root"
+            )
+        return filename
+
+    def resolve(self, url):
+        """Return the local path of the bundle at url, or None if it is not
+        available locally and should be fetched over HTTP
+
+        Raises `LocalBundleNotAllowed` for a file URL outside the roots, or a
+        mapped URL that escapes its mount.
+        """
+        parsed = urlparse(url)
+        if parsed.scheme == "file":
+            filename = self._allowed(unquote(parsed.path))
+            if not path.isfile(filename):
+                raise LocalBundleNotAllowed(f"{filename} is not a file")
+            return filename
+        for prefix, mount in self.mounts:
+            if url.startswith(prefix):
+                relative = unquote(urlparse(url[len(prefix) :]).path).lstrip("/")
+                filename = path.realpath(path.join(mount, relative))
+                if not _inside(filename, mount):
+                    raise LocalBundleNotAllowed(f"{url} is outside {mount}")
+                return filename if path.isfile(filename) else None
+        return None
+
+
+def stat_headers(filename):
+    """Headers a web server would send for filename, with an ETag from its
+    modification time and size"""
+    st = os.stat(filename)
+    return {
+        "Content-Length": str(st.st_size),
+        "ETag": f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+    }
+
+
+class MappedFile(io.RawIOBase):
+    """A read-only file over a buffer, with a position of its own"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._buffer = memoryview(buffer)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def readinto(self, b):
+        data = self._buffer[self._pos : self._pos + len(b)]
+        n = len(data)
+        memoryview(b)[:n] = data
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._buffer.release()
+        super().close()
+
+
+@contextmanager
+def mapped_zipfile(filename):
+    """Open the zip archive filename through a read-only mmap
+
+    The ZipFile's `reopen` attribute returns another ZipFile over the same
+    mapping, for a worker thread to read through.
+    """
+    with open(filename, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    files = []
+
+    def reopen():
+        files.append(MappedFile(mapping))
+        return ZipFile(files[-1])
+
+    try:
+        zip_ref = reopen()
+        zip_ref.reopen = reopen
+        with zip_ref:
+            yield zip_ref
+    finally:
+        for f in files:
+            f.close()
+        mapping.close()
+
+
+def mapped_digests(filename, algorithms):
+    """Return {name: hex digest} of filename, hashed straight from an mmap"""
+    hashers = new_hashers(algorithms)
+    if not hashers:
+        return {}
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with mapping, memoryview(mapping) as view:
+        for start in range(0, len(view), HASH_CHUNK_SIZE):
+            _update(hashers.values(), view[start : start + HASH_CHUNK_SIZE])
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
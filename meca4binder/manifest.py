@@ -0,0 +1,216 @@
+"""
+Compact model of a MECA `manifest.xml`.
+
+The manifest is read incrementally with `iterparse`, keeping only one small
+record per item, and indexed by item type and by href so that validation and
+selective extraction are lookups. It can be read from a file, from bytes, or
+straight from a zip member, including one read through range requests, and
+parsed manifests can be cached per bundle slug.
+"""
+
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from io import BytesIO
+
+MANIFEST_NAME = "manifest.xml"
+
+SOURCE_DIRECTORY = "article-source-directory"
+
+# Used when an article-source-directory instance has no href
+DEFAULT_SOURCE_DIR = "bundle/"
+
+
+class ManifestError(ValueError):
+    """Raised when manifest.xml is missing or is not well formed."""
+
+    pass
+
+
+class ManifestInstance:
+    __slots__ = ("href", "media_type")
+
+    def __init__(self, href, media_type):
+        self.href = href
+        self.media_type = media_type
+
+    def __repr__(self):
+        return f"ManifestInstance({self.href!r}, {self.media_type!r})"
+
+
+class ManifestItem:
+    __slots__ = ("id", "item_type", "instances")
+
+    def __init__(self, id, item_type, instances):
+        self.id = id
+        self.item_type = item_type
+        self.instances = instances
+
+    def __repr__(self):
+        return f"ManifestItem({self.id!r}, {self.item_type!r}, {self.instances!r})"
+
+
+def source_dir_prefix(article_source_dir):
+    """Normalise an article-source-directory href to a zip member name prefix
+
+    Raises `ManifestError` if the href leads out of the bundle.
+    """
+    prefix = posixpath.normpath(article_source_dir).strip("/")
+    if prefix == ".." or prefix.startswith("../"):
+        raise ManifestError(
+            f"article-source-directory {article_source_dir} is outside the bundle"
+        )
+    return "" if prefix == "." else f"{prefix}/"
+
+
+def _local(tag):
+    return tag.rpartition("}")[2]
+
+
+def _attribute(element, name):
+    """Return the attribute called name in any namespace"""
+    for key, value in element.attrib.items():
+        if _local(key) == name:
+            return value
+    return None
+
+
+class MecaManifest:
+    """The items of a MECA manifest, indexed by item type and by href"""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.by_type = {}
+        self.by_href = {}
+        for item in self.items:
+            self.by_type.setdefault(item.item_type, []).append(item)
+            for instance in item.instances:
+                if instance.href is not None:
+                    self.by_href.setdefault(instance.href, item)
+
+    @classmethod
+    def parse(cls, source):
+        """Read a manifest from a filename or a binary file object"""
+        items = []
+        # open elements, and the instances of each open item
+        stack = []
+        instances = []
+        try:
+            for event, element in ET.iterparse(source, events=("start", "end")):
+                tag = _local(element.tag)
+                if event == "start":
+                    stack.append(element)
+                    if tag == "item":
+                        instances.append([])
+                    continue
+                stack.pop()
+                parent = stack[-1] if stack else None
+                if (
+                    tag == "instance"
+                    and parent is not None
+                    and _local(parent.tag) == "item"
+                ):
+                    instances[-1].append(
+                        ManifestInstance(
+                            _attribute(element, "href"),
+                            _attribute(element, "media-type"),
+                        )
+                    )
+                elif tag == "item":
+                    items.append(
+                        ManifestItem(
+                            element.get("id"),
+                            element.get("item-type"),
+                            tuple(instances.pop()),
+                        )
+                    )
+                    element.clear()
+                if parent is not None and parent is stack[0]:
+                    # drop finished children of the root so memory stays bounded
+                    parent.remove(element)
+        except ET.ParseError as e:
+            raise ManifestError(f"{MANIFEST_NAME} is not well formed: {e}") from e
+        return cls(items)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.parse(BytesIO(data))
+
+    @classmethod
+    def from_zip(cls, zip_ref, name=MANIFEST_NAME):
+        """Read the manifest member of an open ZipFile without extracting it"""
+        try:
+            member = zip_ref.open(name)
+        except KeyError as e:
+            raise ManifestError(f"MECA bundle is missing {name}") from e
+        with member:
+            return cls.parse(member)
+
+    def items_of_type(self, item_type):
+        return self.by_type.get(item_type, [])
+
+    def item(self, href):
+        """Return the item with an instance at href, or None"""
+        return self.by_href.get(href)
+
+    @property
+    def source_directories(self):
+        """Hrefs of every article-source-directory instance, in manifest order"""
+        return [
+            instance.href or DEFAULT_SOURCE_DIR
+            for item in self.items_of_type(SOURCE_DIRECTORY)
+            for instance in item.instances
+        ]
+
+    @property
+    def article_source_directory(self):
+        """The first article-source-directory, or None if there is none"""
+        directories = self.source_directories
+        return directories[0] if directories else None
+
+    @property
+    def media_types(self):
+        """{href: media type} of every instance that declares one"""
+        return {
+            instance.href: instance.media_type
+            for item in self.items
+            for instance in item.instances
+            if instance.href is not None and instance.media_type is not None
+        }
+
+
+class ManifestCache:
+    """A thread-safe LRU of parsed manifests, keyed by bundle slug"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._manifests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        with self._lock:
+            manifest = self._manifests.get(key)
+            if manifest is not None:
+                self._manifests.move_to_end(key)
+            return manifest
+
+    def get(self, key, load):
+        """Return the manifest for key, calling load() to read it on a miss"""
+        if key is None:
+            return load()
+        manifest = self.lookup(key)
+        if manifest is None:
+            manifest = load()
+            with self._lock:
+                self._manifests[key] = manifest
+                while len(self._manifests) > self.max_size:
+                    self._manifests.popitem(last=False)
+        return manifest
+
+    def clear(self):
+        with self._lock:
+            self._manifests.clear()
+
+
+manifest_cache = ManifestCache()
@@ -0,0 +1,147 @@
+"""
+Instrumentation of bundle resolution and fetching.
+
+Measurements are emitted as `(name, value, labels)` observations to metrics
+hooks. A hook is either a callable taking those three arguments or an object
+with an `observe(name, value, labels)` method, such as `PrometheusHook`.
+Hooks registered with `add_hook` receive every observation in the process.
+
+Names ending in `_seconds` are durations, the others are counts to add up.
+"""
+
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+_hooks = []
+
+
+def add_hook(hook):
+    """Send every observation in this process to `hook`"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def load_hook(path):
+    """Import a hook factory from a "package.module:callable" path and call it"""
+    module_name, _, attr = path.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+def emit(name, value, labels=None, hooks=()):
+    labels = labels or {}
+    for hook in [*_hooks, *hooks]:
+        observe = getattr(hook, "observe", hook)
+        observe(name, value, labels)
+
+
+class PrometheusHook:
+    """Record observations as prometheus_client histograms and counters
+
+    Requires the optional `prometheus_client` package.
+    """
+
+    def __init__(self, registry=None):
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError(
+                "PrometheusHook requires the prometheus_client package"
+            ) from e
+        self._prometheus = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _metric(self, name, labelnames):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                kind = (
+                    self._prometheus.Histogram
+                    if name.endswith("_seconds")
+                    else self._prometheus.Counter
+                )
+                metric = kind(
+                    name, name.replace("_", " "), labelnames, registry=self.registry
+                )
+                self._metrics[name] = metric
+            return metric
+
+    def observe(self, name, value, labels):
+        labelnames = sorted(labels)
+        metric = self._metric(name, labelnames)
+        if labelnames:
+            metric = metric.labels(**labels)
+        if name.endswith("_seconds"):
+            metric.observe(value)
+        else:
+            metric.inc(value)
+
+
+class ProgressCounter:
+    """Thread-safe running total, updated by download workers"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, n):
+        with self._lock:
+            self.value += n
+
+
+class FetchMetrics:
+    """Per-phase durations and byte/member counts of one bundle fetch"""
+
+    def __init__(self, hooks=(), clock=time.perf_counter):
+        self.hooks = list(hooks)
+        self.clock = clock
+        self.phases = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+            emit("meca_fetch_phase_seconds", elapsed, {"phase": name}, self.hooks)
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+        emit(f"meca_fetch_{name}", n, {}, self.hooks)
+
+    def throughput(self, phase, count):
+        """MB/s for `count` bytes over the duration of `phase`"""
+        seconds = self.phases.get(phase)
+        if not seconds:
+            return None
+        return self.counts.get(count, 0) / seconds / 1e6
+
+    def as_dict(self):
+        return {"phases": dict(self.phases), "counts": dict(self.counts)}
+
+    def summary(self):
+        parts = []
+        for name, seconds in self.phases.items():
+            part = f"{name} {seconds:.2f}s"
+            if name == "download" and self.counts.get("downloaded_bytes"):
+                part += (
+                    f" ({self.counts['downloaded_bytes'] / 1e6:.1f} MB, "
+                    f"{self.throughput('download', 'downloaded_bytes'):.1f} MB/s)"
+                )
+            elif name == "extract" and self.counts.get("extracted_bytes"):
+                part += (
+                    f" ({self.counts.get('extracted_members', 0)} members, "
+                    f"{self.counts['extracted_bytes'] / 1e6:.1f} MB)"
+                )
+            parts.append(part)
+        return "MECA Bundle timings: " + ", ".join(parts)
@@ -0,0 +1,233 @@
+"""
+Background prefetch of MECA bundles into a store shared with build pods.
+
+When `MecaRepoProvider` resolves a bundle it can start downloading it into a
+node-local or PVC-backed directory while the build pod is being scheduled.
+`MecaContentProvider` then finds the bundle already present under the slug
+it computes in `detect`, which is the same one the repo provider resolved
+for the 'url' and 'cloud' hash schemes. For the 'content' scheme both sides
+key the store by the URL based slug, as the content provider cannot know the
+content hash before fetching.
+
+Bundles are written to `<key>.part`, created exclusively so that concurrent
+prefetchers sharing a store do not download the same bundle twice, and
+renamed to `<key>.zip` once complete. Readers hold `pin` on a key while they
+use its bundle, and eviction skips pinned bundles.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from os import path
+
+# A partial download not written to for this long is considered abandoned
+PART_STALE_SECONDS = 60
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class PrefetchStore:
+    """A directory of complete bundles `<key>.zip` and in-flight `<key>.part`"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _name(self, key):
+        return _UNSAFE.sub("_", key)
+
+    def path(self, key):
+        return path.join(self.root, f"{self._name(key)}.zip")
+
+    def part_path(self, key):
+        return path.join(self.root, f"{self._name(key)}.part")
+
+    def pin_path(self, key):
+        return path.join(self.root, f"{self._name(key)}.pin")
+
+    @contextmanager
+    def pin(self, key):
+        """Keep the bundle for key from being evicted while in the block"""
+        try:
+            pin = open(self.pin_path(key), "a")
+        except OSError:
+            # e.g. a store mounted read-only in the build pod, nothing evicts
+            yield
+            return
+        with pin:
+            fcntl.flock(pin, fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(pin, fcntl.LOCK_UN)
+
+    def lookup(self, key):
+        """Return the path of the complete bundle for key, or None"""
+        filename = self.path(key)
+        if not path.exists(filename):
+            return None
+        try:
+            # the modification time orders eviction
+            os.utime(filename)
+        except OSError:
+            # e.g. a store mounted read-only in the build pod
+            pass
+        return filename
+
+    def in_progress(self, key, stale_after=PART_STALE_SECONDS):
+        try:
+            return time.time() - os.stat(self.part_path(key)).st_mtime < stale_after
+        except FileNotFoundError:
+            return False
+
+    def claim(self, key, stale_after=PART_STALE_SECONDS):
+        """Create `<key>.part` for writing, returning False if another download
+        of the bundle is in progress or the bundle is already present"""
+        if path.exists(self.path(key)):
+            return False
+        part = self.part_path(key)
+        for _ in range(2):
+            try:
+                os.close(os.open(part, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                if self.in_progress(key, stale_after):
+                    return False
+                try:
+                    os.remove(part)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def commit(self, key):
+        os.replace(self.part_path(key), self.path(key))
+
+    def abandon(self, key):
+        try:
+            os.remove(self.part_path(key))
+        except FileNotFoundError:
+            pass
+
+    def wait(self, key, timeout, poll=0.5):
+        """Return the bundle for key, waiting up to timeout seconds for a
+        prefetch in progress to complete"""
+        deadline = time.monotonic() + timeout
+        while True:
+            filename = self.lookup(key)
+            if filename is not None or not self.in_progress(key):
+                return filename
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def evict(self, max_bytes):
+        """Remove the least recently used bundles until the store fits max_bytes
+
+        Pinned bundles are kept.
+        """
+        bundles = []
+        for f in os.listdir(self.root):
+            if f.endswith(".zip"):
+                try:
+                    st = os.stat(path.join(self.root, f))
+                except FileNotFoundError:
+                    continue
+                bundles.append((st.st_mtime, st.st_size, f))
+        total = sum(size for _, size, _ in bundles)
+        evicted = 0
+        for _, size, f in sorted(bundles):
+            if total <= max_bytes:
+                break
+            with open(self.pin_path(f[: -len(".zip")]), "a") as pin:
+                try:
+                    fcntl.flock(pin, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    os.remove(path.join(self.root, f))
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(pin, fcntl.LOCK_UN)
+            total -= size
+            evicted += 1
+        return evicted
+
+
+class Prefetcher:
+    """Bounded background downloads of bundles into a `PrefetchStore`
+
+    At most `concurrency` downloads run at once and at most `max_pending` are
+    queued; further requests are dropped, as are bundles larger than
+    `max_bundle_bytes` when it is set. With `max_store_bytes` set, least
+    recently used bundles are evicted after each download.
+    """
+
+    def __init__(
+        self,
+        store,
+        concurrency=4,
+        max_pending=64,
+        max_bundle_bytes=0,
+        max_store_bytes=0,
+        log=None,
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_bundle_bytes = max_bundle_bytes
+        self.max_store_bytes = max_store_bytes
+        self.log = log or logging.getLogger(__name__)
+        self._semaphore = None
+        self._tasks = {}
+
+    def schedule(self, url, key, headers=None):
+        """Start prefetching url into the store under key, returning whether
+        a download was scheduled"""
+        if key in self._tasks or self.store.lookup(key) is not None:
+            return False
+        if len(self._tasks) >= self.max_pending:
+            self.log.info(f"Prefetch queue full, not prefetching {url}")
+            return False
+        size = (headers or {}).get("Content-Length")
+        if self.max_bundle_bytes and size and int(size) > self.max_bundle_bytes:
+            self.log.info(f"Bundle too large to prefetch ({size} bytes): {url}")
+            return False
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.ensure_future(self._prefetch(url, key))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return True
+
+    async def _prefetch(self, url, key):
+        from .asyncfetch import download_zipfile_async
+
+        async with self._semaphore:
+            if not self.store.claim(key):
+                return
+            try:
+                result = await download_zipfile_async(
+                    url,
+                    self.store.root,
+                    filename=path.basename(self.store.part_path(key)),
+                    user_agent="BinderHub",
+                )
+                self.store.commit(key)
+            except Exception as e:
+                self.store.abandon(key)
+                self.log.warning(f"Prefetch of {url} failed: {e}")
+                return
+            self.log.info(
+                f"Prefetched {url} ({result.bytes} bytes in {result.seconds:.1f}s)"
+            )
+            if self.max_store_bytes:
+                self.store.evict(self.max_store_bytes)
+
+    async def join(self):
+        """Wait for the scheduled downloads to finish"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
@@ -0,0 +1,239 @@
+"""
+Parallel, resumable byte-range downloads.
+
+When an origin advertises `Accept-Ranges: bytes`, a bundle is split into
+segments that are fetched concurrently and written at their offsets in a
+preallocated file. Progress is recorded next to the file in `<file>.ranges`,
+so a failed segment is retried from where it stopped and an interrupted
+download resumes from the partial file instead of starting again.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import ConnectionError, RequestException
+from urllib3.exceptions import HTTPError
+
+from .httppolicy import RETRY_STATUSES
+
+DEFAULT_RETRIES = 3
+
+# Smallest segment worth a separate request
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+
+# Progress is persisted after this many bytes land in a segment
+CHECKPOINT_BYTES = 8 * 1024 * 1024
+
+
+class RangeNotSupported(Exception):
+    """Raised when the origin stops honouring range requests for the bundle."""
+
+    pass
+
+
+def range_validator(headers):
+    """Return a validator usable in If-Range, preferring a strong ETag"""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def supports_ranges(headers):
+    return (
+        headers.get("Accept-Ranges", "").lower() == "bytes"
+        and headers.get("Content-Length") is not None
+    )
+
+
+def plan_segments(size, segments, min_segment_size=MIN_SEGMENT_SIZE):
+    """Split [0, size) into up to `segments` contiguous [start, end] ranges"""
+    if size <= 0:
+        return []
+    segments = max(1, min(segments, size // max(min_segment_size, 1) or 1))
+    step = -(-size // segments)
+    return [[start, min(start + step, size) - 1] for start in range(0, size, step)]
+
+
+class _Progress:
+    """Per-segment next-byte offsets, checkpointed to `<filename>.ranges`"""
+
+    def __init__(self, filename, size, validator, segments):
+        self.state_filename = f"{filename}.ranges"
+        self.size = size
+        self.validator = validator
+        self.lock = threading.Lock()
+        self.segments = self._load() or [
+            {"start": start, "end": end, "next": start} for start, end in segments
+        ]
+
+    def _load(self):
+        try:
+            with open(self.state_filename) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("size") != self.size or state.get("validator") != self.validator:
+            return None
+        return state["segments"]
+
+    def save(self):
+        with self.lock:
+            tmp = f"{self.state_filename}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(
+                    {
+                        "size": self.size,
+                        "validator": self.validator,
+                        "segments": self.segments,
+                    },
+                    f,
+                )
+            os.replace(tmp, self.state_filename)
+
+    def remove(self):
+        try:
+            os.remove(self.state_filename)
+        except FileNotFoundError:
+            pass
+
+
+def _read_chunk(raw, size):
+    """Read up to size bytes of a urllib3 response"""
+    # read1 hands over partial data, so progress survives a reset, but is new
+    # in urllib3 2; read waits for size bytes or the end of the body
+    read1 = getattr(raw, "read1", None)
+    if read1 is None:
+        return raw.read(size, decode_content=True)
+    return read1(size, decode_content=True)
+
+
+def _fetch_segment(
+    session,
+    url,
+    fd,
+    segment,
+    validator,
+    progress,
+    retries,
+    buffer_size,
+    on_progress,
+    policy,
+):
+    attempt = 0
+    since_checkpoint = 0
+    while segment["next"] <= segment["end"]:
+        headers = {"Range": f"bytes={segment['next']}-{segment['end']}"}
+        if validator:
+            headers["If-Range"] = validator
+        try:
+            # retried here rather than by the policy, from where the segment stopped
+            timeout = policy.get_timeout if policy is not None else None
+            with session.get(
+                url, headers=headers, stream=True, timeout=timeout
+            ) as resp:
+                if resp.status_code in RETRY_STATUSES:
+                    # a struggling origin, retried like a dropped connection
+                    resp.raise_for_status()
+                if resp.status_code != 206:
+                    raise RangeNotSupported(
+                        f"Range request answered with HTTP {resp.status_code}"
+                    )
+                while True:
+                    chunk = _read_chunk(resp.raw, buffer_size)
+                    if not chunk:
+                        break
+                    os.pwrite(fd, chunk, segment["next"])
+                    segment["next"] += len(chunk)
+                    since_checkpoint += len(chunk)
+                    if on_progress is not None:
+                        on_progress(len(chunk))
+                    if since_checkpoint >= CHECKPOINT_BYTES:
+                        progress.save()
+                        since_checkpoint = 0
+        except (RequestException, HTTPError, OSError) as e:
+            attempt += 1
+            progress.save()
+            if attempt > retries:
+                if isinstance(e, RequestException):
+                    raise
+                raise ConnectionError(
+                    f"Range {segment['next']}-{segment['end']} failed: {e}"
+                ) from e
+            if policy is not None:
+                time.sleep(policy.delay(attempt - 1))
+            else:
+                time.sleep(min(0.1 * 2**attempt, 5))
+        else:
+            # a short 206 body is retried from wherever it stopped
+            if segment["next"] <= segment["end"]:
+                attempt += 1
+                if attempt > retries:
+                    raise RangeNotSupported("Range response ended early")
+
+
+def download_ranged(
+    session,
+    url,
+    filename,
+    size,
+    validator=None,
+    segments=4,
+    retries=DEFAULT_RETRIES,
+    buffer_size=1024 * 1024,
+    min_segment_size=MIN_SEGMENT_SIZE,
+    on_progress=None,
+    policy=None,
+):
+    """Download `size` bytes of `url` into filename using concurrent range requests
+
+    Segments that fail, or are answered with a 429 or 5xx status, are retried
+    individually up to `retries` times. If the call fails or is interrupted, calling it again with the same filename, size and
+    validator resumes from the partial file. `on_progress` is called from the
+    segment threads with each number of bytes written. The timeouts and
+    backoff of `policy`, a `RequestPolicy`, apply to each range request.
+    """
+    progress = _Progress(
+        filename, size, validator, plan_segments(size, segments, min_segment_size)
+    )
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT)
+    try:
+        if os.fstat(fd).st_size != size:
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    os.ftruncate(fd, size)
+            else:
+                os.ftruncate(fd, size)
+
+        pending = [s for s in progress.segments if s["next"] <= s["end"]]
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                futures = [
+                    pool.submit(
+                        _fetch_segment,
+                        session,
+                        url,
+                        fd,
+                        segment,
+                        validator,
+                        progress,
+                        retries,
+                        buffer_size,
+                        on_progress,
+                        policy,
+                    )
+                    for segment in pending
+                ]
+                for future in futures:
+                    future.result()
+    finally:
+        os.close(fd)
+        progress.save()
+
+    progress.remove()
+    return size
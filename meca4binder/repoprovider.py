@@ -1,12 +1,32 @@
+import os
 import re
+import time
 import validators as val
+from hashlib import md5
 from urllib.parse import urlparse, unquote, urlencode, quote
 from .baseprovider import RepoProvider
 from tornado.httpclient import AsyncHTTPClient, HTTPRequest
-from traitlets import List, Unicode, Bool, default
-from .utils import get_hashed_slug
+from traitlets import List, Unicode, Bool, CaselessStrEnum, Float, Integer, default
+from .budget import BudgetExceeded, FetchBudget
+from .httppolicy import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_HEAD_TIMEOUT,
+    DEFAULT_RETRIES,
+    LatencyWindow,
+    RequestPolicy,
+)
+from .metrics import emit
+from .prefetch import Prefetcher, PrefetchStore
+from .resolvecache import ResolutionCache
+from .utils import HASH_SCHEMES, get_content_slug, get_slug, strip_url
+from .validate import InvalidBundle, RangesUnavailable, validate_remote_bundle
 from urllib.parse import urlparse, urlunparse
 
+# Shared by every provider instance in the BinderHub process
+_resolution_cache = ResolutionCache()
+_head_latencies = LatencyWindow()
+_prefetchers = {}
+
 
 class MecaRepoProvider(RepoProvider):
     """BinderHub Provider that can handle the contents of a MECA bundle
@@ -38,8 +58,17 @@ class MecaRepoProvider(RepoProvider):
         "label_prop_disabled": True,
     }
 
-    validate_bundle = Bool(config=True, help="Validate the file as MECA Bundle").tag(
-        default=True
+    validate_bundle = Bool(
+        False,
+        config=True,
+        help="""Validate the file as MECA Bundle during get_resolved_ref
+
+        The zip central directory and manifest.xml are read with a few range
+        requests, and bundles that are not zip files, have no well formed
+        manifest or lack the article-source-directory it names are rejected
+        before a build is scheduled. Bundles on origins that do not serve
+        byte ranges are not validated.
+        """,
     )
 
     allowed_origins = List(
@@ -52,6 +81,144 @@ class MecaRepoProvider(RepoProvider):
         """,
     )
 
+    resolve_cache_ttl = Float(
+        0,
+        config=True,
+        help="""Seconds to reuse the result of the HEAD request made by get_resolved_ref
+
+        The cache is shared by all providers in the process and keyed by the
+        URL without its query string. Concurrent resolutions of the same URL
+        always share one request; set a TTL to also reuse the result for
+        subsequent launches.
+        """,
+    )
+
+    resolve_cache_size = Integer(
+        1024,
+        config=True,
+        help="""Maximum number of URLs held in the resolution cache""",
+    )
+
+    hash_scheme = CaselessStrEnum(
+        list(HASH_SCHEMES),
+        config=True,
+        help="""How the build slug, and so the image name, is derived
+
+        - 'url': hash of the URL (without query string) and its ETag or
+          Content-Length. Moving a bundle changes its image.
+        - 'cloud': the MD5 advertised by the origin in Content-MD5, x-goog-hash
+          or a plain MD5 ETag, so identical bundles share an image across hosts
+          and buckets. Falls back to 'url' if no MD5 is advertised.
+        - 'content': MD5 of the bundle bytes, which downloads the whole bundle
+          during resolution.
+
+        Defaults to the MECA_HASH_SCHEME environment variable, or 'url'.
+        """,
+    )
+
+    @default("hash_scheme")
+    def _hash_scheme_default(self):
+        return os.environ.get("MECA_HASH_SCHEME", "url")
+
+    content_hash_timeout = Float(
+        600,
+        config=True,
+        help="""Seconds allowed for downloading a bundle to hash it when
+        hash_scheme is 'content'""",
+    )
+
+    metrics_hooks = List(
+        config=True,
+        help="""Metrics hooks receiving the duration of each get_resolved_ref
+
+        Each hook is a callable taking (name, value, labels) or an object with
+        an `observe(name, value, labels)` method, such as
+        `meca4binder.metrics.PrometheusHook()`. Resolutions are observed as
+        `meca_resolve_seconds` labelled with the hash scheme and result.
+        """,
+    )
+
+    prefetch_dir = Unicode(
+        "",
+        config=True,
+        help="""Directory to prefetch resolved bundles into
+
+        When set, get_resolved_ref starts a background download of the bundle
+        into this directory, which should be shared with build pods (e.g. a
+        hostPath or PVC mounted at MECA_PREFETCH_DIR), so that
+        MecaContentProvider finds it already downloaded.
+        """,
+    )
+
+    prefetch_concurrency = Integer(
+        4,
+        config=True,
+        help="""Maximum number of bundles prefetched at once""",
+    )
+
+    prefetch_max_pending = Integer(
+        64,
+        config=True,
+        help="""Maximum number of prefetches queued, further ones are dropped""",
+    )
+
+    prefetch_max_bundle_bytes = Integer(
+        0,
+        config=True,
+        help="""Bundles larger than this are not prefetched (0 for no limit)""",
+    )
+
+    prefetch_max_store_bytes = Integer(
+        0,
+        config=True,
+        help="""Size cap of prefetch_dir, least recently used bundles are
+        evicted first (0 for no limit)""",
+    )
+
+    max_bundle_bytes = Integer(
+        0,
+        config=True,
+        help="""Reject bundles whose Content-Length is larger than this at
+        resolution, before a build is scheduled (0 for no limit). Match
+        MECA_MAX_DOWNLOAD_BYTES on the build pods.""",
+    )
+
+    http_connect_timeout = Float(
+        DEFAULT_CONNECT_TIMEOUT,
+        config=True,
+        help="""Seconds allowed for connecting to the origin""",
+    )
+
+    http_head_timeout = Float(
+        DEFAULT_HEAD_TIMEOUT,
+        config=True,
+        help="""Seconds allowed for each HEAD request made by get_resolved_ref""",
+    )
+
+    http_retries = Integer(
+        DEFAULT_RETRIES,
+        config=True,
+        help="""Times a HEAD request is retried after a connection error,
+        timeout or 429/5xx response, with jittered exponential backoff""",
+    )
+
+    http_hedge_after = Float(
+        0,
+        config=True,
+        help="""Seconds after which an unanswered HEAD request is raced
+        against a second one, the first answer winning (0 not to hedge)""",
+    )
+
+    http_hedge_percentile = Float(
+        0,
+        config=True,
+        help="""Hedge HEAD requests taking longer than this percentile (e.g. 95)
+        of the recent HEAD latencies in the process (0 not to hedge)
+
+        With http_hedge_after also set, the shorter delay applies.
+        """,
+    )
+
     @default("allowed_origins")
     def _allowed_origins_default(self):
         return []
@@ -75,19 +242,115 @@ class MecaRepoProvider(RepoProvider):
         self.log.info(f"MECA Bundle URL: {self.url}")
         self.log.info(f"MECA Bundle raw spec: {self.spec}")
 
+    async def _content_md5(self):
+        """Download the bundle and return its MD5, without holding it in memory"""
+        hasher = md5()
+        client = AsyncHTTPClient(force_instance=True, max_body_size=2**63 - 1)
+        req = HTTPRequest(
+            self.url,
+            method="GET",
+            user_agent="BinderHub",
+            streaming_callback=hasher.update,
+            request_timeout=self.content_hash_timeout,
+        )
+        try:
+            await client.fetch(req)
+        finally:
+            client.close()
+        return hasher.hexdigest()
+
+    def _request_policy(self):
+        return RequestPolicy(
+            connect_timeout=self.http_connect_timeout,
+            head_timeout=self.http_head_timeout,
+            retries=self.http_retries,
+            hedge_after=self.http_hedge_after,
+            hedge_percentile=self.http_hedge_percentile,
+            latencies=_head_latencies,
+        )
+
+    async def _resolve(self):
+        client = AsyncHTTPClient()
+        r = await self._request_policy().head_async(
+            client, self.url, user_agent="BinderHub"
+        )
+        if self.validate_bundle:
+            await self._validate(client, r.headers)
+        content_md5 = None
+        if self.hash_scheme == "content":
+            content_md5 = await self._content_md5()
+        return r.headers, content_md5
+
+    async def _validate(self, client, headers):
+        try:
+            result = await validate_remote_bundle(
+                client, self.url, headers, user_agent="BinderHub"
+            )
+        except RangesUnavailable as e:
+            self.log.info(f"Not validating MECA bundle {self.url}: {e}")
+            return
+        self.log.info(
+            f"Validated MECA bundle {self.url}, article source directory "
+            f"{result.article_source_dir}, with {result.requests} range "
+            f"requests ({result.bytes} bytes)"
+        )
+
+    def _prefetch(self, headers):
+        prefetcher = _prefetchers.get(self.prefetch_dir)
+        if prefetcher is None:
+            prefetcher = _prefetchers[self.prefetch_dir] = Prefetcher(
+                PrefetchStore(self.prefetch_dir), log=self.log
+            )
+        prefetcher.concurrency = self.prefetch_concurrency
+        prefetcher.max_pending = self.prefetch_max_pending
+        prefetcher.max_bundle_bytes = self.prefetch_max_bundle_bytes
+        prefetcher.max_store_bytes = self.prefetch_max_store_bytes
+        # the key MecaContentProvider.detect computes, see meca4binder.prefetch
+        key = get_slug(self.url, headers, self.hash_scheme)
+        if prefetcher.schedule(self.url, key, headers):
+            self.log.info(f"Prefetching {self.url} into {self.prefetch_dir}")
+
     async def get_resolved_ref(self):
         # Check the URL is reachable
-        client = AsyncHTTPClient()
-        req = HTTPRequest(self.url, method="HEAD", user_agent="BinderHub")
+        _resolution_cache.ttl = self.resolve_cache_ttl
+        _resolution_cache.max_size = self.resolve_cache_size
         self.log.info(f"get_resolved_ref() HEAD: {self.url}")
+        start = time.perf_counter()
+        result = "error"
         try:
-            r = await client.fetch(req)
+            validated = ":validated" if self.validate_bundle else ""
+            headers, content_md5 = await _resolution_cache.get(
+                f"{self.hash_scheme}{validated}:{strip_url(self.url)}", self._resolve
+            )
             self.log.info(f"URL is reachable: {self.url}")
-            self.hashed_slug = get_hashed_slug(
-                self.url, r.headers.get("ETag") or r.headers.get("Content-Length")
+            size = headers.get("Content-Length")
+            FetchBudget(max_download_bytes=self.max_bundle_bytes).check_download_size(
+                int(size) if size else None, self.url
             )
+            if content_md5:
+                self.hashed_slug = get_content_slug(content_md5)
+            else:
+                self.hashed_slug = get_slug(self.url, headers, self.hash_scheme)
+            result = "ok"
+            if self.prefetch_dir:
+                self._prefetch(headers)
+        except BudgetExceeded as e:
+            result = "rejected"
+            raise ValueError(str(e))
+        except InvalidBundle as e:
+            result = "invalid"
+            raise ValueError(f"Not a valid MECA bundle ({e})")
         except Exception as e:
             raise ValueError(f"URL is unreachable ({e})")
+        finally:
+            elapsed = time.perf_counter() - start
+            self.log.info(f"get_resolved_ref() {result} in {elapsed:.3f}s")
+            emit(
+                "meca_resolve_seconds",
+                elapsed,
+                {"scheme": self.hash_scheme, "result": result},
+                self.metrics_hooks,
+            )
 
         self.log.info(f"hashed_slug: {self.hashed_slug}")
         return self.hashed_slug
@@ -0,0 +1,80 @@
+"""
+Process-wide cache for asynchronous bundle resolutions.
+
+Resolved values are kept for a configurable TTL in a bounded LRU. Concurrent
+lookups of a key that is not cached share a single in-flight resolution, so a
+burst of launches for the same bundle issues one request to the origin.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import partial
+
+_MISSING = object()
+
+
+class ResolutionCache:
+    """TTL + LRU cache with single-flight coalescing of async resolvers"""
+
+    def __init__(self, ttl=0, max_size=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires, value = entry
+        if expires <= self.clock():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _resolved(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
+
+    async def get(self, key, resolve):
+        """Return the cached value for key, or await `resolve()` to produce it
+
+        Failures are not cached. A caller being cancelled does not cancel the
+        shared resolution other callers are waiting on.
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(resolve())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._resolved, key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
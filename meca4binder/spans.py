@@ -0,0 +1,102 @@
+"""
+Bookkeeping for partially fetched files.
+
+Spans are sorted, disjoint [start, end) byte ranges. `SpanFile` is a seekable
+file holding only some spans of a larger file, fetched by the caller. A read
+outside them raises `MissingRange`, so the caller can fetch that range, e.g.
+with an async HTTP client, add it and retry. This lets `ZipFile` parse a
+remote archive from the few ranges it actually reads.
+"""
+
+import io
+
+
+class MissingRange(Exception):
+    """Raised by `SpanFile` for a read of bytes [start, end) it does not hold."""
+
+    def __init__(self, start, end):
+        super().__init__(f"bytes {start}-{end - 1} have not been fetched")
+        self.start = start
+        self.end = end
+
+
+def merge_span(spans, start, end):
+    """Add [start, end) to a sorted list of disjoint spans"""
+    merged = []
+    for s, e in spans:
+        if e < start or s > end:
+            merged.append([s, e])
+        else:
+            start, end = min(s, start), max(e, end)
+    merged.append([start, end])
+    return sorted(merged)
+
+
+def missing_spans(spans, start, end):
+    """Return the parts of [start, end) not covered by spans"""
+    missing = []
+    for s, e in spans:
+        if e <= start:
+            continue
+        if s >= end:
+            break
+        if s > start:
+            missing.append((start, s))
+        start = max(start, e)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+class SpanFile(io.RawIOBase):
+    """A read-only file of `size` bytes holding only the spans added to it"""
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+        self._spans = []
+        self._chunks = []
+        self._pos = 0
+
+    def add(self, start, data):
+        """Add bytes data read from offset start"""
+        self._chunks.append((start, bytes(data)))
+        self._spans = merge_span(self._spans, start, start + len(data))
+
+    def missing(self, start, end):
+        return missing_spans(self._spans, start, min(end, self.size))
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def readinto(self, b):
+        end = min(self._pos + len(b), self.size)
+        if end <= self._pos:
+            return 0
+        missing = self.missing(self._pos, end)
+        if missing:
+            raise MissingRange(*missing[0])
+        view = memoryview(b)
+        for start, data in self._chunks:
+            lo, hi = max(start, self._pos), min(start + len(data), end)
+            if lo < hi:
+                view[lo - self._pos : hi - self._pos] = data[lo - start : hi - start]
+        n = end - self._pos
+        self._pos = end
+        return n
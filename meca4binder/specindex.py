@@ -0,0 +1,140 @@
+"""
+Precompiled indexes over the spec patterns in RepoProvider configuration.
+
+`banned_specs`, `high_quota_specs` and `spec_config` hold regex strings that
+are matched case-insensitively against the spec of every launch. The indexes
+here compile each list once, shared by every provider instance configured
+with the same list object, and remember the answer for specs seen before.
+"""
+
+import re
+from functools import lru_cache
+
+# Specs remembered per index
+MEMO_SIZE = 4096
+
+# Patterns whose meaning changes when numbered into a combined alternation
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+# Global inline flags, e.g. (?x), which before Python 3.11 only warn when not
+# at the start and then apply to every pattern of a combined alternation
+_GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+
+
+def _compile(pattern):
+    if not isinstance(pattern, str):
+        raise ValueError(
+            f"Spec pattern expected a regex pattern string, not type {type(pattern)}"
+        )
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid spec pattern {pattern!r}: {e}") from e
+
+
+def _combine(compiled):
+    """Return one regex matching where any of `compiled` matches, or None
+    if the patterns cannot be safely joined into a single alternation"""
+    if not compiled:
+        return None
+    for c in compiled:
+        if c.groups and _BACKREFERENCE.search(c.pattern):
+            return None
+        if _GLOBAL_FLAGS.search(c.pattern):
+            return None
+    try:
+        return re.compile("|".join(f"(?:{c.pattern})" for c in compiled), re.IGNORECASE)
+    except re.error:
+        # e.g. repeated group names
+        return None
+
+
+class SpecPatternIndex:
+    """Answers whether a spec matches any of a list of patterns"""
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.compiled = [_compile(p) for p in self.patterns]
+        self.combined = _combine(self.compiled)
+        self.matches = lru_cache(maxsize=MEMO_SIZE)(self._matches)
+
+    def _matches(self, spec):
+        if self.combined is not None:
+            return self.combined.match(spec) is not None
+        return any(c.match(spec) for c in self.compiled)
+
+
+class SpecConfigIndex:
+    """Merges the config of every `spec_config` item whose pattern matches a spec"""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.compiled = []
+        for item in self.items:
+            if not isinstance(item, dict):
+                raise ValueError("Spec-pattern configuration expected a list of dicts")
+            pattern = item.get("pattern", None)
+            config = item.get("config", None)
+            if not isinstance(pattern, str):
+                raise ValueError(
+                    "Spec-pattern configuration expected "
+                    "a regex pattern string, not "
+                    f"type {type(pattern)}"
+                )
+            if not isinstance(config, dict):
+                raise ValueError(
+                    "Spec-pattern configuration expected "
+                    "a specification configuration dict, not "
+                    f"type {type(config)}"
+                )
+            self.compiled.append((_compile(pattern), config))
+        # cheap rejection of the common case of a spec matching no item
+        self.any = SpecPatternIndex(c.pattern for c, _ in self.compiled)
+        self._config = lru_cache(maxsize=MEMO_SIZE)(self._merge)
+
+    def _merge(self, spec):
+        config = {}
+        if self.any.matches(spec):
+            for compiled, item_config in self.compiled:
+                if compiled.match(spec):
+                    config.update(item_config)
+        return config
+
+    def config(self, spec):
+        """Return the merged config for spec, safe for the caller to modify"""
+        return dict(self._config(spec))
+
+
+@lru_cache(maxsize=32)
+def spec_pattern_index(patterns):
+    """Return the shared index for a tuple of patterns"""
+    return SpecPatternIndex(patterns)
+
+
+# Indexes of the lists they were built from, by id; the lists are kept
+# referenced so that their ids are not reused
+_list_indexes = {}
+
+
+def _list_index(value, build):
+    entry = _list_indexes.get(id(value))
+    if entry is None or entry[0] is not value:
+        entry = (value, build(value))
+        if len(_list_indexes) >= 64:
+            _list_indexes.clear()
+        _list_indexes[id(value)] = entry
+    return entry[1]
+
+
+def spec_pattern_list_index(patterns):
+    """Return the shared index for a list of patterns, looked up by identity"""
+    return _list_index(patterns, lambda p: spec_pattern_index(tuple(p)))
+
+
+def spec_config_index(items):
+    """Return the shared index for a list of spec_config items
+
+    Indexes are looked up by the identity of the list, without comparing its
+    items, so a list changed in place is not seen until it is assigned again.
+    """
+    return _list_index(items, SpecConfigIndex)
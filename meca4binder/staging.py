@@ -0,0 +1,231 @@
+"""
+Single-flight fetches of a bundle shared by the processes on a build node.
+
+During a launch storm several repo2docker processes, on one node or in pods
+sharing a volume, fetch the same bundle at once. With a `StagingArea`, the
+first to take the bundle's lock fetches and unpacks it into a work directory
+in the staging area and publishes it with a rename; the others wait and copy
+the published tree instead of downloading it again.
+
+The lock is a file created with O_EXCL, which works on network filesystems
+where flock may not. Its holder touches it every `heartbeat` seconds, and a
+lock that has not been touched for `stale_after` seconds is broken, so a
+crashed or hung holder only delays the others. Work directories are only
+visible to readers once renamed into place, so a crash never leaves a
+half-written bundle behind, and leftovers are removed by the next holder.
+
+The holder fetches into its own output directory and publishes hard links
+to those files where the staging area is on the same filesystem, so it
+does not pay for a second copy of the bundle.
+"""
+
+import json
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+from os import path
+
+# A lock not touched for this long belongs to a crashed or hung process
+LOCK_STALE_SECONDS = 60
+
+# Published bundles not used for this long are removed
+DEFAULT_TTL = 3600
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def copy_tree(src, dst, link=False):
+    """Copy the files under src into dst, merging with what is there
+
+    With `link`, files are hard linked rather than copied, falling back to
+    copies if src and dst are on different filesystems.
+    """
+    for dirpath, _, filenames in os.walk(src):
+        target = path.join(dst, path.relpath(dirpath, src))
+        os.makedirs(target, exist_ok=True)
+        for name in filenames:
+            source = path.join(dirpath, name)
+            destination = path.join(target, name)
+            if link:
+                try:
+                    os.link(source, destination)
+                    continue
+                except FileExistsError:
+                    os.remove(destination)
+                    os.link(source, destination)
+                    continue
+                except OSError:
+                    link = False
+            shutil.copy2(source, destination)
+
+
+class StagedBundle:
+    """A published bundle: the unpacked `tree` and what the fetch recorded"""
+
+    def __init__(self, root, meta):
+        self.root = root
+        self.tree = path.join(root, "tree")
+        self.meta = meta
+
+
+class StagingLock:
+    """A held lock on a key, kept fresh by a heartbeat thread until released"""
+
+    def __init__(self, filename, token, heartbeat):
+        self.filename = filename
+        self.token = token
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._beat, args=(heartbeat,), daemon=True
+        )
+        self._thread.start()
+
+    def _beat(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                os.utime(self.filename)
+            except FileNotFoundError:
+                # broken as stale by another process, whose result wins
+                return
+
+    def held(self):
+        try:
+            with open(self.filename) as f:
+                return f.read() == self.token
+        except FileNotFoundError:
+            return False
+
+    def release(self):
+        self._stop.set()
+        self._thread.join()
+        if self.held():
+            try:
+                os.remove(self.filename)
+            except FileNotFoundError:
+                pass
+
+
+class StagingArea:
+    """A directory of published bundles `<key>/` with their `<key>.lock`"""
+
+    def __init__(self, root, stale_after=LOCK_STALE_SECONDS, ttl=DEFAULT_TTL):
+        self.root = root
+        self.stale_after = stale_after
+        self.heartbeat = stale_after / 4
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def _name(self, key):
+        return _UNSAFE.sub("_", key)
+
+    def path(self, key):
+        return path.join(self.root, self._name(key))
+
+    def lock_path(self, key):
+        return path.join(self.root, f"{self._name(key)}.lock")
+
+    def lookup(self, key):
+        """Return the published `StagedBundle` for key, or None"""
+        root = self.path(key)
+        try:
+            with open(path.join(root, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            # the modification time orders expiry
+            os.utime(root)
+        except OSError:
+            pass
+        return StagedBundle(root, meta)
+
+    def in_progress(self, key):
+        try:
+            age = time.time() - os.stat(self.lock_path(key)).st_mtime
+        except FileNotFoundError:
+            return False
+        return age < self.stale_after
+
+    def try_lock(self, key):
+        """Return a `StagingLock` on key, or None if another process holds it"""
+        filename = self.lock_path(key)
+        token = f"{socket.gethostname()} {os.getpid()} {uuid.uuid4().hex}"
+        for _ in range(2):
+            try:
+                fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.in_progress(key):
+                    return None
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(token)
+            self._remove_leftovers(key)
+            return StagingLock(filename, token, self.heartbeat)
+        return None
+
+    def _remove_leftovers(self, key):
+        """Remove work directories of earlier holders of the lock on key"""
+        prefix = f".{self._name(key)}."
+        for f in os.listdir(self.root):
+            if f.startswith(prefix) and f.endswith(".tmp"):
+                shutil.rmtree(path.join(self.root, f), ignore_errors=True)
+
+    def work_dir(self, key):
+        """Create a directory for the lock holder to unpack key into
+
+        The bundle goes in its `tree` subdirectory.
+        """
+        work = path.join(self.root, f".{self._name(key)}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(path.join(work, "tree"))
+        return work
+
+    def publish(self, key, work, meta):
+        """Make the bundle in work visible to readers of key, returning it
+
+        If another holder published key first, as can happen after a lock
+        was wrongly broken as stale, its bundle is kept and work discarded.
+        """
+        with open(path.join(work, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(work, self.path(key))
+        except OSError:
+            shutil.rmtree(work, ignore_errors=True)
+        self.expire(keep=self._name(key))
+        return self.lookup(key)
+
+    def wait(self, key, timeout, poll=0.5):
+        """Return the bundle for key once published, or None if the lock is
+        free or timeout seconds pass first"""
+        deadline = time.monotonic() + timeout
+        while True:
+            staged = self.lookup(key)
+            if staged is not None or not self.in_progress(key):
+                return staged
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def expire(self, keep=None):
+        """Remove published bundles not used for ttl seconds"""
+        removed = 0
+        for f in os.listdir(self.root):
+            target = path.join(self.root, f)
+            if f == keep or f.startswith(".") or not path.isdir(target):
+                continue
+            try:
+                age = time.time() - os.stat(target).st_mtime
+            except FileNotFoundError:
+                continue
+            if age > self.ttl:
+                shutil.rmtree(target, ignore_errors=True)
+                removed += 1
+        return removed
@@ -0,0 +1,225 @@
+"""
+Streaming decoder for zip archives.
+
+Reads zip local file entries sequentially from a non-seekable stream (e.g. an
+HTTP response body) and writes members to disk as they arrive, so a MECA bundle
+can be extracted without first being written to disk as meca.zip.
+
+Only the subset of the format that can be decoded front-to-back is supported.
+Anything that needs the central directory raises `StreamingUnsupported` so the
+caller can fall back to downloading the archive and using `zipfile`.
+"""
+
+import os
+import struct
+import zlib
+from os import path
+from zipfile import BadZipFile
+
+from .extract import member_target
+
+LOCAL_FILE_HEADER = b"PK\x03\x04"
+CENTRAL_DIRECTORY_HEADER = b"PK\x01\x02"
+END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+ZIP64_END_OF_CENTRAL_DIRECTORY = b"PK\x06\x06"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+
+# signature, version, flags, method, time, date, crc, sizes, name/extra lengths
+LOCAL_FILE_HEADER_STRUCT = struct.Struct("<4sHHHHHLLLHH")
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class StreamingUnsupported(Exception):
+    """Raised when an archive cannot be decoded without central directory access."""
+
+    pass
+
+
+class _StreamReader:
+    """Minimal buffered reader with push-back over a raw file-like object"""
+
+    def __init__(self, raw, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self.pending = b""
+
+    def read(self, size):
+        """Read up to `size` bytes, returning b"" only at end of stream"""
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self.raw.read(min(size, self.chunk_size))
+
+    def read_exact(self, size):
+        parts = []
+        remaining = size
+        while remaining > 0:
+            data = self.read(remaining)
+            if not data:
+                raise BadZipFile("Unexpected end of stream in MECA bundle")
+            parts.append(data)
+            remaining -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+
+def _parse_zip64_extra(extra, usize, csize):
+    """Replace 32-bit sentinel sizes with their zip64 extra field values"""
+    while len(extra) >= 4:
+        tp, ln = struct.unpack("<HH", extra[:4])
+        if tp == ZIP64_EXTRA_ID:
+            data = extra[4 : 4 + ln]
+            if usize == ZIP64_LIMIT:
+                (usize,) = struct.unpack("<Q", data[:8])
+                data = data[8:]
+            if csize == ZIP64_LIMIT:
+                (csize,) = struct.unpack("<Q", data[:8])
+            return usize, csize, True
+        extra = extra[4 + ln :]
+    return usize, csize, False
+
+
+def _copy_stored(reader, dst, size, meter=None):
+    crc = 0
+    remaining = size
+    while remaining > 0:
+        data = reader.read(remaining)
+        if not data:
+            raise BadZipFile("Unexpected end of stream in MECA bundle")
+        crc = zlib.crc32(data, crc)
+        dst.write(data)
+        remaining -= len(data)
+        if meter is not None:
+            meter.output(len(data), size - remaining)
+    return crc, size
+
+
+def _copy_deflated(reader, dst, csize=None, meter=None):
+    """Inflate one member, reading until the deflate stream ends when csize is unknown
+
+    Output is produced at most chunk_size bytes at a time, so a highly
+    compressed member cannot inflate into memory all at once.
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    crc = 0
+    written = 0
+    consumed = 0
+    remaining = csize
+    while not decompressor.eof:
+        data = reader.read(remaining if remaining is not None else reader.chunk_size)
+        if not data:
+            raise BadZipFile("Unexpected end of stream in MECA bundle")
+        if remaining is not None:
+            remaining -= len(data)
+        consumed += len(data)
+        while True:
+            out = decompressor.decompress(data, reader.chunk_size)
+            data = decompressor.unconsumed_tail
+            crc = zlib.crc32(out, crc)
+            dst.write(out)
+            written += len(out)
+            if meter is not None:
+                meter.output(len(out), consumed - len(data))
+            if decompressor.eof or (not data and len(out) < reader.chunk_size):
+                break
+    if decompressor.unused_data:
+        reader.unread(decompressor.unused_data)
+    return crc, written
+
+
+def _read_data_descriptor(reader, zip64):
+    size_format = "<LQQ" if zip64 else "<LLL"
+    size = struct.calcsize(size_format)
+    head = reader.read_exact(4)
+    if head != DATA_DESCRIPTOR:
+        reader.unread(head)
+    crc, csize, usize = struct.unpack(size_format, reader.read_exact(size))
+    return crc, usize
+
+
+def stream_extract(raw, dst_dir, chunk_size=DEFAULT_CHUNK_SIZE, meter=None):
+    """Extract a zip archive read sequentially from `raw` into dst_dir
+
+    Returns the list of member names written. Raises `StreamingUnsupported`
+    before anything is written if the first entry is not a local file header,
+    and part way through if a later member cannot be decoded sequentially.
+    `meter`, a `budget.ExtractionMeter`, is told of each member and of the
+    bytes written as they are inflated.
+    """
+    reader = _StreamReader(raw, chunk_size)
+    names = []
+    while True:
+        signature = reader.read_exact(4)
+        if signature in (
+            CENTRAL_DIRECTORY_HEADER,
+            END_OF_CENTRAL_DIRECTORY,
+            ZIP64_END_OF_CENTRAL_DIRECTORY,
+        ):
+            break
+        if signature != LOCAL_FILE_HEADER:
+            raise StreamingUnsupported("unexpected record in zip stream")
+
+        (
+            _,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            csize,
+            usize,
+            name_length,
+            extra_length,
+        ) = LOCAL_FILE_HEADER_STRUCT.unpack(
+            signature + reader.read_exact(LOCAL_FILE_HEADER_STRUCT.size - 4)
+        )
+        raw_name = reader.read_exact(name_length)
+        extra = reader.read_exact(extra_length)
+        name = raw_name.decode("utf-8" if flags & FLAG_UTF8 else "cp437")
+        usize, csize, zip64 = _parse_zip64_extra(extra, usize, csize)
+
+        if flags & FLAG_ENCRYPTED:
+            raise StreamingUnsupported(f"{name} is encrypted")
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            raise StreamingUnsupported(f"{name} uses compression method {method}")
+        has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if has_descriptor and method == ZIP_STORED:
+            raise StreamingUnsupported(f"{name} is stored with a data descriptor")
+
+        if meter is not None:
+            meter.member(name)
+        target = member_target(dst_dir, name)
+        if name.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            dst = open(os.devnull, "wb")
+        else:
+            os.makedirs(path.dirname(target), exist_ok=True)
+            dst = open(target, "wb")
+        with dst:
+            if method == ZIP_STORED:
+                actual_crc, written = _copy_stored(reader, dst, csize, meter)
+            else:
+                actual_crc, written = _copy_deflated(
+                    reader, dst, None if has_descriptor else csize, meter
+                )
+        if has_descriptor:
+            crc, usize = _read_data_descriptor(reader, zip64)
+        if actual_crc != crc or written != usize:
+            raise BadZipFile(f"Bad CRC-32 or size for file {name!r} in MECA bundle")
+        names.append(name)
+
+    return names
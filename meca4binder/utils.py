@@ -1,12 +1,113 @@
+import base64
+import binascii
+import os
+import re
 from hashlib import md5
 from urllib.parse import urlparse, urlunparse
 
 
-def get_hashed_slug(url, changes_with_content):
-    """Return a unique slug tht is invariant to query parameters in the url"""
+def strip_url(url):
+    """Return the url without query parameters or fragment"""
     parsed_url = urlparse(url)
-    stripped_url = urlunparse(
+    return urlunparse(
         (parsed_url.scheme, parsed_url.netloc, parsed_url.path, "", "", "")
     )
 
+
+def get_hashed_slug(url, changes_with_content):
+    """Return a unique slug tht is invariant to query parameters in the url"""
+    stripped_url = strip_url(url)
+
     return "meca-" + md5(f"{stripped_url}-{changes_with_content}".encode()).hexdigest()
+
+
+HASH_SCHEMES = ("url", "cloud", "content")
+
+MD5_HEX_PATTERN = re.compile(r"^[0-9a-fA-F]{32}$")
+
+
+def _md5_from_base64(value):
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 16 else None
+
+
+def advertised_content_md5(headers):
+    """Return the hex MD5 the origin explicitly advertises for the response body
+
+    Only Content-MD5 and the md5 entry of x-goog-hash are considered, as
+    ETags are not guaranteed to be digests of the body.
+    """
+    content_md5 = headers.get("Content-MD5")
+    if content_md5:
+        digest = _md5_from_base64(content_md5)
+        if digest:
+            return digest
+
+    for part in (headers.get("x-goog-hash") or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name.lower() == "md5":
+            digest = _md5_from_base64(value)
+            if digest:
+                return digest
+
+    return None
+
+
+def canonical_content_md5(headers):
+    """Return the hex MD5 of the bundle as advertised by the response headers
+
+    Understands Content-MD5 (base64), the md5 entry of x-goog-hash and strong
+    ETags that are a plain quoted MD5 (S3, DigitalOcean Spaces, Backblaze).
+    Multipart S3 ETags ("<md5>-<parts>"), weak ETags and opaque ETags such as
+    Azure's "0x..." are not content digests, so None is returned.
+    """
+    digest = advertised_content_md5(headers)
+    if digest:
+        return digest
+
+    etag = headers.get("ETag") or ""
+    if not etag.startswith("W/"):
+        etag = etag.strip('"')
+        if MD5_HEX_PATTERN.match(etag):
+            return etag.lower()
+
+    return None
+
+
+def get_content_slug(content_md5):
+    """Return the location-independent slug for a bundle with the given MD5"""
+    return f"meca-b-{content_md5}"
+
+
+def get_slug(url, headers, hash_scheme="url"):
+    """Return the slug for the bundle at url from its response headers
+
+    With the "cloud" scheme the slug is derived from the MD5 advertised by the
+    origin, so the same bytes map to the same slug on any host. It falls back
+    to the URL based slug when no MD5 is advertised, as does the "content"
+    scheme until the bundle itself has been hashed.
+    """
+    if hash_scheme == "cloud":
+        content_md5 = canonical_content_md5(headers)
+        if content_md5:
+            return get_content_slug(content_md5)
+    return get_hashed_slug(url, headers.get("ETag") or headers.get("Content-Length"))
+
+
+def env_flag(name, default=False):
+    """Read a boolean setting from the environment"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name, default=None):
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
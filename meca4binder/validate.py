@@ -0,0 +1,215 @@
+"""
+Launch-time validation of remote MECA bundles.
+
+A bundle is checked before any build resources are spent on it by reading
+only the parts of the archive that describe it, with async range requests:
+the end of central directory record, the central directory and the
+`manifest.xml` member. The archive must be a zip file, its manifest must be
+well formed and name an article-source-directory, and the archive must hold
+files under that directory. For a typical bundle this is one or two requests
+and a few KB, however large the bundle is.
+
+Origins that do not serve byte ranges cannot be checked this way, and their
+bundles are left to be validated when they are fetched.
+"""
+
+import time
+
+from tornado.httpclient import HTTPRequest
+
+from .spans import MissingRange, SpanFile
+
+# Smallest range fetched, enough for the end of central directory record and
+# a maximal archive comment, and usually the whole central directory
+DEFAULT_BLOCK_SIZE = 64 * 1024 + 22
+
+DEFAULT_MAX_REQUESTS = 8
+
+# Larger manifests are rejected rather than fetched
+MAX_MANIFEST_BYTES = 1024 * 1024
+
+
+class InvalidBundle(ValueError):
+    """Raised when a remote bundle is not a valid MECA bundle."""
+
+    pass
+
+
+class RangesUnavailable(Exception):
+    """Raised when the origin does not serve the ranges needed to validate."""
+
+    pass
+
+
+class ValidationResult:
+    """Outcome of `validate_remote_bundle`"""
+
+    def __init__(self, manifest, article_source_dir, requests, nbytes, seconds):
+        self.manifest = manifest
+        self.article_source_dir = article_source_dir
+        self.requests = requests
+        self.bytes = nbytes
+        self.seconds = seconds
+
+
+class _RangeReader:
+    """Fills a `SpanFile` over the bundle at url with async range requests"""
+
+    def __init__(self, client, url, headers, block_size, max_requests, **request):
+        self.client = client
+        self.url = url
+        self.block_size = block_size
+        self.max_requests = max_requests
+        self.request = request
+        self.file = SpanFile(int(headers["Content-Length"]))
+        # the validator the HEAD response carried, so a bundle replaced
+        # between requests is not validated from a mix of two archives
+        etag = headers.get("ETag")
+        self.validator = (
+            etag if etag and not etag.startswith("W/") else headers.get("Last-Modified")
+        )
+        self.requests = 0
+        self.bytes = 0
+
+    async def fetch(self, start, end):
+        """Fetch [start, end) of the bundle, widened to block_size"""
+        size = self.file.size
+        start = max(0, min(start, size - self.block_size))
+        end = min(max(end, start + self.block_size), size)
+        if self.requests >= self.max_requests:
+            raise RangesUnavailable(
+                f"bundle needs more than {self.max_requests} range requests"
+            )
+        self.requests += 1
+
+        chunks = []
+        received = [0]
+
+        def on_chunk(chunk):
+            received[0] += len(chunk)
+            if received[0] > end - start:
+                # the origin ignored the range and is sending the whole bundle
+                raise RangesUnavailable("origin ignored the Range header")
+            chunks.append(chunk)
+
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        req = HTTPRequest(
+            self.url,
+            method="GET",
+            headers=headers,
+            streaming_callback=on_chunk,
+            **self.request,
+        )
+        resp = await self.client.fetch(req, raise_error=False)
+        self.bytes += received[0]
+        if resp.error is not None and resp.code not in (200, 206):
+            if isinstance(resp.error, RangesUnavailable):
+                raise resp.error
+            raise RangesUnavailable(f"range request failed ({resp.error})")
+        if resp.code != 206 or received[0] != end - start:
+            raise RangesUnavailable(
+                f"origin answered a range request with {resp.code}, "
+                f"{received[0]} of {end - start} bytes"
+            )
+        self.file.add(start, b"".join(chunks))
+
+    async def call(self, read):
+        """Return read(), fetching the ranges it needs until it succeeds"""
+        while True:
+            try:
+                return read()
+            except MissingRange as missing:
+                await self.fetch(missing.start, missing.end)
+
+
+def _member_end(zip_ref, info):
+    """Offset just past the local header and data of member info"""
+    offsets = [m.header_offset for m in zip_ref.infolist()]
+    later = [o for o in offsets if o > info.header_offset]
+    return min(later) if later else zip_ref.start_dir
+
+
+async def validate_remote_bundle(
+    client,
+    url,
+    headers,
+    block_size=DEFAULT_BLOCK_SIZE,
+    max_requests=DEFAULT_MAX_REQUESTS,
+    **request,
+):
+    """Check the bundle at `url` is a MECA bundle from a few range requests
+
+    `headers` are those of a HEAD response for the bundle, and `request` are
+    extra `HTTPRequest` arguments such as user_agent. Raises `InvalidBundle`
+    if the bundle is not a zip archive, has no well formed manifest.xml, or
+    has no files under the article-source-directory the manifest names.
+    Raises `RangesUnavailable` if the origin does not serve the ranges
+    needed. Returns a `ValidationResult`.
+    """
+    # imported here so the repo provider only loads the zip and XML parsers
+    # when validation is enabled
+    from zipfile import BadZipFile, ZipFile
+
+    from .manifest import MANIFEST_NAME, ManifestError, MecaManifest, source_dir_prefix
+
+    start = time.perf_counter()
+    if headers.get("Accept-Ranges", "").lower() != "bytes":
+        raise RangesUnavailable("origin does not advertise byte ranges")
+    if not headers.get("Content-Length"):
+        raise RangesUnavailable("origin does not advertise the bundle size")
+    if int(headers["Content-Length"]) == 0:
+        raise InvalidBundle("MECA bundle is empty")
+
+    reader = _RangeReader(client, url, headers, block_size, max_requests, **request)
+    size = reader.file.size
+    await reader.fetch(size - block_size, size)
+    try:
+        zip_ref = await reader.call(lambda: ZipFile(reader.file))
+    except BadZipFile as e:
+        raise InvalidBundle(f"MECA bundle is not a zip file ({e})") from e
+
+    with zip_ref:
+        try:
+            info = zip_ref.getinfo(MANIFEST_NAME)
+        except KeyError as e:
+            raise InvalidBundle(f"MECA bundle is missing {MANIFEST_NAME}") from e
+        if info.compress_size > MAX_MANIFEST_BYTES:
+            raise InvalidBundle(
+                f"{MANIFEST_NAME} is {info.compress_size} bytes, over the "
+                f"{MAX_MANIFEST_BYTES} byte limit"
+            )
+        # fetch the whole member at once rather than header first
+        member_end = _member_end(zip_ref, info)
+        if reader.file.missing(info.header_offset, member_end):
+            await reader.fetch(info.header_offset, member_end)
+        try:
+            manifest = await reader.call(lambda: MecaManifest.from_zip(zip_ref))
+        except (ManifestError, BadZipFile) as e:
+            raise InvalidBundle(str(e)) from e
+
+        article_source_dir = manifest.article_source_directory
+        if article_source_dir is None:
+            raise InvalidBundle(
+                f"{MANIFEST_NAME} does not list an article-source-directory"
+            )
+        try:
+            prefix = source_dir_prefix(article_source_dir)
+        except ManifestError as e:
+            raise InvalidBundle(str(e)) from e
+        if not any(
+            m.filename.startswith(prefix) and not m.is_dir() for m in zip_ref.infolist()
+        ):
+            raise InvalidBundle(
+                f"article-source-directory {article_source_dir} is not in "
+                "the MECA bundle"
+            )
+
+    return ValidationResult(
+        manifest,
+        article_source_dir,
+        reader.requests,
+        reader.bytes,
+        time.perf_counter() - start,
+    )
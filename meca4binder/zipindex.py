@@ -0,0 +1,167 @@
+"""
+Random access to a remote zip archive through HTTP range requests.
+
+`RangeFile` is a read-only, seekable file over a bundle URL. Byte ranges are
+fetched on demand and kept in a sparse local file, so `ZipFile` can read the
+central directory of a remote bundle with a couple of small requests, and
+members whose ranges were loaded up front can be decompressed locally.
+"""
+
+import io
+import tempfile
+from zipfile import ZipFile
+
+from .ranged import RangeNotSupported, range_validator
+from .spans import merge_span, missing_spans
+
+# Smallest range fetched for an uncovered read. ZipFile reads the end of
+# central directory record and then, for archives with a comment, the last
+# 64 KiB, so this usually covers both.
+DEFAULT_BLOCK_SIZE = 64 * 1024 + 22
+
+
+class RangeFile(io.RawIOBase):
+    """A read-only file over the archive at `url`, fetched with range requests
+
+    The first request reads the tail of the archive and learns its size and
+    validator. Later requests carry If-Range, so `RangeNotSupported` is
+    raised if the origin ignores ranges or the archive changes underneath.
+    `bytes_fetched` and `requests` count the transfer, and `on_progress` is
+    called with the size of each chunk received. Requests are made with the
+    timeouts and retries of `policy`, a `RequestPolicy`, if given.
+    """
+
+    def __init__(
+        self,
+        session,
+        url,
+        block_size=DEFAULT_BLOCK_SIZE,
+        buffer_size=1024 * 1024,
+        on_progress=None,
+        policy=None,
+    ):
+        super().__init__()
+        self.session = session
+        self.policy = policy
+        self.url = url
+        self.block_size = block_size
+        self.buffer_size = buffer_size
+        self.on_progress = on_progress
+        self.bytes_fetched = 0
+        self.requests = 0
+        self.validator = None
+        self.size = None
+        self._spans = []
+        self._pos = 0
+        self._store = tempfile.TemporaryFile()
+        try:
+            self._fetch(f"-{block_size}")
+        except Exception:
+            self._store.close()
+            raise
+
+    def _fetch(self, byte_range):
+        headers = {"Range": f"bytes={byte_range}", "Accept-Encoding": "identity"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        self.requests += 1
+        if self.policy is not None:
+            resp = self.policy.get(self.session, self.url, headers=headers, stream=True)
+        else:
+            resp = self.session.get(self.url, headers=headers, stream=True)
+        with resp:
+            resp.raise_for_status()
+            content_range = resp.headers.get("Content-Range", "")
+            if resp.status_code != 206 or not content_range.startswith("bytes "):
+                raise RangeNotSupported(
+                    f"Range request answered with HTTP {resp.status_code}"
+                )
+            span, _, size = content_range[len("bytes ") :].partition("/")
+            start, _, end = span.partition("-")
+            start, end = int(start), int(end) + 1
+            if self.size is None:
+                self.size = int(size)
+                self.validator = range_validator(resp.headers)
+                self._store.truncate(self.size)
+            elif int(size) != self.size:
+                raise RangeNotSupported("Archive changed between range requests")
+
+            offset = start
+            self._store.seek(offset)
+            for chunk in resp.iter_content(self.buffer_size):
+                self._store.write(chunk)
+                offset += len(chunk)
+                self.bytes_fetched += len(chunk)
+                if self.on_progress is not None:
+                    self.on_progress(len(chunk))
+            if offset != end:
+                raise RangeNotSupported("Range response ended early")
+        self._spans = merge_span(self._spans, start, end)
+
+    def load(self, start, end):
+        """Fetch [start, end) of the archive with as few requests as possible"""
+        end = min(end, self.size)
+        for s, e in missing_spans(self._spans, start, end):
+            self._fetch(f"{s}-{e - 1}")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def readinto(self, b):
+        end = min(self._pos + len(b), self.size)
+        if end <= self._pos:
+            return 0
+        for s, e in missing_spans(self._spans, self._pos, end):
+            self._fetch(f"{s}-{min(max(e, s + self.block_size), self.size) - 1}")
+        self._store.seek(self._pos)
+        n = self._store.readinto(memoryview(b)[: end - self._pos])
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._store.close()
+        super().close()
+
+
+def remote_zipfile(session, url, **kwargs):
+    """Return a `ZipFile` over the archive at `url` read through a `RangeFile`
+
+    Only the central directory is fetched up front. The `RangeFile` is kept
+    as the `range_file` attribute and must be closed along with the ZipFile.
+    """
+    range_file = RangeFile(session, url, **kwargs)
+    try:
+        zip_ref = ZipFile(range_file)
+    except Exception:
+        range_file.close()
+        raise
+    zip_ref.range_file = range_file
+    return zip_ref
+
+
+def member_spans(zip_ref):
+    """Return {name: (start, end)} byte ranges of each member of zip_ref
+
+    A member's range runs from its local header to the next member's, or to
+    the central directory for the last, so it includes any data descriptor.
+    """
+    members = sorted(zip_ref.infolist(), key=lambda m: m.header_offset)
+    ends = [m.header_offset for m in members[1:]] + [zip_ref.start_dir]
+    return {m.filename: (m.header_offset, end) for m, end in zip(members, ends)}
@@ -18,7 +18,11 @@ setup(
     include_package_data=True,
     install_requires=requirements,
     python_requires=">=3.7",
+    entry_points={
+        "console_scripts": ["meca4binder = meca4binder.cli:main"],
+    },
     extras_require={
+        "prometheus": ["prometheus_client"],
         "test": [
             "pytest",
             "pytest-watch",
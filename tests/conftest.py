@@ -0,0 +1,183 @@
+import io
+import socket
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from meca4binder.manifest import manifest_cache
+
+MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<manifest xmlns="https://manuscriptsexchange.org/schema/manifest" xmlns:xlink="http://www.w3.org/1999/xlink" manifest-version="1">
+  <item id="a-source" item-type="article-source-directory">
+    <instance media-type="application/x-directory" xlink:href="{source_dir}"/>
+  </item>
+  <item id="a-pdf" item-type="article-source">
+    <instance media-type="application/pdf" xlink:href="article.pdf"/>
+  </item>
+</manifest>
+"""
+
+
+def build_meca_zip(
+    files=None, source_dir="bundle/", manifest=True, href=None, **kwargs
+):
+    """Return the bytes of a small MECA bundle holding `files` under source_dir
+
+    The manifest points at `href`, which defaults to source_dir.
+    """
+    if files is None:
+        files = {
+            "index.md": b"# Hello MECA\n",
+            "notebooks/analysis.ipynb": b'{"cells": []}\n' * 100,
+            "data/values.csv": b"1,2,3\n" * 1000,
+        }
+    buf = io.BytesIO()
+    kwargs.setdefault("compression", zipfile.ZIP_DEFLATED)
+    with zipfile.ZipFile(buf, "w", **kwargs) as zf:
+        if manifest:
+            zf.writestr("manifest.xml", MANIFEST.format(source_dir=href or source_dir))
+        zf.writestr("article.pdf", b"%PDF-1.4 not really\n")
+        for name, data in files.items():
+            zf.writestr(f"{source_dir}{name}", data)
+    return buf.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def clear_manifest_cache():
+    """Bundles in different tests can share a slug, e.g. on a reused port"""
+    manifest_cache.clear()
+
+
+@pytest.fixture
+def meca_zip():
+    return build_meca_zip
+
+
+class Origin:
+    """Files, injected faults and request log for the local stand-in origin
+
+    Each entry in `faults` truncates one GET response body after that many
+    bytes and drops the connection. Each entry in `delays` holds up one
+    request for that many seconds, and each in `statuses` answers one request
+    with that error status. Set `ranges` to False to ignore Range requests.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.headers = {}
+        self.requests = []
+        self.faults = []
+        self.delays = []
+        self.statuses = []
+        self.ranges = True
+        self.lock = threading.Lock()
+
+    def add(self, path, data, headers=None):
+        self.files[path] = data
+        self.headers[path] = headers or {}
+
+    def _next(self, queue):
+        with self.lock:
+            return queue.pop(0) if queue else None
+
+    def next_fault(self):
+        return self._next(self.faults)
+
+
+def _parse_range(header, size):
+    start, _, end = header.split("=", 1)[1].partition("-")
+    if not start:
+        return max(0, size - int(end)), size - 1
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def _make_handler(origin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_headers(self, data, status=200, content_range=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(data)))
+            if origin.ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            if content_range:
+                self.send_header("Content-Range", content_range)
+            for k, v in origin.headers[self.path.split("?")[0]].items():
+                self.send_header(k, v)
+            self.end_headers()
+
+        def _lookup(self):
+            with origin.lock:
+                origin.requests.append((self.command, self.path, dict(self.headers)))
+            delay = origin._next(origin.delays)
+            status = origin._next(origin.statuses)
+            if delay:
+                time.sleep(delay)
+            if status is not None:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            data = origin.files.get(self.path.split("?")[0])
+            if data is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            return data
+
+        def do_HEAD(self):
+            data = self._lookup()
+            if data is not None:
+                self._send_headers(data)
+
+        def do_GET(self):
+            data = self._lookup()
+            if data is None:
+                return
+            etag = origin.headers[self.path.split("?")[0]].get("ETag")
+            if etag and self.headers["If-None-Match"] == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            if_range = self.headers["If-Range"]
+            if origin.ranges and self.headers["Range"] and if_range in (None, etag):
+                start, end = _parse_range(self.headers["Range"], len(data))
+                body = data[start : end + 1]
+                self._send_headers(body, 206, f"bytes {start}-{end}/{len(data)}")
+            else:
+                body = data
+                self._send_headers(body)
+
+            fault = origin.next_fault()
+            if fault is not None:
+                self.wfile.write(body[:fault])
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            self.wfile.write(body)
+
+    return Handler
+
+
+@pytest.fixture
+def origin():
+    """A local HTTP server serving the files registered on the yielded `Origin`"""
+    state = Origin()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
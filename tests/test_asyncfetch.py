@@ -0,0 +1,142 @@
+import asyncio
+import gzip
+import hashlib
+import inspect
+import os
+import time
+from base64 import b64encode
+
+import pytest
+from tornado.httpclient import HTTPClientError
+from tornado.simple_httpclient import SimpleAsyncHTTPClient, _HTTPConnection
+
+from meca4binder import MecaContentProvider
+from meca4binder.asyncfetch import (
+    _AsyncWriter,
+    _FlowControlledClient,
+    _FlowControlledConnection,
+    download_zipfile_async,
+)
+from meca4binder.download import IntegrityError
+
+# Largest body chunk tornado hands to a streaming callback
+READ_CHUNK = 64 * 1024
+
+
+@pytest.mark.asyncio
+async def test_download_zipfile_async(tmp_path, origin):
+    payload = os.urandom(3 * 1024 * 1024 + 17)
+    origin.add("/meca.zip", payload)
+    progress = []
+
+    result = await download_zipfile_async(
+        f"{origin.url}/meca.zip",
+        str(tmp_path),
+        hash_algorithms=["sha256"],
+        on_progress=progress.append,
+    )
+
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+    assert result.bytes == sum(progress) == len(payload)
+    assert result.method == "async"
+    assert result.digests == {"sha256": hashlib.sha256(payload).hexdigest()}
+
+
+@pytest.mark.asyncio
+async def test_download_zipfile_async_slow_disk_bounds_memory(
+    tmp_path, origin, monkeypatch
+):
+    payload = os.urandom(4 * 1024 * 1024)
+    origin.add("/meca.zip", payload)
+    buffered = []
+    write = _AsyncWriter._write
+
+    def slow_write(self, data):
+        buffered.append(len(data) + self._pending_bytes)
+        time.sleep(0.01)
+        write(self, data)
+
+    monkeypatch.setattr(_AsyncWriter, "_write", slow_write)
+    result = await download_zipfile_async(
+        f"{origin.url}/meca.zip", str(tmp_path), max_buffer=128 * 1024
+    )
+
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+    # a write in flight and the chunks batched since, each at most the buffer
+    # and the read chunk that filled it
+    assert max(buffered) <= 2 * (128 * 1024 + READ_CHUNK)
+    assert len(buffered) > 10
+
+
+def test_flow_control_hooks():
+    # _FlowControlledClient overrides these private parts of tornado
+    assert SimpleAsyncHTTPClient._connection_class(None) is _HTTPConnection
+    assert callable(getattr(_HTTPConnection, "_should_follow_redirect", None))
+    assert "streaming_callback" in inspect.getsource(_HTTPConnection.data_received)
+    client = _FlowControlledClient(force_instance=True)
+    try:
+        assert client._connection_class() is _FlowControlledConnection
+    finally:
+        client.close()
+
+
+@pytest.mark.asyncio
+async def test_download_zipfile_async_decodes_content_encoding(tmp_path, origin):
+    payload = b"bundle bytes" * 1000
+    origin.add("/meca.zip", gzip.compress(payload), {"Content-Encoding": "gzip"})
+
+    result = await download_zipfile_async(f"{origin.url}/meca.zip", str(tmp_path))
+
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+
+
+@pytest.mark.asyncio
+async def test_download_zipfile_async_checks_content_md5(tmp_path, origin):
+    wrong_md5 = b64encode(hashlib.md5(b"something else").digest()).decode()
+    origin.add("/meca.zip", b"bundle bytes", {"Content-MD5": wrong_md5})
+
+    with pytest.raises(IntegrityError):
+        await download_zipfile_async(f"{origin.url}/meca.zip", str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_download_zipfile_async_not_modified_and_missing(tmp_path, origin):
+    origin.add("/meca.zip", b"bundle bytes", {"ETag": '"v1"'})
+
+    result = await download_zipfile_async(
+        f"{origin.url}/meca.zip", str(tmp_path), headers={"If-None-Match": '"v1"'}
+    )
+    assert result.not_modified
+
+    with pytest.raises(HTTPClientError):
+        await download_zipfile_async(f"{origin.url}/missing.zip", str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_fetch_async_concurrently(tmp_path, origin, meca_zip):
+    for i in range(4):
+        origin.add(f"/{i}/meca.zip", meca_zip(files={f"file-{i}.txt": b"x" * i}))
+
+    async def fetch(i):
+        provider = MecaContentProvider()
+        provider.hash_scheme = "content"
+        spec = await provider.detect_async(
+            f"{origin.url}/{i}/meca.zip".replace("http", "http+meca", 1)
+        )
+        output_dir = tmp_path / str(i)
+        output_dir.mkdir()
+        output = [line async for line in provider.fetch_async(spec, str(output_dir))]
+        return provider, output
+
+    results = await asyncio.gather(*(fetch(i) for i in range(4)))
+
+    for i, (provider, output) in enumerate(results):
+        assert os.listdir(tmp_path / str(i)) == [f"file-{i}.txt"]
+        assert provider.content_id.startswith("meca-b-")
+        assert output[-1].endswith("fetched and unpacked.\n")
+    assert len({provider.content_id for provider, _ in results}) == 4
@@ -0,0 +1,84 @@
+import asyncio
+import io
+import os
+import zipfile
+
+from benchmarks.bundles import generate_bundle
+from benchmarks.importtime import TARGETS, measure
+from benchmarks.launch_storm import StormOrigin, percentiles, run_storm
+from benchmarks.pipeline import run_scenario
+from meca4binder.contentprovider import extract_validate_and_identify_bundle
+
+
+def test_generate_bundle_is_reproducible():
+    assert generate_bundle(members=5, seed=1) == generate_bundle(members=5, seed=1)
+    assert generate_bundle(members=5, seed=1) != generate_bundle(members=5, seed=2)
+
+
+def test_generate_bundle_nested_source_dir(tmp_path):
+    data = generate_bundle(
+        members=20, member_size=100, source_dir="article/source/", compression="stored"
+    )
+    zip_filename = tmp_path / "meca.zip"
+    zip_filename.write_bytes(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert all(i.compress_type == zipfile.ZIP_STORED for i in zf.infolist())
+
+    is_meca, bundle_dir = extract_validate_and_identify_bundle(
+        str(zip_filename), str(tmp_path / "out")
+    )
+
+    assert is_meca
+    assert bundle_dir == os.path.join(str(tmp_path / "out"), "article/source/")
+
+
+def test_run_scenario_reports_phases():
+    records = run_scenario(
+        "tiny", dict(members=5, member_size=1024), phases=("detect", "fetch"), repeat=1
+    )
+
+    assert [r["phase"] for r in records] == ["detect", "fetch"]
+    assert records[0]["median_mb_per_s"] is None
+    fetch = records[1]
+    assert fetch["median_seconds"] > 0
+    assert fetch["max_peak_rss_bytes"] > 0
+    assert set(fetch["runs"][0]) >= {"seconds", "peak_rss_bytes", "disk_write_bytes"}
+
+
+def test_each_side_imports_only_its_dependencies():
+    for target in TARGETS:
+        record = measure(target)
+        assert record["forbidden"] == [], target
+        assert record["median_ms"] > 0
+    assert measure("package")["modules"] == 1
+
+
+def test_percentiles_are_nearest_rank_in_ms():
+    assert percentiles([i / 1e3 for i in range(1, 101)]) == {
+        "p50": 50,
+        "p95": 95,
+        "p99": 99,
+    }
+    assert percentiles([]) == {"p50": None, "p95": None, "p99": None}
+
+
+def test_launch_storm_reports_latency_errors_and_lag():
+    with StormOrigin(latency=0.01, error_rate=0.2, etag="changing", seed=1) as origin:
+        report = asyncio.run(
+            run_storm(origin.url, 100, 20, distinct=100, config={"http_retries": 0})
+        )
+
+    assert 0 < report["ok"] < 100
+    assert report["ok"] + sum(report["errors"].values()) == 100
+    assert origin.requests == 100
+    assert 10 <= report["resolve_ms"]["p50"] <= report["resolve_ms"]["p99"]
+    assert report["loop_lag_ms"]["samples"] > 0
+    assert report["launches_per_second"] > 0
+
+
+def test_launch_storm_retries_ride_out_errors():
+    with StormOrigin(error_rate=0.2, seed=1) as origin:
+        report = asyncio.run(run_storm(origin.url, 50, 10, distinct=50))
+
+    assert report["ok"] >= 45
+    assert origin.requests > 50
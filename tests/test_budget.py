@@ -0,0 +1,158 @@
+import io
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+from requests import Session
+
+from meca4binder import (
+    MecaContentProvider,
+    MecaRepoProvider,
+    extract_validate_and_identify_bundle,
+)
+from meca4binder.budget import BudgetExceeded, FetchBudget, FetchSlots
+from meca4binder.cache import BundleCache
+from meca4binder.streamzip import stream_extract
+
+
+def zip_bomb(size=32 * 1024 * 1024, members=1, streamed=False):
+    """A bundle of `members` files of `size` zero bytes each, deflated
+
+    With `streamed` the archive is written to an unseekable stream, so sizes
+    only follow the data in data descriptors.
+    """
+
+    class Unseekable(io.RawIOBase):
+        def __init__(self):
+            self.buf = io.BytesIO()
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            return self.buf.write(b)
+
+    out = Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.xml", b"<manifest/>")
+        for i in range(members):
+            with zf.open(f"bundle/zeros-{i}.bin", "w") as f:
+                for _ in range(size // (1024 * 1024)):
+                    f.write(bytes(1024 * 1024))
+    return (out.buf if streamed else out).getvalue()
+
+
+def _fetch(provider, url, output_dir):
+    spec = provider.detect(url.replace("http", "http+meca", 1))
+    return list(provider.fetch(spec, str(output_dir)))
+
+
+def test_declared_ratio_and_members_are_rejected_before_extracting(tmp_path):
+    bomb = tmp_path / "bomb.zip"
+    bomb.write_bytes(zip_bomb())
+    out = tmp_path / "out"
+    out.mkdir()
+
+    with pytest.raises(BudgetExceeded, match="compressed more than"):
+        extract_validate_and_identify_bundle(
+            str(bomb), str(out), budget=FetchBudget(max_compression_ratio=100)
+        )
+    with pytest.raises(BudgetExceeded, match="expands to"):
+        extract_validate_and_identify_bundle(
+            str(bomb), str(out), budget=FetchBudget(max_uncompressed_bytes=2**20)
+        )
+    many = tmp_path / "many.zip"
+    many.write_bytes(zip_bomb(size=0, members=20))
+    with pytest.raises(BudgetExceeded, match="21 members"):
+        extract_validate_and_identify_bundle(
+            str(many), str(out), budget=FetchBudget(max_members=10)
+        )
+    assert os.listdir(out) == []
+
+
+def test_streamed_bomb_is_stopped_while_inflating(tmp_path):
+    bomb = zip_bomb(streamed=True)
+    budget = FetchBudget(max_uncompressed_bytes=4 * 1024 * 1024)
+
+    with pytest.raises(BudgetExceeded):
+        stream_extract(io.BytesIO(bomb), str(tmp_path), meter=budget.extraction_meter())
+    written = os.path.getsize(tmp_path / "bundle" / "zeros-0.bin")
+    assert written <= 5 * 1024 * 1024
+
+    budget = FetchBudget(max_compression_ratio=100)
+    with pytest.raises(BudgetExceeded, match="compressed more than"):
+        stream_extract(io.BytesIO(bomb), str(tmp_path), meter=budget.extraction_meter())
+
+
+def test_fetch_rejects_streamed_bomb(tmp_path, origin, monkeypatch):
+    origin.add("/meca.zip", zip_bomb(streamed=True))
+    monkeypatch.setenv("MECA_STREAM_EXTRACT", "1")
+    monkeypatch.setenv("MECA_MAX_COMPRESSION_RATIO", "100")
+
+    with pytest.raises(BudgetExceeded):
+        _fetch(MecaContentProvider(), f"{origin.url}/meca.zip", tmp_path)
+
+
+def test_download_size_is_checked_early_and_while_reading(tmp_path, origin):
+    origin.add("/meca.zip", os.urandom(300 * 1024))
+    url = f"{origin.url}/meca.zip"
+
+    provider = MecaContentProvider()
+    provider.budget = FetchBudget(max_download_bytes=100 * 1024)
+    with pytest.raises(BudgetExceeded, match="download limit"):
+        provider.detect(url.replace("http", "http+meca", 1))
+
+    cache = BundleCache(str(tmp_path))
+    meter = FetchBudget(max_download_bytes=100 * 1024).download_meter(url)
+    with pytest.raises(BudgetExceeded):
+        cache.fetch(Session(), url, buffer_size=16 * 1024, on_progress=meter)
+    assert os.listdir(tmp_path) == [f"{cache.key(url)}.lock"]
+
+
+def test_free_space_preflight(tmp_path, origin, meca_zip, monkeypatch):
+    origin.add("/meca.zip", meca_zip())
+    monkeypatch.setenv("MECA_MIN_FREE_BYTES", str(2**62))
+
+    with pytest.raises(BudgetExceeded, match="Not enough free space"):
+        _fetch(MecaContentProvider(), f"{origin.url}/meca.zip", tmp_path)
+    assert [r[0] for r in origin.requests] == ["HEAD"]
+
+
+def test_fetch_slots_queue_across_handles(tmp_path, origin, meca_zip, monkeypatch):
+    slots = FetchSlots(str(tmp_path / "slots"), 1)
+    held = slots.try_acquire()
+    assert slots.try_acquire() is None
+    with pytest.raises(BudgetExceeded, match="Timed out"):
+        slots.acquire(timeout=0.2, poll=0.05)
+
+    origin.add("/meca.zip", meca_zip())
+    monkeypatch.setenv("MECA_MAX_CONCURRENT_FETCHES", "1")
+    monkeypatch.setenv("MECA_FETCH_SLOTS_DIR", str(tmp_path / "slots"))
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    output = []
+    thread = threading.Thread(
+        target=lambda: output.extend(
+            _fetch(MecaContentProvider(), f"{origin.url}/meca.zip", output_dir)
+        )
+    )
+    thread.start()
+    time.sleep(1)
+    assert os.listdir(output_dir) == []
+    slots.release(held)
+    thread.join(timeout=30)
+
+    assert any("Waiting for one of the 1 MECA fetch slots" in l for l in output)
+    assert sorted(os.listdir(output_dir)) == ["data", "index.md", "notebooks"]
+    assert slots.try_acquire() is not None
+
+
+@pytest.mark.asyncio
+async def test_resolution_rejects_large_bundles(origin):
+    origin.add("/meca.zip", b"x" * 1000)
+    provider = MecaRepoProvider(spec=f"{origin.url}/meca.zip", max_bundle_bytes=100)
+
+    with pytest.raises(ValueError, match="download limit"):
+        await provider.get_resolved_ref()
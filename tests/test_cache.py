@@ -0,0 +1,126 @@
+import hashlib
+import os
+
+import pytest
+from requests import Session
+from meca4binder import MecaContentProvider
+from meca4binder.cache import BundleCache
+from meca4binder.download import IncompleteDownload
+
+
+def test_cache_miss_then_revalidated_hit(tmp_path, origin):
+    origin.add("/meca.zip", b"bundle-v1", {"ETag": '"v1"'})
+    cache = BundleCache(str(tmp_path))
+    session = Session()
+
+    zip_filename, hit = cache.fetch(session, f"{origin.url}/meca.zip?sig=1")
+    assert not hit
+    with open(zip_filename, "rb") as f:
+        assert f.read() == b"bundle-v1"
+
+    zip_filename, hit = cache.fetch(session, f"{origin.url}/meca.zip?sig=2")
+    assert hit
+    assert origin.requests[-1][2]["If-None-Match"] == '"v1"'
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "deltas": 0}
+
+
+def test_cache_replaces_changed_bundle(tmp_path, origin):
+    origin.add("/meca.zip", b"bundle-v1", {"ETag": '"v1"'})
+    cache = BundleCache(str(tmp_path))
+    cache.fetch(Session(), f"{origin.url}/meca.zip")
+
+    origin.add("/meca.zip", b"bundle-v2", {"ETag": '"v2"'})
+    zip_filename, hit = cache.fetch(Session(), f"{origin.url}/meca.zip")
+
+    assert not hit
+    with open(zip_filename, "rb") as f:
+        assert f.read() == b"bundle-v2"
+    assert cache.lookup(f"{origin.url}/meca.zip")["etag"] == '"v2"'
+
+
+def test_cache_evicts_least_recently_used(tmp_path, origin):
+    for name in ("a", "b", "c"):
+        origin.add(f"/{name}.zip", name.encode() * 100, {"ETag": f'"{name}"'})
+    cache = BundleCache(str(tmp_path), max_bytes=250)
+    session = Session()
+
+    cache.fetch(session, f"{origin.url}/a.zip")
+    cache.fetch(session, f"{origin.url}/b.zip")
+    cache.fetch(session, f"{origin.url}/a.zip")  # a is now most recently used
+    cache.fetch(session, f"{origin.url}/c.zip")
+
+    assert cache.lookup(f"{origin.url}/a.zip") is not None
+    assert cache.lookup(f"{origin.url}/b.zip") is None
+    assert cache.lookup(f"{origin.url}/c.zip") is not None
+    assert cache.stats()["evictions"] == 1
+    with open(os.path.join(tmp_path, "metrics.prom")) as f:
+        metrics = f.read()
+    assert "meca_bundle_cache_hits_total 1" in metrics
+    assert "meca_bundle_cache_misses_total 3" in metrics
+    assert "meca_bundle_cache_evictions_total 1" in metrics
+
+
+def test_fetch_uses_cache(tmp_path, origin, meca_zip):
+    origin.add("/meca.zip", meca_zip(), {"ETag": '"v1"'})
+    provider = MecaContentProvider()
+    provider.cache = BundleCache(str(tmp_path / "cache"))
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    os.makedirs(tmp_path / "first")
+    os.makedirs(tmp_path / "second")
+    list(provider.fetch(spec, str(tmp_path / "first")))
+    output = list(provider.fetch(spec, str(tmp_path / "second")))
+
+    assert any("skipping download" in line for line in output)
+    assert sorted(os.listdir(tmp_path / "second")) == ["data", "index.md", "notebooks"]
+
+
+def test_cache_digests(tmp_path, origin):
+    origin.add("/meca.zip", b"bundle-v1", {"ETag": '"v1"'})
+    cache = BundleCache(str(tmp_path))
+    url = f"{origin.url}/meca.zip"
+    cache.fetch(Session(), url, hash_algorithms=["sha256"])
+
+    assert cache.lookup(url)["digests"] == {
+        "sha256": hashlib.sha256(b"bundle-v1").hexdigest()
+    }
+    assert cache.digests(url, ["sha256", "md5"]) == {
+        "sha256": hashlib.sha256(b"bundle-v1").hexdigest(),
+        "md5": hashlib.md5(b"bundle-v1").hexdigest(),
+    }
+    assert "md5" in cache.lookup(url)["digests"]
+
+
+def test_cache_never_stores_truncated_bundle(tmp_path, origin, monkeypatch):
+    origin.add("/meca.zip", b"bundle-v1" * 100, {"ETag": '"v1"'})
+    cache = BundleCache(str(tmp_path))
+    url = f"{origin.url}/meca.zip"
+    # as if the download engine missed the truncation
+    monkeypatch.setattr("meca4binder.download._check_length", lambda *args: None)
+    origin.faults = [10]
+
+    with pytest.raises(IncompleteDownload):
+        cache.fetch(Session(), url)
+    assert cache.lookup(url) is None
+    assert not os.path.exists(os.path.join(tmp_path, f"{cache.key(url)}.part"))
+
+    zip_filename, hit = cache.fetch(Session(), url)
+    assert not hit
+    with open(zip_filename, "rb") as f:
+        assert f.read() == b"bundle-v1" * 100
+
+
+def test_pinned_bundle_is_not_evicted(tmp_path, origin):
+    for name in ("a", "b"):
+        origin.add(f"/{name}.zip", name.encode() * 100, {"ETag": f'"{name}"'})
+    cache = BundleCache(str(tmp_path), max_bytes=150)
+    session = Session()
+
+    with cache.pin(f"{origin.url}/a.zip"):
+        zip_filename, _ = cache.fetch(session, f"{origin.url}/a.zip")
+        cache.fetch(session, f"{origin.url}/b.zip")
+        assert os.path.exists(zip_filename)
+        assert cache.stats()["evictions"] == 0
+
+    assert cache.evict() == 1
+    assert not os.path.exists(zip_filename)
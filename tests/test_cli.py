@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from meca4binder.cli import main, prebuild
+from meca4binder.utils import get_content_slug
+
+
+@pytest.mark.asyncio
+async def test_prebuild_catalogue(tmp_path, origin, meca_zip):
+    urls = []
+    for i in range(24):
+        origin.add(f"/{i}/meca.zip", meca_zip(files={f"file-{i}.txt": b"x" * i}))
+        urls.append(f"{origin.url}/{i}/meca.zip")
+    urls.append(urls[0])
+    urls.append("https://elsewhere.example.com/meca.zip")
+
+    manifest = await prebuild(
+        urls,
+        concurrency=4,
+        allowed_origins=["127.0.0.1"],
+        output_dir=str(tmp_path),
+    )
+
+    bundles = manifest["bundles"]
+    assert [b["url"] for b in bundles] == urls
+    assert manifest["summary"]["ok"] == 25
+    assert bundles[-1]["status"] == "error"
+    assert "allowed origin" in bundles[-1]["error"]
+    assert bundles[-2]["slug"] == bundles[0]["slug"] and bundles[-2]["duplicate"]
+    for i, bundle in enumerate(bundles[:24]):
+        assert os.listdir(bundle["output_dir"]) == [f"file-{i}.txt"]
+        assert bundle["resolve_seconds"] >= 0 and bundle["fetch_seconds"] >= 0
+    gets = [r for r in origin.requests if r[0] == "GET"]
+    assert len(gets) == 24
+    assert manifest["summary"]["bundles_per_second"] > 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("into", ["output_dir", "cache_dir"])
+async def test_prebuild_content_scheme_downloads_once(tmp_path, origin, meca_zip, into):
+    data = meca_zip()
+    origin.add("/a/meca.zip", data)
+    origin.add("/b/meca.zip", data)
+    urls = [f"{origin.url}/a/meca.zip", f"{origin.url}/b/meca.zip"]
+
+    manifest = await prebuild(
+        urls, concurrency=1, hash_scheme="content", **{into: str(tmp_path)}
+    )
+
+    bundles = manifest["bundles"]
+    assert manifest["summary"]["ok"] == 2
+    assert bundles[0]["slug"] == get_content_slug(hashlib.md5(data).hexdigest())
+    assert bundles[1]["slug"] == bundles[0]["slug"]
+    gets = [r for r in origin.requests if r[0] == "GET"]
+    assert len(gets) == 2
+    if into == "output_dir":
+        assert bundles[1]["duplicate"]
+        assert os.listdir(tmp_path) == [bundles[0]["slug"]]
+
+
+def test_main_warms_cache_and_writes_manifest(tmp_path, origin, meca_zip):
+    origin.add("/a/meca.zip", meca_zip())
+    origin.add("/b/meca.zip", meca_zip(files={"b.txt": b"b"}))
+    url_list = tmp_path / "urls.txt"
+    url_list.write_text(
+        f"# issue 1\n{origin.url}/a/meca.zip\n\n{origin.url}/b/meca.zip\n"
+    )
+    cache_dir = tmp_path / "cache"
+    manifest_file = tmp_path / "manifest.json"
+
+    status = main(
+        [
+            str(url_list),
+            "--cache-dir",
+            str(cache_dir),
+            "--manifest",
+            str(manifest_file),
+        ]
+    )
+
+    assert status == 0
+    manifest = json.loads(manifest_file.read_text())
+    assert [b["slug"][:5] for b in manifest["bundles"]] == ["meca-", "meca-"]
+    assert all("output_dir" not in b for b in manifest["bundles"])
+    assert len(os.listdir(cache_dir)) >= 2
+
+    assert main([f"{origin.url}/missing.zip", "--manifest", str(manifest_file)]) == 1
@@ -1,4 +1,6 @@
+import pytest
 import os
+from hashlib import md5
 from meca4binder import MecaContentProvider, extract_validate_and_identify_bundle
 
 
@@ -43,3 +45,115 @@ def test_extract_and_validate_bundle():
 
 def test_copy_bundle():
     pass
+
+
+def write_zip(tmp_path, data):
+    zip_filename = str(tmp_path / "meca.zip")
+    with open(zip_filename, "wb") as f:
+        f.write(data)
+    return zip_filename
+
+
+@pytest.mark.parametrize(
+    "source_dir,href",
+    [
+        ("bundle/", "bundle/"),
+        ("nested/bundle/", "./nested/bundle"),
+        ("abs/bundle/", "/abs/bundle/"),
+    ],
+)
+def test_extract_selective(tmp_path, meca_zip, source_dir, href):
+    zip_filename = write_zip(tmp_path, meca_zip(source_dir=source_dir, href=href))
+    dst_dir = str(tmp_path / "unzip")
+
+    is_meca, bundle_dir = extract_validate_and_identify_bundle(
+        zip_filename, dst_dir, selective=True
+    )
+
+    assert is_meca
+    assert bundle_dir == os.path.join(dst_dir, source_dir)
+    assert sorted(os.listdir(bundle_dir)) == ["data", "index.md", "notebooks"]
+    assert not os.path.exists(os.path.join(dst_dir, "article.pdf"))
+    assert not os.path.exists(os.path.join(dst_dir, "manifest.xml"))
+
+
+@pytest.mark.parametrize("flatten", [False, True])
+def test_extract_selective_rejects_escaping_source_dir(tmp_path, meca_zip, flatten):
+    zip_filename = write_zip(tmp_path, meca_zip(href="../outside/"))
+    dst_dir = str(tmp_path / "unzip")
+
+    with pytest.raises(RuntimeError, match="outside the bundle"):
+        extract_validate_and_identify_bundle(
+            zip_filename, dst_dir, selective=True, flatten=flatten
+        )
+    assert not os.path.exists(tmp_path / "outside")
+
+
+def test_extract_selective_without_manifest(tmp_path, meca_zip):
+    zip_filename = write_zip(tmp_path, meca_zip(manifest=False))
+    dst_dir = str(tmp_path / "unzip")
+
+    is_meca, bundle_dir = extract_validate_and_identify_bundle(
+        zip_filename, dst_dir, selective=True
+    )
+
+    assert not is_meca
+    assert bundle_dir == dst_dir
+    assert os.path.exists(os.path.join(dst_dir, "article.pdf"))
+
+
+def test_content_id_from_content_hash(tmp_path, origin, meca_zip):
+    data = meca_zip()
+    origin.add("/meca.zip", data)
+    provider = MecaContentProvider()
+    provider.hash_scheme = "content"
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    list(provider.fetch(spec, str(tmp_path)))
+
+    assert provider.content_id == f"meca-b-{md5(data).hexdigest()}"
+
+
+def test_extract_flatten(tmp_path, meca_zip):
+    zip_filename = write_zip(tmp_path, meca_zip(source_dir="src/nested/"))
+    dst_dir = str(tmp_path / "unzip")
+
+    is_meca, bundle_dir = extract_validate_and_identify_bundle(
+        zip_filename, dst_dir, flatten=True
+    )
+
+    assert is_meca
+    assert bundle_dir == dst_dir
+    assert sorted(os.listdir(dst_dir)) == ["data", "index.md", "notebooks"]
+
+
+@pytest.mark.parametrize("scratch", ["tmp", "output", "direct"])
+@pytest.mark.parametrize("stream", [False, True])
+def test_fetch_scratch_policies(tmp_path, origin, meca_zip, scratch, stream):
+    origin.add("/meca.zip", meca_zip())
+    provider = MecaContentProvider()
+    provider.scratch = scratch
+    provider.stream_extract = stream
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    output = list(provider.fetch(spec, str(output_dir)))
+
+    assert sorted(os.listdir(output_dir)) == ["data", "index.md", "notebooks"]
+    with open(output_dir / "data" / "values.csv", "rb") as f:
+        assert f.read() == b"1,2,3\n" * 1000
+    if scratch != "tmp":
+        assert not any("Copying" in line for line in output)
+
+
+def test_fetch_logs_copy_fallback(tmp_path, origin, meca_zip, monkeypatch, caplog):
+    origin.add("/meca.zip", meca_zip())
+    monkeypatch.setattr("meca4binder.contentprovider._same_device", lambda a, b: False)
+    provider = MecaContentProvider()
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    output = list(provider.fetch(spec, str(tmp_path)))
+
+    assert any("Copying" in line for line in output)
+    assert "different filesystems" in caplog.text
@@ -0,0 +1,165 @@
+import os
+import zipfile
+
+import pytest
+from requests import Session
+
+from meca4binder import MecaContentProvider
+from meca4binder.delta import coalesce, plan_delta
+from meca4binder.zipindex import RangeFile, remote_zipfile
+
+
+def _tree(root):
+    tree = {}
+    for dirpath, _, filenames in os.walk(root):
+        for f in filenames:
+            filename = os.path.join(dirpath, f)
+            with open(filename, "rb") as fp:
+                tree[os.path.relpath(filename, root)] = fp.read()
+    return tree
+
+
+def _fetch(tmp_path, url, name):
+    provider = MecaContentProvider()
+    spec = provider.detect(url.replace("http", "http+meca", 1))
+    output_dir = tmp_path / name
+    output_dir.mkdir()
+    output = list(provider.fetch(spec, str(output_dir)))
+    return provider, output, _tree(output_dir)
+
+
+def _versions(meca_zip, changed_first=False):
+    data = {f"data/{i}.bin": os.urandom(256 * 1024) for i in range(4)}
+    v1 = dict(data, **{"index.md": b"# v1\n", "notebooks/a.ipynb": b"{}\n"})
+    v2 = {"index.md": b"# v2\n", "notebooks/b.ipynb": b"[]\n"}
+    # ahead of the data, the changes are not fetched with the central directory
+    v2 = dict(v2, **data) if changed_first else dict(data, **v2)
+    return (
+        meca_zip(files=v1, compression=zipfile.ZIP_STORED),
+        meca_zip(files=v2, compression=zipfile.ZIP_STORED),
+    )
+
+
+def test_delta_fetch_matches_full_extract(tmp_path, origin, meca_zip, monkeypatch):
+    v1, v2 = _versions(meca_zip)
+    monkeypatch.setenv("MECA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("MECA_DELTA_FETCH", "1")
+    url = f"{origin.url}/meca.zip"
+
+    origin.add("/meca.zip", v1, {"ETag": '"v1"'})
+    _fetch(tmp_path, url, "v1")
+    origin.add("/meca.zip", v2, {"ETag": '"v2"'})
+    provider, output, tree = _fetch(tmp_path, url, "v2")
+
+    origin.add("/full.zip", v2)
+    _, _, full = _fetch(tmp_path, f"{origin.url}/full.zip", "full")
+    assert tree == full
+    assert sorted(tree) == [
+        "data/0.bin",
+        "data/1.bin",
+        "data/2.bin",
+        "data/3.bin",
+        "index.md",
+        "notebooks/b.ipynb",
+    ]
+    assert any(
+        "Reused 6 unchanged files and downloaded 2 changed" in line for line in output
+    )
+    assert provider.metrics.counts["downloaded_bytes"] < len(v2) / 4
+    assert provider.cache.stats()["deltas"] == 1
+
+
+def test_delta_result_is_cached(tmp_path, origin, meca_zip, monkeypatch):
+    v1, v2 = _versions(meca_zip)
+    monkeypatch.setenv("MECA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("MECA_DELTA_FETCH", "1")
+    url = f"{origin.url}/meca.zip"
+
+    origin.add("/meca.zip", v1, {"ETag": '"v1"'})
+    _fetch(tmp_path, url, "v1")
+    origin.add("/meca.zip", v2, {"ETag": '"v2"'})
+    provider, _, delta = _fetch(tmp_path, url, "v2")
+    assert provider.cache.lookup(url)["etag"] == '"v2"'
+    cached = provider.cache.zip_path(provider.cache.key(url))
+    with zipfile.ZipFile(cached) as rebuilt:
+        assert rebuilt.testzip() is None
+
+    # the next build revalidates the rebuilt bundle instead of fetching changes
+    origin.requests.clear()
+    provider, output, tree = _fetch(tmp_path, url, "v2-again")
+    assert tree == delta
+    assert not any("Fetching changes" in line for line in output)
+    assert [r[0] for r in origin.requests] == ["HEAD", "GET"]
+    assert provider.cache.stats()["hits"] == 1
+
+    # content hashes need the origin's bytes
+    monkeypatch.setenv("MECA_HASH_SCHEME", "content")
+    provider, _, tree = _fetch(tmp_path, url, "v2-content")
+    assert tree == delta
+    assert provider.cache.stats()["misses"] == 2
+
+
+@pytest.mark.parametrize("preload", [True, False])
+def test_delta_fetch_falls_back_on_range_failure(
+    tmp_path, origin, meca_zip, monkeypatch, preload
+):
+    v1, v2 = _versions(meca_zip, changed_first=True)
+    monkeypatch.setenv("MECA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("MECA_DELTA_FETCH", "1")
+    url = f"{origin.url}/meca.zip"
+
+    origin.add("/meca.zip", v1, {"ETag": '"v1"'})
+    _fetch(tmp_path, url, "v1")
+    origin.add("/meca.zip", v2, {"ETag": '"v2"'})
+    if not preload:
+        # changed members are then fetched as they are extracted
+        monkeypatch.setattr(RangeFile, "load", lambda self, start, end: None)
+    # the central directory arrives, the next range is cut short
+    origin.faults = [None, 100]
+    _, output, tree = _fetch(tmp_path, url, "v2")
+
+    assert any("Cannot fetch only the changes" in line for line in output)
+    assert tree["index.md"] == b"# v2\n"
+    assert "notebooks/a.ipynb" not in tree
+
+
+def test_delta_fetch_falls_back_without_ranges(tmp_path, origin, meca_zip, monkeypatch):
+    v1, v2 = _versions(meca_zip)
+    monkeypatch.setenv("MECA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("MECA_DELTA_FETCH", "1")
+    url = f"{origin.url}/meca.zip"
+
+    origin.add("/meca.zip", v1, {"ETag": '"v1"'})
+    _fetch(tmp_path, url, "v1")
+    origin.add("/meca.zip", v2, {"ETag": '"v2"'})
+    origin.ranges = False
+    _, output, tree = _fetch(tmp_path, url, "v2")
+
+    assert any("Cannot fetch only the changes" in line for line in output)
+    assert tree["index.md"] == b"# v2\n"
+    assert "notebooks/a.ipynb" not in tree
+
+
+def test_remote_zipfile_reads_central_directory(origin, meca_zip):
+    origin.add("/meca.zip", meca_zip(files={"big.bin": os.urandom(512 * 1024)}))
+
+    with remote_zipfile(Session(), f"{origin.url}/meca.zip") as remote:
+        assert remote.namelist() == ["manifest.xml", "article.pdf", "bundle/big.bin"]
+        assert remote.range_file.requests == 1
+        assert remote.read("manifest.xml").startswith(b"<?xml")
+        remote.range_file.close()
+
+
+def test_plan_delta_and_coalesce():
+    def info(name, crc, size):
+        member = zipfile.ZipInfo(name)
+        member.CRC, member.file_size = crc, size
+        return member
+
+    old = [info("a", 1, 10), info("b", 2, 10), info("d/", 0, 0)]
+    new = [info("a", 1, 10), info("b", 3, 10), info("c", 4, 1), info("d/", 0, 0)]
+    reused, changed = plan_delta(new, old)
+
+    assert [m.filename for m in reused] == ["a"]
+    assert [m.filename for m in changed] == ["b", "c"]
+    assert coalesce([(100, 200), (0, 50), (60, 70)], gap=20) == [[0, 70], [100, 200]]
@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import os
+from base64 import b64encode
+
+import pytest
+from requests import Session
+from meca4binder.download import IncompleteDownload, IntegrityError, download_zipfile
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(3 * 1024 * 1024 + 17)
+
+
+@pytest.mark.parametrize("zero_copy", [False, True])
+def test_download_zipfile(tmp_path, origin, payload, zero_copy):
+    origin.add("/meca.zip", payload)
+
+    result = download_zipfile(
+        Session(),
+        f"{origin.url}/meca.zip",
+        str(tmp_path),
+        buffer_size=64 * 1024,
+        zero_copy=zero_copy,
+    )
+
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+    assert result.bytes == len(payload)
+    assert result.mb_per_s > 0
+    if zero_copy and hasattr(os, "splice"):
+        assert result.method == "splice"
+    else:
+        assert result.method == "readinto"
+
+
+def test_download_zipfile_rejects_truncated_body(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload)
+    origin.faults = [1000]
+
+    with pytest.raises(IncompleteDownload):
+        download_zipfile(Session(), f"{origin.url}/meca.zip", str(tmp_path))
+    assert not os.path.exists(tmp_path / "meca.zip")
+
+
+def test_download_zipfile_decodes_content_encoding(tmp_path, origin, payload):
+    origin.add("/meca.zip", gzip.compress(payload), {"Content-Encoding": "gzip"})
+
+    result = download_zipfile(
+        Session(), f"{origin.url}/meca.zip", str(tmp_path), zero_copy=True
+    )
+
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+    assert result.method == "read"
+
+
+@pytest.mark.parametrize("segments", [1, 2])
+def test_download_zipfile_digests(tmp_path, origin, payload, segments):
+    origin.add("/meca.zip", payload)
+
+    result = download_zipfile(
+        Session(),
+        f"{origin.url}/meca.zip",
+        str(tmp_path),
+        zero_copy=True,
+        segments=segments,
+        hash_algorithms=["sha256", "blake2b"],
+    )
+
+    assert result.method == ("ranged" if segments > 1 else "readinto")
+    assert result.digests == {
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "blake2b": hashlib.blake2b(payload).hexdigest(),
+    }
+
+
+@pytest.mark.parametrize("segments", [1, 2])
+def test_download_zipfile_checks_content_md5(tmp_path, origin, payload, segments):
+    content_md5 = b64encode(hashlib.md5(payload).digest()).decode()
+    origin.add("/good.zip", payload, {"Content-MD5": content_md5})
+    origin.add(
+        "/bad.zip",
+        payload[:-1] + bytes([payload[-1] ^ 0xFF]),
+        {"Content-MD5": content_md5},
+    )
+
+    result = download_zipfile(
+        Session(), f"{origin.url}/good.zip", str(tmp_path), segments=segments
+    )
+    assert result.digests == {"md5": hashlib.md5(payload).hexdigest()}
+
+    with pytest.raises(IntegrityError):
+        download_zipfile(
+            Session(),
+            f"{origin.url}/bad.zip",
+            str(tmp_path),
+            filename="bad.zip",
+            segments=segments,
+        )
+    assert not os.path.exists(tmp_path / "bad.zip")
+
+
+def test_download_zipfile_unknown_hash_algorithm(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload)
+
+    with pytest.raises(ValueError):
+        download_zipfile(
+            Session(), f"{origin.url}/meca.zip", str(tmp_path), hash_algorithms=["crc"]
+        )
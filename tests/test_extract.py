@@ -0,0 +1,56 @@
+import os
+import stat
+import zipfile
+
+from meca4binder.extract import extract_members
+
+
+def snapshot(root):
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            full = os.path.join(dirpath, name)
+            mode = stat.S_IMODE(os.stat(full).st_mode)
+            content = None
+            if os.path.isfile(full):
+                with open(full, "rb") as f:
+                    content = f.read()
+            tree[os.path.relpath(full, root)] = (mode, content)
+    return tree
+
+
+def test_parallel_extract_matches_extractall(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    zip_filename = tmp_path / "meca.zip"
+    with zipfile.ZipFile(zip_filename, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("bundle/", b"")
+        for i in range(40):
+            zf.writestr(f"bundle/data/{i % 5}/file{i}.bin", os.urandom(i * 1000))
+            zf.writestr(f"bundle/text{i}.txt", f"line {i}\n".encode() * 5000)
+        zf.writestr("../outside.txt", b"sanitised")
+
+    with zipfile.ZipFile(zip_filename) as zf:
+        zf.extractall(tmp_path / "serial")
+        extract_members(zf, zf.infolist(), str(tmp_path / "parallel"), workers=8)
+
+    assert snapshot(tmp_path / "parallel") == snapshot(tmp_path / "serial")
+
+
+def test_parallel_extract_subset(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    zip_filename = tmp_path / "meca.zip"
+    with zipfile.ZipFile(zip_filename, "w") as zf:
+        zf.writestr("manifest.xml", b"<manifest/>")
+        zf.writestr("bundle/a.txt", b"a")
+        zf.writestr("bundle/b/c.txt", b"c")
+
+    with zipfile.ZipFile(zip_filename) as zf:
+        members = [m for m in zf.infolist() if m.filename.startswith("bundle/")]
+        extract_members(zf, members, str(tmp_path / "out"), workers=4)
+
+    assert sorted(snapshot(tmp_path / "out")) == [
+        "bundle",
+        os.path.join("bundle", "a.txt"),
+        os.path.join("bundle", "b"),
+        os.path.join("bundle", "b", "c.txt"),
+    ]
@@ -0,0 +1,180 @@
+import os
+import socket
+import time
+
+import pytest
+from requests import ConnectionError, Session
+from tornado.httpclient import AsyncHTTPClient
+
+from meca4binder import MecaContentProvider, MecaRepoProvider
+from meca4binder.httppolicy import LatencyWindow, RequestPolicy
+from meca4binder.ranged import download_ranged
+from meca4binder.zipindex import remote_zipfile
+
+
+def _closed_port_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}/meca.zip"
+
+
+def _methods(origin):
+    return [r[0] for r in origin.requests]
+
+
+def test_head_is_retried_on_error_statuses_and_connection_errors(origin):
+    origin.add("/meca.zip", b"PK")
+    origin.statuses = [503, 429]
+    policy = RequestPolicy(backoff=0.01)
+
+    with Session() as session:
+        assert policy.head(session, f"{origin.url}/meca.zip").status_code == 200
+        assert _methods(origin) == ["HEAD"] * 3
+
+        # not retryable
+        origin.statuses = [404]
+        assert policy.head(session, f"{origin.url}/meca.zip").status_code == 404
+        assert _methods(origin) == ["HEAD"] * 4
+
+        # retries run out
+        origin.statuses = [503] * 3
+        assert policy.head(session, f"{origin.url}/meca.zip").status_code == 503
+
+        with pytest.raises(ConnectionError):
+            policy.head(session, _closed_port_url())
+
+
+def test_slow_head_times_out_or_is_hedged(origin):
+    origin.add("/meca.zip", b"PK")
+
+    with Session() as session:
+        origin.delays = [2]
+        start = time.monotonic()
+        policy = RequestPolicy(head_timeout=0.2, backoff=0.01)
+        assert policy.head(session, f"{origin.url}/meca.zip").ok
+        assert time.monotonic() - start < 1.5
+
+        origin.delays = [2]
+        start = time.monotonic()
+        policy = RequestPolicy(hedge_after=0.1)
+        assert policy.head(session, f"{origin.url}/meca.zip").ok
+        assert time.monotonic() - start < 1.5
+        assert _methods(origin) == ["HEAD"] * 4
+
+
+def test_hedge_delay_follows_latency_percentile():
+    latencies = LatencyWindow()
+    policy = RequestPolicy(hedge_percentile=90, latencies=latencies)
+    for i in range(10):
+        latencies.add(i / 100)
+    # too few samples to hedge on
+    assert policy.hedge_delay() is None
+
+    for i in range(10, 20):
+        latencies.add(i / 100)
+    assert policy.hedge_delay() == 0.17
+    policy.hedge_after = 0.05
+    assert policy.hedge_delay() == 0.05
+
+    delays = [RequestPolicy(backoff=1).delay(n) for n in range(6) for _ in range(20)]
+    assert all(0 <= d <= 5 for d in delays)
+    assert len(set(delays)) > 100
+
+
+@pytest.mark.asyncio
+async def test_async_head_is_retried_and_hedged(origin):
+    origin.add("/meca.zip", b"PK")
+    client = AsyncHTTPClient()
+
+    origin.statuses = [502]
+    policy = RequestPolicy(backoff=0.01)
+    resp = await policy.head_async(client, f"{origin.url}/meca.zip")
+    assert resp.code == 200
+    assert _methods(origin) == ["HEAD"] * 2
+
+    origin.delays = [2]
+    start = time.monotonic()
+    policy = RequestPolicy(hedge_after=0.1)
+    resp = await policy.head_async(client, f"{origin.url}/meca.zip")
+    assert resp.code == 200
+    assert time.monotonic() - start < 1.5
+    assert _methods(origin) == ["HEAD"] * 4
+
+    with pytest.raises(OSError):
+        await RequestPolicy(backoff=0.01).head_async(client, _closed_port_url())
+
+
+@pytest.mark.asyncio
+async def test_resolution_rides_out_a_flaky_origin(origin):
+    origin.add("/meca.zip", b"PK", {"ETag": '"abc"'})
+    url = f"{origin.url}/meca.zip"
+
+    origin.statuses = [503, 503]
+    assert await MecaRepoProvider(spec=url).get_resolved_ref()
+    assert _methods(origin) == ["HEAD"] * 3
+
+    origin.statuses = [503]
+    with pytest.raises(ValueError, match="URL is unreachable"):
+        await MecaRepoProvider(spec=url, http_retries=0).get_resolved_ref()
+
+    origin.statuses = [404]
+    with pytest.raises(ValueError, match="URL is unreachable"):
+        await MecaRepoProvider(spec=url).get_resolved_ref()
+    assert _methods(origin) == ["HEAD"] * 5
+
+    origin.delays = [2]
+    start = time.monotonic()
+    provider = MecaRepoProvider(spec=url, http_hedge_after=0.1)
+    assert await provider.get_resolved_ref()
+    assert time.monotonic() - start < 1.5
+
+
+def test_fetch_retries_head_and_get(tmp_path, origin, meca_zip, monkeypatch):
+    origin.add("/meca.zip", meca_zip())
+    monkeypatch.setenv("MECA_HTTP_HEDGE_AFTER", "0.1")
+    provider = MecaContentProvider()
+    assert provider.session is MecaContentProvider().session
+
+    # a slow HEAD is hedged, the GET fails once
+    origin.delays = [2]
+    origin.statuses = [None, None, 503]
+    start = time.monotonic()
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+    assert time.monotonic() - start < 1.5
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    list(provider.fetch(spec, str(output_dir)))
+
+    assert _methods(origin) == ["HEAD", "HEAD", "GET", "GET"]
+    assert (output_dir / "index.md").read_bytes() == b"# Hello MECA\n"
+
+
+def test_range_requests_time_out_and_retry(tmp_path, origin, meca_zip):
+    payload = meca_zip(files={"big.bin": os.urandom(256 * 1024)})
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    policy = RequestPolicy(read_timeout=0.2, backoff=0.01)
+    filename = str(tmp_path / "meca.zip")
+
+    # a stalled segment
+    origin.delays = [2]
+    start = time.monotonic()
+    download_ranged(
+        Session(),
+        f"{origin.url}/meca.zip",
+        filename,
+        len(payload),
+        validator='"v1"',
+        segments=1,
+        policy=policy,
+    )
+    assert time.monotonic() - start < 1.5
+    with open(filename, "rb") as f:
+        assert f.read() == payload
+
+    # a stalled central directory read
+    origin.delays = [2]
+    start = time.monotonic()
+    with remote_zipfile(Session(), f"{origin.url}/meca.zip", policy=policy) as remote:
+        assert "bundle/big.bin" in remote.namelist()
+        remote.range_file.close()
+    assert time.monotonic() - start < 1.5
@@ -0,0 +1,130 @@
+import os
+import zipfile
+from hashlib import md5
+
+import pytest
+
+from meca4binder import MecaContentProvider, extract_validate_and_identify_bundle
+from meca4binder.baseprovider import ContentProviderException
+from meca4binder.localstore import LocalBundleNotAllowed, LocalMounts, mapped_digests
+
+FILES = ["data/values.csv", "index.md", "notebooks/analysis.ipynb"]
+
+
+def _output(tmp_path, name="out"):
+    output_dir = tmp_path / name
+    output_dir.mkdir()
+    return str(output_dir)
+
+
+def _tree(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, f), root)
+        for dirpath, _, files in os.walk(root)
+        for f in files
+    )
+
+
+@pytest.fixture
+def bundles(tmp_path, meca_zip):
+    root = tmp_path / "bundles"
+    (root / "journal" / "123").mkdir(parents=True)
+    data = meca_zip()
+    (root / "journal" / "123" / "meca.zip").write_bytes(data)
+    return root, data
+
+
+def test_file_spec_is_read_in_place(tmp_path, bundles, monkeypatch):
+    root, data = bundles
+    monkeypatch.setenv("MECA_LOCAL_ROOTS", str(root))
+    monkeypatch.setenv("MECA_HASH_SCHEME", "content")
+    provider = MecaContentProvider()
+
+    spec = provider.detect(f"file+meca://{root}/journal/123/meca.zip")
+    assert spec["path"] == str(root / "journal" / "123" / "meca.zip")
+    output = list(provider.fetch(spec, _output(tmp_path)))
+
+    assert any("in place" in line for line in output)
+    assert not any("Downloaded" in line for line in output)
+    assert _tree(tmp_path / "out") == FILES
+    assert provider.content_id == f"meca-b-{md5(data).hexdigest()}"
+    # only the extracted tree was written
+    assert sorted(os.listdir(root / "journal" / "123")) == ["meca.zip"]
+
+
+def test_bundles_outside_the_roots_are_refused(tmp_path, bundles, monkeypatch):
+    root, _ = bundles
+    (tmp_path / "secret.zip").write_bytes(b"PK")
+    (root / "link.zip").symlink_to(tmp_path / "secret.zip")
+    mounts = LocalMounts(
+        mounts=[("https://pub.example.org/meca/", str(root))], roots=[str(root)]
+    )
+
+    for url in (
+        f"file://{tmp_path}/secret.zip",
+        f"file://{root}/link.zip",
+        f"file://{root}/../secret.zip",
+        "https://pub.example.org/meca/%2E%2E/secret.zip",
+    ):
+        with pytest.raises(LocalBundleNotAllowed):
+            mounts.resolve(url)
+
+    monkeypatch.delenv("MECA_LOCAL_ROOTS", raising=False)
+    monkeypatch.delenv("MECA_LOCAL_MOUNTS", raising=False)
+    with pytest.raises(ContentProviderException, match="not enabled"):
+        MecaContentProvider().detect(f"file+meca://{root}/journal/123/meca.zip")
+
+
+def test_mapped_url_skips_http_and_falls_back(
+    tmp_path, origin, bundles, meca_zip, monkeypatch
+):
+    root, _ = bundles
+    origin.add("/meca/journal/456/meca.zip", meca_zip())
+    monkeypatch.setenv("MECA_LOCAL_MOUNTS", f"{origin.url}/meca/={root}")
+
+    provider = MecaContentProvider()
+    spec = provider.detect(
+        f"{origin.url}/meca/journal/123/meca.zip?sig=x".replace("http", "http+meca", 1)
+    )
+    list(provider.fetch(spec, _output(tmp_path, "local")))
+    assert _tree(tmp_path / "local") == FILES
+    assert origin.requests == []
+
+    # not on the mount, so fetched over HTTP as before
+    provider = MecaContentProvider()
+    spec = provider.detect(
+        f"{origin.url}/meca/journal/456/meca.zip".replace("http", "http+meca", 1)
+    )
+    assert "path" not in spec
+    list(provider.fetch(spec, _output(tmp_path, "remote")))
+    assert _tree(tmp_path / "remote") == FILES
+    assert [r[0] for r in origin.requests] == ["HEAD", "GET"]
+
+
+def test_mapped_extraction_in_parallel_matches_extractall(tmp_path, bundles):
+    root, data = bundles
+    zip_filename = str(root / "journal" / "123" / "meca.zip")
+    mapped = extract_validate_and_identify_bundle(
+        zip_filename, str(tmp_path / "mapped"), workers=4, mapped=True
+    )
+    plain = extract_validate_and_identify_bundle(zip_filename, str(tmp_path / "plain"))
+
+    assert mapped[0] and plain[0]
+    assert _tree(tmp_path / "mapped") == _tree(tmp_path / "plain")
+    with zipfile.ZipFile(zip_filename) as zf:
+        for name in zf.namelist():
+            assert (tmp_path / "mapped" / name).read_bytes() == zf.read(name)
+    assert mapped_digests(zip_filename, ["md5"]) == {"md5": md5(data).hexdigest()}
+
+
+@pytest.mark.asyncio
+async def test_fetch_async_reads_in_place(tmp_path, bundles, monkeypatch):
+    root, _ = bundles
+    monkeypatch.setenv("MECA_LOCAL_ROOTS", str(root))
+    provider = MecaContentProvider()
+
+    spec = await provider.detect_async(f"file+meca://{root}/journal/123/meca.zip")
+    output = [line async for line in provider.fetch_async(spec, _output(tmp_path))]
+
+    assert any("in place" in line for line in output)
+    assert _tree(tmp_path / "out") == FILES
@@ -0,0 +1,113 @@
+import io
+import zipfile
+
+import pytest
+from requests import Session
+
+from meca4binder import MecaContentProvider, identify_bundle
+from meca4binder.manifest import ManifestCache, ManifestError, MecaManifest
+from meca4binder.zipindex import remote_zipfile
+
+MANIFEST = b"""<?xml version="1.0" encoding="UTF-8"?>
+<manifest xmlns="https://manuscriptsexchange.org/schema/manifest" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <item id="a-source" item-type="article-source-directory">
+    <instance media-type="application/x-directory" xlink:href="bundle/"/>
+  </item>
+  <item id="b-source" item-type="article-source-directory">
+    <instance media-type="application/x-directory" xlink:href="supplement/"/>
+  </item>
+  <item id="a-pdf" item-type="article-source">
+    <instance media-type="application/pdf" xlink:href="article.pdf"/>
+  </item>
+</manifest>
+"""
+
+
+def test_parse_indexes_items():
+    manifest = MecaManifest.from_bytes(MANIFEST)
+
+    assert manifest.source_directories == ["bundle/", "supplement/"]
+    assert manifest.article_source_directory == "bundle/"
+    assert manifest.item("article.pdf").id == "a-pdf"
+    assert [i.id for i in manifest.items_of_type("article-source")] == ["a-pdf"]
+    assert manifest.media_types["article.pdf"] == "application/pdf"
+    assert manifest.item("missing") is None
+
+
+def test_parse_ignores_instances_outside_items():
+    manifest = MecaManifest.from_bytes(
+        b"""<manifest xmlns:xlink="http://www.w3.org/1999/xlink">
+  <instance xlink:href="stray/"/>
+  <group><instance xlink:href="grouped/"/></group>
+  <item id="a-source" item-type="article-source-directory">
+    <instance xlink:href="bundle/"/>
+    <metadata><instance xlink:href="nested/"/></metadata>
+  </item>
+</manifest>"""
+    )
+
+    assert manifest.source_directories == ["bundle/"]
+    assert manifest.item("stray/") is None
+
+
+def test_manifest_without_source_directory_or_well_formed_xml(tmp_path):
+    manifest = MecaManifest.from_bytes(b"<manifest><item item-type='x'/></manifest>")
+    assert manifest.article_source_directory is None
+
+    with pytest.raises(ManifestError):
+        MecaManifest.from_bytes(b"<manifest><item>")
+
+    (tmp_path / "manifest.xml").write_bytes(b"<manifest><item>")
+    assert identify_bundle(str(tmp_path)) == (False, str(tmp_path))
+
+
+def test_from_zip_and_byte_ranges(origin, meca_zip):
+    data = meca_zip(source_dir="src/")
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert MecaManifest.from_zip(zf).article_source_directory == "src/"
+    with pytest.raises(ManifestError):
+        MecaManifest.from_zip(zipfile.ZipFile(io.BytesIO(meca_zip(manifest=False))))
+
+    origin.add("/meca.zip", data)
+    with remote_zipfile(Session(), f"{origin.url}/meca.zip") as remote:
+        assert MecaManifest.from_zip(remote).article_source_directory == "src/"
+        remote.range_file.close()
+
+
+def test_manifest_cache_is_bounded():
+    cache = ManifestCache(max_size=2)
+    loads = []
+
+    def load(name):
+        def _load():
+            loads.append(name)
+            return name
+
+        return _load
+
+    for key in ["a", "b", "a", "c", "b"]:
+        cache.get(key, load(key))
+
+    assert loads == ["a", "b", "c", "b"]
+    assert cache.get(None, load("x")) == "x"
+    assert cache.lookup("x") is None
+
+
+def test_fetch_keeps_manifest(tmp_path, origin, meca_zip, monkeypatch):
+    data = meca_zip()
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        members = {n: zf.read(n) for n in zf.namelist()}
+    members["manifest.xml"] = MANIFEST
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    origin.add("/meca.zip", buf.getvalue())
+    monkeypatch.setenv("MECA_SELECTIVE_EXTRACT", "1")
+
+    provider = MecaContentProvider()
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+    output = list(provider.fetch(spec, str(tmp_path)))
+
+    assert provider.manifest.source_directories == ["bundle/", "supplement/"]
+    assert any("lists 2 article source directories" in line for line in output)
@@ -0,0 +1,95 @@
+import pytest
+
+from meca4binder import MecaContentProvider, MecaRepoProvider
+from meca4binder.metrics import FetchMetrics, PrometheusHook, add_hook, remove_hook
+
+
+class Recorder:
+    def __init__(self):
+        self.observations = []
+
+    def observe(self, name, value, labels):
+        self.observations.append((name, value, labels))
+
+    def names(self):
+        return [name for name, _, _ in self.observations]
+
+
+def test_fetch_metrics_phases_and_counts():
+    seen = []
+    ticks = iter([0.0, 2.0])
+    metrics = FetchMetrics([lambda *args: seen.append(args)], clock=lambda: next(ticks))
+
+    with metrics.phase("download"):
+        metrics.count("downloaded_bytes", 4_000_000)
+
+    assert metrics.as_dict() == {
+        "phases": {"download": 2.0},
+        "counts": {"downloaded_bytes": 4_000_000},
+    }
+    assert metrics.throughput("download", "downloaded_bytes") == 2.0
+    assert seen == [
+        ("meca_fetch_downloaded_bytes", 4_000_000, {}),
+        ("meca_fetch_phase_seconds", 2.0, {"phase": "download"}),
+    ]
+    assert "download 2.00s (4.0 MB, 2.0 MB/s)" in metrics.summary()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fetch_reports_metrics(tmp_path, origin, meca_zip, stream):
+    data = meca_zip()
+    origin.add("/meca.zip", data)
+    recorder = Recorder()
+    add_hook(recorder)
+    try:
+        provider = MecaContentProvider()
+        provider.stream_extract = stream
+        provider.progress_interval = 1e-6
+        spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+        output = list(provider.fetch(spec, str(tmp_path)))
+    finally:
+        remove_hook(recorder)
+
+    counts = provider.metrics.counts
+    assert counts["downloaded_bytes"] == len(data)
+    assert counts["extracted_members"] == 5
+    assert counts["extracted_bytes"] > 0
+    phases = set(provider.metrics.phases)
+    assert phases == {"detect", "stream" if stream else "download", "move"} | (
+        set() if stream else {"extract"}
+    )
+    assert "meca_fetch_phase_seconds" in recorder.names()
+    assert any(line.startswith("MECA Bundle timings: detect") for line in output)
+
+
+@pytest.mark.asyncio
+async def test_get_resolved_ref_reports_duration(origin):
+    origin.add("/meca.zip", b"bundle")
+    seen = []
+    provider = MecaRepoProvider(
+        spec=f"{origin.url}/meca.zip",
+        metrics_hooks=[lambda *args: seen.append(args)],
+    )
+
+    await provider.get_resolved_ref()
+
+    [(name, seconds, labels)] = seen
+    assert name == "meca_resolve_seconds"
+    assert seconds > 0
+    assert labels == {"scheme": "url", "result": "ok"}
+
+
+def test_prometheus_hook():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    hook = PrometheusHook(registry)
+
+    hook.observe("meca_fetch_phase_seconds", 1.5, {"phase": "download"})
+    hook.observe("meca_fetch_downloaded_bytes", 10, {})
+    hook.observe("meca_fetch_downloaded_bytes", 5, {})
+
+    assert (
+        registry.get_sample_value("meca_fetch_phase_seconds_sum", {"phase": "download"})
+        == 1.5
+    )
+    assert registry.get_sample_value("meca_fetch_downloaded_bytes_total") == 15
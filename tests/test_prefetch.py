@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+from meca4binder import MecaContentProvider, MecaRepoProvider
+from meca4binder.prefetch import Prefetcher, PrefetchStore
+from meca4binder.repoprovider import _prefetchers
+
+
+def test_store_claim_commit_and_stale_parts(tmp_path):
+    store = PrefetchStore(str(tmp_path))
+
+    assert store.claim("meca-1")
+    assert not store.claim("meca-1")
+    assert store.in_progress("meca-1")
+
+    # an abandoned download can be reclaimed
+    old = time.time() - 3600
+    os.utime(store.part_path("meca-1"), (old, old))
+    assert store.claim("meca-1")
+
+    store.commit("meca-1")
+    assert store.lookup("meca-1") == store.path("meca-1")
+    assert not store.claim("meca-1")
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = PrefetchStore(str(tmp_path))
+    for i, key in enumerate(["a", "b", "c"]):
+        with open(store.path(key), "wb") as f:
+            f.write(b"x" * 10)
+        os.utime(store.path(key), (i, i))
+    store.lookup("a")
+
+    assert store.evict(20) == 1
+    assert store.lookup("b") is None
+    assert store.lookup("a") and store.lookup("c")
+
+
+def test_store_keeps_pinned_bundles(tmp_path):
+    store = PrefetchStore(str(tmp_path))
+    for i, key in enumerate(["a", "b"]):
+        with open(store.path(key), "wb") as f:
+            f.write(b"x" * 10)
+        os.utime(store.path(key), (i, i))
+
+    with store.pin("a"):
+        assert store.evict(10) == 1
+        assert store.lookup("a") and store.lookup("b") is None
+
+    assert store.evict(0) == 1
+    assert store.lookup("a") is None
+
+
+@pytest.mark.asyncio
+async def test_prefetcher_bounds(tmp_path, origin):
+    for i in range(4):
+        origin.add(f"/{i}.zip", b"x" * 100)
+    prefetcher = Prefetcher(
+        PrefetchStore(str(tmp_path)), max_pending=2, max_bundle_bytes=50
+    )
+
+    assert not prefetcher.schedule(
+        f"{origin.url}/0.zip", "k0", {"Content-Length": "100"}
+    )
+    assert prefetcher.schedule(f"{origin.url}/1.zip", "k1")
+    assert not prefetcher.schedule(f"{origin.url}/1.zip", "k1")
+    assert prefetcher.schedule(f"{origin.url}/2.zip", "k2")
+    assert not prefetcher.schedule(f"{origin.url}/3.zip", "k3")
+    await prefetcher.join()
+
+    assert sorted(os.listdir(tmp_path)) == ["k1.zip", "k2.zip"]
+
+
+@pytest.mark.asyncio
+async def test_prefetcher_failure_leaves_no_part(tmp_path, origin):
+    prefetcher = Prefetcher(PrefetchStore(str(tmp_path)))
+
+    prefetcher.schedule(f"{origin.url}/missing.zip", "k")
+    await prefetcher.join()
+
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_resolution_prefetches_for_content_provider(
+    tmp_path, origin, meca_zip, monkeypatch
+):
+    origin.add("/meca.zip", meca_zip(), {"ETag": '"v1"'})
+    store_dir = str(tmp_path / "store")
+    provider = MecaRepoProvider(spec=f"{origin.url}/meca.zip", prefetch_dir=store_dir)
+
+    await provider.get_resolved_ref()
+    await _prefetchers[store_dir].join()
+    gets = [r for r in origin.requests if r[0] == "GET"]
+    assert len(gets) == 1
+
+    monkeypatch.setenv("MECA_PREFETCH_DIR", store_dir)
+    content_provider = MecaContentProvider()
+    spec = content_provider.detect(provider.get_repo_url())
+    assert spec["slug"] == provider.get_build_slug()
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    output = list(content_provider.fetch(spec, str(output_dir)))
+
+    assert any("Using prefetched" in line for line in output)
+    assert sorted(os.listdir(output_dir)) == ["data", "index.md", "notebooks"]
+    assert [r for r in origin.requests if r[0] == "GET"] == gets
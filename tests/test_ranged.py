@@ -0,0 +1,186 @@
+import os
+
+import pytest
+from requests import RequestException, Session
+from meca4binder.download import download_zipfile
+from meca4binder.ranged import RangeNotSupported, download_ranged, plan_segments
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(1024 * 1024 + 123)
+
+
+def ranges_requested(origin):
+    return [h["Range"] for method, _, h in origin.requests if "Range" in h]
+
+
+def test_plan_segments():
+    assert plan_segments(10, 3, 1) == [[0, 3], [4, 7], [8, 9]]
+    assert plan_segments(10, 4, 8) == [[0, 9]]
+    assert plan_segments(0, 4) == []
+
+
+def test_download_ranged_retries_failed_segments(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    origin.faults = [1000, 5000]
+    filename = str(tmp_path / "meca.zip")
+
+    download_ranged(
+        Session(),
+        f"{origin.url}/meca.zip",
+        filename,
+        len(payload),
+        validator='"v1"',
+        segments=4,
+        min_segment_size=1024,
+    )
+
+    with open(filename, "rb") as f:
+        assert f.read() == payload
+    assert len(ranges_requested(origin)) == 6
+    assert not os.path.exists(f"{filename}.ranges")
+
+
+def test_download_ranged_without_read1(tmp_path, origin, payload, monkeypatch):
+    # urllib3 1.x responses have no read1
+    from urllib3.response import HTTPResponse
+
+    def no_read1(self):
+        raise AttributeError("read1")
+
+    monkeypatch.setattr(HTTPResponse, "read1", property(no_read1))
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    origin.faults = [1000]
+    filename = str(tmp_path / "meca.zip")
+
+    download_ranged(
+        Session(),
+        f"{origin.url}/meca.zip",
+        filename,
+        len(payload),
+        validator='"v1"',
+        segments=4,
+        min_segment_size=1024,
+    )
+
+    with open(filename, "rb") as f:
+        assert f.read() == payload
+
+
+def test_download_ranged_resumes_partial_file(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    origin.faults = [100_000]
+    filename = str(tmp_path / "meca.zip")
+    args = (Session(), f"{origin.url}/meca.zip", filename, len(payload))
+
+    with pytest.raises(RequestException):
+        download_ranged(*args, validator='"v1"', segments=1, retries=0)
+    assert os.path.exists(f"{filename}.ranges")
+
+    download_ranged(*args, validator='"v1"', segments=1, retries=0)
+
+    with open(filename, "rb") as f:
+        assert f.read() == payload
+    assert ranges_requested(origin)[-1] == f"bytes=100000-{len(payload) - 1}"
+
+
+def test_download_zipfile_segmented(tmp_path, origin):
+    payload = os.urandom(9 * 1024 * 1024)
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    origin.faults = [10]
+
+    result = download_zipfile(
+        Session(), f"{origin.url}/meca.zip", str(tmp_path), segments=2
+    )
+
+    assert result.method == "ranged"
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+
+
+def test_download_zipfile_retries_segment_on_error_status(tmp_path, origin):
+    payload = os.urandom(9 * 1024 * 1024)
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    # the HEAD succeeds, one of the range requests does not
+    origin.statuses = [None, 503]
+
+    result = download_zipfile(
+        Session(), f"{origin.url}/meca.zip", str(tmp_path), segments=2
+    )
+
+    assert result.method == "ranged"
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+    assert [r[0] for r in origin.requests] == ["HEAD", "GET", "GET", "GET"]
+    assert len(ranges_requested(origin)) == 3
+
+
+def test_download_ranged_keeps_progress_when_retries_run_out(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    origin.faults = [100_000]
+    origin.statuses = [None, 503, 429]
+    filename = str(tmp_path / "meca.zip")
+    args = (Session(), f"{origin.url}/meca.zip", filename, len(payload))
+
+    with pytest.raises(RequestException):
+        download_ranged(*args, validator='"v1"', segments=1, retries=2)
+    assert os.path.exists(f"{filename}.ranges")
+
+    download_ranged(*args, validator='"v1"', segments=1, retries=2)
+
+    with open(filename, "rb") as f:
+        assert f.read() == payload
+    assert ranges_requested(origin)[-1] == f"bytes=100000-{len(payload) - 1}"
+
+
+def test_download_zipfile_without_range_support(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload)
+    origin.ranges = False
+
+    result = download_zipfile(
+        Session(), f"{origin.url}/meca.zip", str(tmp_path), segments=4
+    )
+
+    assert result.method != "ranged"
+    with open(result.filename, "rb") as f:
+        assert f.read() == payload
+
+
+def test_download_ranged_rejects_changed_bundle(tmp_path, origin, payload):
+    origin.add("/meca.zip", payload, {"ETag": '"v2"'})
+
+    with pytest.raises(RangeNotSupported):
+        download_ranged(
+            Session(),
+            f"{origin.url}/meca.zip",
+            str(tmp_path / "meca.zip"),
+            len(payload),
+            validator='"v1"',
+        )
+
+
+def test_download_zipfile_ignores_partial_file_of_old_version(
+    tmp_path, origin, payload
+):
+    origin.add("/meca.zip", payload, {"ETag": '"v1"'})
+    origin.faults = [100]
+    with pytest.raises(RequestException):
+        download_ranged(
+            Session(),
+            f"{origin.url}/meca.zip",
+            str(tmp_path / "meca.zip"),
+            len(payload),
+            validator='"v1"',
+            retries=0,
+        )
+
+    changed = os.urandom(len(payload))
+    origin.add("/meca.zip", changed, {"ETag": '"v2"'})
+    result = download_zipfile(
+        Session(), f"{origin.url}/meca.zip", str(tmp_path), segments=2
+    )
+
+    assert result.method == "ranged"
+    with open(result.filename, "rb") as f:
+        assert f.read() == changed
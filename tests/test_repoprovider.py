@@ -1,4 +1,6 @@
 import pytest
+from base64 import b64encode
+from hashlib import md5
 from meca4binder import MecaRepoProvider
 
 
@@ -94,3 +96,24 @@ async def test_get_resolved_ref():
         provider.get_build_slug()
         == "meca--github.com/Notebooks-Now/submission-myst-full"
     )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hash_scheme", ["cloud", "content"])
+async def test_get_resolved_ref_content_slug(origin, hash_scheme):
+    data = b"meca bundle bytes"
+    origin.add("/a/meca.zip", data, {"Content-MD5": "not-an-md5"})
+    origin.add("/b/meca.zip", data, {"ETag": f'"{md5(data).hexdigest()}"'})
+    origin.add(
+        "/c/meca.zip",
+        data,
+        {"x-goog-hash": "md5=" + b64encode(md5(data).digest()).decode()},
+    )
+    slugs = set()
+    for path in ("/b/meca.zip", "/c/meca.zip") + (
+        ("/a/meca.zip",) if hash_scheme == "content" else ()
+    ):
+        provider = MecaRepoProvider(spec=f"{origin.url}{path}", hash_scheme=hash_scheme)
+        slugs.add(await provider.get_resolved_ref())
+
+    assert slugs == {f"meca-b-{md5(data).hexdigest()}"}
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from meca4binder import MecaRepoProvider
+from meca4binder import repoprovider
+from meca4binder.resolvecache import ResolutionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_resolution():
+    cache = ResolutionCache(ttl=0)
+    calls = []
+
+    async def resolve():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*[cache.get("key", resolve) for _ in range(20)])
+
+    assert results == ["value"] * 20
+    assert len(calls) == 1
+    assert cache.coalesced == 19
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_ttl_and_lru_bounds():
+    clock = Clock()
+    cache = ResolutionCache(ttl=10, max_size=2, clock=clock)
+    calls = []
+
+    def resolver(value):
+        async def resolve():
+            calls.append(value)
+            return value
+
+        return resolve
+
+    assert await cache.get("a", resolver("a1")) == "a1"
+    assert await cache.get("a", resolver("a2")) == "a1"
+    clock.now = 11
+    assert await cache.get("a", resolver("a3")) == "a3"
+
+    await cache.get("b", resolver("b"))
+    await cache.get("a", resolver("a4"))
+    await cache.get("c", resolver("c"))
+    assert await cache.get("b", resolver("b2")) == "b2"
+    assert calls == ["a1", "a3", "b", "c", "b2"]
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached():
+    cache = ResolutionCache(ttl=10)
+
+    async def fail():
+        raise IOError("origin down")
+
+    async def succeed():
+        return "ok"
+
+    with pytest.raises(IOError):
+        await cache.get("key", fail)
+    assert await cache.get("key", succeed) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_get_resolved_ref_coalesces_head_requests(origin, monkeypatch):
+    monkeypatch.setattr(repoprovider, "_resolution_cache", ResolutionCache())
+    origin.add("/meca.zip", b"bundle", {"ETag": '"v1"'})
+    providers = [
+        MecaRepoProvider(
+            spec=f"{origin.url}/meca.zip?signature={i}", resolve_cache_ttl=60
+        )
+        for i in range(25)
+    ]
+
+    slugs = await asyncio.gather(*[p.get_resolved_ref() for p in providers])
+    await providers[0].get_resolved_ref()
+
+    assert len(set(slugs)) == 1
+    assert len([r for r in origin.requests if r[0] == "HEAD"]) == 1
@@ -0,0 +1,130 @@
+import pytest
+from traitlets import TraitError
+from traitlets.config import Config
+
+from meca4binder import MecaRepoProvider
+from meca4binder.specindex import SpecPatternIndex, spec_pattern_index
+
+SPEC = "https://journals.curvenote.com/agu/submissions/12345/meca.zip"
+
+
+def test_is_banned_and_higher_quota():
+    provider = MecaRepoProvider(
+        spec=SPEC,
+        banned_specs=["^https://evil.example", ".*/AGU/submissions/123"],
+        high_quota_specs=["^https://other.example"],
+    )
+
+    assert provider.is_banned()
+    assert not provider.has_higher_quota()
+
+
+@pytest.mark.parametrize(
+    "patterns, spec, expected",
+    [
+        ([r"(a)\1"], "aa", True),
+        ([r"(a)\1", "b"], "ab", False),
+        ([r"(?P<x>a)", r"(?P<x>b)"], "b", True),
+        ([r"(?i)A"], "a", True),
+        # the flag would apply to "a b" as well if the patterns were combined
+        ([r"a b", r"(?x)c d"], "ab", False),
+        ([r"a b", r"(?x)c d"], "cd", True),
+        ([], "a", False),
+    ],
+)
+def test_spec_pattern_index_matches_like_re_match(patterns, spec, expected):
+    assert SpecPatternIndex(patterns).matches(spec) is expected
+
+
+def test_spec_pattern_index_is_shared():
+    patterns = ("^https://a", "^https://b")
+    assert spec_pattern_index(patterns) is spec_pattern_index(tuple(patterns))
+
+
+def test_repo_config_merges_matching_items():
+    spec_config = [
+        {"pattern": ".*curvenote", "config": {"quota": 5, "a": 1}},
+        {"pattern": ".*/agu/", "config": {"a": 2}},
+        {"pattern": ".*nomatch", "config": {"b": 3}},
+    ]
+    provider = MecaRepoProvider(spec=SPEC, spec_config=spec_config)
+
+    config = provider.repo_config({"per_repo_quota": 10})
+    assert config == {"quota": 5, "a": 2}
+
+    # the memoised result is not shared with callers
+    config["a"] = 100
+    assert provider.repo_config({"per_repo_quota": 10})["a"] == 2
+
+
+def test_repo_config_follows_config_changes():
+    spec_config = [{"pattern": ".*curvenote", "config": {"a": 1}}]
+    provider = MecaRepoProvider(spec=SPEC, spec_config=spec_config)
+    assert provider.repo_config({})["a"] == 1
+
+    provider.spec_config = [{"pattern": ".*curvenote", "config": {"a": 2}}]
+    assert provider.repo_config({})["a"] == 2
+
+
+def test_indexes_are_looked_up_once_per_assignment(monkeypatch):
+    import meca4binder.baseprovider as baseprovider
+
+    provider = MecaRepoProvider(
+        spec=SPEC,
+        banned_specs=["^https://evil.example"],
+        spec_config=[{"pattern": ".*curvenote", "config": {"a": 1}}],
+    )
+    lookups = []
+    for name in ("spec_config_index", "spec_pattern_list_index"):
+        lookup = getattr(baseprovider, name)
+        monkeypatch.setattr(
+            baseprovider, name, lambda v, lookup=lookup: lookups.append(v) or lookup(v)
+        )
+
+    for _ in range(3):
+        assert not provider.is_banned()
+        assert provider.repo_config({})["a"] == 1
+    # banned_specs, high_quota_specs and spec_config
+    assert len(lookups) == 3
+
+    # validated, then indexed again on first use
+    provider.banned_specs = [".*/agu/"]
+    assert provider.is_banned()
+    assert len(lookups) == 5
+
+
+def test_providers_share_the_configured_indexes():
+    config = Config()
+    config.MecaRepoProvider.banned_specs = ["^https://evil.example"]
+    config.MecaRepoProvider.spec_config = [
+        {"pattern": ".*curvenote", "config": {"a": 1}}
+    ]
+    providers = [MecaRepoProvider(spec=SPEC, config=config) for _ in range(3)]
+
+    assert providers[0].spec_config is not providers[1].spec_config
+    assert providers[0].repo_config({})["a"] == 1
+    for name in ("banned_specs", "spec_config"):
+        indexes = {id(p._spec_index(name)) for p in providers}
+        assert len(indexes) == 1
+
+    # overridden on one provider only
+    providers[0].spec_config = [{"pattern": ".*curvenote", "config": {"a": 2}}]
+    assert providers[0].repo_config({})["a"] == 2
+    assert providers[1].repo_config({})["a"] == 1
+    provider = MecaRepoProvider(spec=SPEC, config=config, banned_specs=[".*/agu/"])
+    assert provider.is_banned()
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"banned_specs": ["(unclosed"]},
+        {"high_quota_specs": [42]},
+        {"spec_config": [{"pattern": "[", "config": {}}]},
+        {"spec_config": [{"pattern": ".*", "config": "quota=1"}]},
+        {"spec_config": ["not a dict"]},
+    ],
+)
+def test_malformed_patterns_rejected(config):
+    with pytest.raises(TraitError):
+        MecaRepoProvider(spec=SPEC, **config)
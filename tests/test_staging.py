@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from meca4binder import MecaContentProvider
+from meca4binder.staging import StagingArea
+
+fork = multiprocessing.get_context("fork")
+
+
+def _fetch(provider, url, output_dir):
+    spec = provider.detect(url.replace("http", "http+meca", 1))
+    return list(provider.fetch(spec, str(output_dir)))
+
+
+def _fetch_in_child(barrier, url, output_dir):
+    os.makedirs(output_dir)
+    barrier.wait()
+    _fetch(MecaContentProvider(), url, output_dir)
+
+
+def _crash_holding_lock(staging_dir, key):
+    staging = StagingArea(staging_dir, stale_after=1)
+    staging.try_lock(key)
+    work = staging.work_dir(key)
+    with open(os.path.join(work, "tree", "half-written.md"), "w") as f:
+        f.write("# Half")
+    os._exit(1)
+
+
+def _tree(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, f), root)
+        for dirpath, _, files in os.walk(root)
+        for f in files
+    )
+
+
+def test_concurrent_processes_download_once(tmp_path, origin, meca_zip, monkeypatch):
+    origin.add("/meca.zip", meca_zip())
+    monkeypatch.setenv("MECA_STAGING_DIR", str(tmp_path / "staging"))
+    barrier = fork.Barrier(4)
+    outputs = [tmp_path / f"out-{i}" for i in range(4)]
+    procs = [
+        fork.Process(
+            target=_fetch_in_child,
+            args=(barrier, f"{origin.url}/meca.zip", str(out)),
+        )
+        for out in outputs
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+
+    assert [p.exitcode for p in procs] == [0] * 4
+    assert [r[0] for r in origin.requests].count("GET") == 1
+    for out in outputs:
+        assert _tree(out) == ["data/values.csv", "index.md", "notebooks/analysis.ipynb"]
+    # one published bundle, no lock or work directory left behind
+    [published] = os.listdir(tmp_path / "staging")
+    assert published.startswith("meca-")
+
+
+def test_crashed_holder_is_recovered(tmp_path, origin, meca_zip):
+    origin.add("/meca.zip", meca_zip())
+    url = f"{origin.url}/meca.zip"
+    staging_dir = str(tmp_path / "staging")
+    provider = MecaContentProvider()
+    provider.staging = StagingArea(staging_dir, stale_after=1)
+    spec = provider.detect(url.replace("http", "http+meca", 1))
+
+    crashed = fork.Process(target=_crash_holding_lock, args=(staging_dir, spec["slug"]))
+    crashed.start()
+    crashed.join(timeout=30)
+    assert crashed.exitcode == 1
+    assert provider.staging.lookup(spec["slug"]) is None
+
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    start = time.monotonic()
+    output = list(provider.fetch(spec, str(output_dir)))
+
+    assert time.monotonic() - start >= 0.5
+    assert any("Waiting for another process" in line for line in output)
+    assert _tree(output_dir) == [
+        "data/values.csv",
+        "index.md",
+        "notebooks/analysis.ipynb",
+    ]
+    # the crashed holder's work directory and the lock are gone
+    assert sorted(os.listdir(staging_dir)) == [spec["slug"]]
+
+
+def test_heartbeat_keeps_a_long_fetch_locked(tmp_path):
+    staging = StagingArea(str(tmp_path), stale_after=0.4)
+    lock = staging.try_lock("meca-abc")
+    assert lock is not None
+    other = StagingArea(str(tmp_path), stale_after=0.4)
+    for _ in range(6):
+        time.sleep(0.2)
+        assert other.try_lock("meca-abc") is None
+    lock.release()
+    assert not os.path.exists(staging.lock_path("meca-abc"))
+    assert other.try_lock("meca-abc") is not None
+
+
+def test_stale_lock_is_broken_and_loser_keeps_winner(tmp_path):
+    staging = StagingArea(str(tmp_path), stale_after=1)
+    with open(staging.lock_path("meca-abc"), "w") as f:
+        f.write("another-host 1 token")
+    os.utime(staging.lock_path("meca-abc"), (time.time() - 10,) * 2)
+
+    lock = staging.try_lock("meca-abc")
+    assert lock is not None and lock.held()
+
+    first = staging.work_dir("meca-abc")
+    second = staging.work_dir("meca-abc")
+    with open(os.path.join(first, "tree", "a.md"), "w") as f:
+        f.write("first")
+    staging.publish("meca-abc", first, {"n": 1})
+    staged = staging.publish("meca-abc", second, {"n": 2})
+    lock.release()
+
+    assert staged.meta == {"n": 1}
+    assert os.listdir(staged.tree) == ["a.md"]
+    assert sorted(os.listdir(tmp_path)) == ["meca-abc"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_async_reuses_staged_bundle(tmp_path, origin, meca_zip):
+    origin.add("/meca.zip", meca_zip())
+    url = f"{origin.url}/meca.zip".replace("http", "http+meca", 1)
+    staging_dir = str(tmp_path / "staging")
+
+    for i in range(2):
+        provider = MecaContentProvider()
+        provider.staging = StagingArea(staging_dir)
+        spec = await provider.detect_async(url)
+        (tmp_path / f"out-{i}").mkdir()
+        output = [
+            line
+            async for line in provider.fetch_async(spec, str(tmp_path / f"out-{i}"))
+        ]
+        assert _tree(tmp_path / f"out-{i}") == [
+            "data/values.csv",
+            "index.md",
+            "notebooks/analysis.ipynb",
+        ]
+
+    assert any("from staging area" in line for line in output)
+    assert [r[0] for r in origin.requests].count("GET") == 1
+
+
+def test_fetching_process_links_its_own_tree(tmp_path, origin, meca_zip):
+    origin.add("/meca.zip", meca_zip())
+    provider = MecaContentProvider()
+    provider.staging = StagingArea(str(tmp_path / "staging"))
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    output = list(provider.fetch(spec, str(output_dir)))
+
+    assert not any("Copying" in line for line in output)
+    staged = provider.staging.lookup(spec["slug"])
+    for name in _tree(output_dir):
+        assert os.path.samefile(output_dir / name, os.path.join(staged.tree, name))
@@ -0,0 +1,156 @@
+import hashlib
+import io
+import os
+import zipfile
+from base64 import b64encode
+
+import pytest
+from meca4binder import MecaContentProvider
+from meca4binder.download import IntegrityError
+from meca4binder.streamzip import StreamingUnsupported, stream_extract
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream that forces zipfile to emit data descriptors"""
+
+    def __init__(self):
+        self.buf = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.buf.write(b)
+
+
+def read_tree(root):
+    tree = {}
+    for dirpath, _, filenames in os.walk(root):
+        for f in filenames:
+            full = os.path.join(dirpath, f)
+            with open(full, "rb") as fh:
+                tree[os.path.relpath(full, root)] = fh.read()
+    return tree
+
+
+def test_stream_extract_matches_extractall(tmp_path, meca_zip):
+    data = meca_zip()
+    names = stream_extract(io.BytesIO(data), str(tmp_path / "stream"), chunk_size=7)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        zf.extractall(tmp_path / "zip")
+        assert names == zf.namelist()
+
+    assert read_tree(tmp_path / "stream") == read_tree(tmp_path / "zip")
+
+
+def test_stream_extract_data_descriptors(tmp_path):
+    stream = Unseekable()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.xml", b"<manifest/>")
+        with zf.open("bundle/big.bin", "w") as member:
+            member.write(os.urandom(300_000))
+    data = stream.buf.getvalue()
+
+    stream_extract(io.BytesIO(data), str(tmp_path / "stream"))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        zf.extractall(tmp_path / "zip")
+
+    assert read_tree(tmp_path / "stream") == read_tree(tmp_path / "zip")
+
+
+def test_stream_extract_stored_with_descriptor_unsupported(tmp_path):
+    stream = Unseekable()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as zf:
+        with zf.open("bundle/data.bin", "w") as member:
+            member.write(b"x" * 1000)
+
+    with pytest.raises(StreamingUnsupported):
+        stream_extract(io.BytesIO(stream.buf.getvalue()), str(tmp_path))
+
+
+def test_stream_extract_not_a_zip(tmp_path):
+    with pytest.raises(StreamingUnsupported):
+        stream_extract(io.BytesIO(b"<html>not a bundle</html>"), str(tmp_path))
+
+
+def test_stream_extract_bad_crc(tmp_path, meca_zip):
+    data = bytearray(meca_zip(compression=zipfile.ZIP_STORED))
+    offset = data.index(b"# Hello MECA")
+    data[offset] = ord("!")
+
+    with pytest.raises(zipfile.BadZipFile):
+        stream_extract(io.BytesIO(bytes(data)), str(tmp_path))
+
+
+def test_stream_extract_sanitizes_paths(tmp_path):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("../../escape.txt", b"nope")
+        zf.writestr("/abs/path.txt", b"nope")
+
+    stream_extract(io.BytesIO(buf.getvalue()), str(tmp_path / "out"))
+
+    assert read_tree(tmp_path / "out") == {
+        "escape.txt": b"nope",
+        os.path.join("abs", "path.txt"): b"nope",
+    }
+
+
+def test_fetch_stream_extract(tmp_path, origin, meca_zip):
+    origin.add("/meca.zip", meca_zip())
+    provider = MecaContentProvider()
+    provider.stream_extract = True
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    output = list(provider.fetch(spec, str(tmp_path)))
+
+    assert any("Streaming" in line for line in output)
+    assert sorted(os.listdir(tmp_path)) == ["data", "index.md", "notebooks"]
+    assert not os.path.exists(tmp_path / "meca.zip")
+
+
+def test_fetch_stream_extract_falls_back(tmp_path, origin):
+    stream = Unseekable()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("manifest.xml", b"<manifest/>")
+        with zf.open("data.bin", "w") as member:
+            member.write(b"x" * 1000)
+    origin.add("/meca.zip", stream.buf.getvalue())
+    provider = MecaContentProvider()
+    provider.stream_extract = True
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    output = list(provider.fetch(spec, str(tmp_path)))
+
+    assert any("Cannot stream" in line for line in output)
+    with open(tmp_path / "data.bin", "rb") as f:
+        assert f.read() == b"x" * 1000
+
+
+def test_fetch_stream_extract_digest(tmp_path, origin, meca_zip, monkeypatch):
+    data = meca_zip()
+    origin.add("/meca.zip", data)
+    monkeypatch.setenv("MECA_HASH_ALGORITHM", "sha256")
+    monkeypatch.setenv("MECA_HASH_SCHEME", "content")
+    provider = MecaContentProvider()
+    provider.stream_extract = True
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    output = list(provider.fetch(spec, str(tmp_path)))
+
+    assert any("Streaming" in line for line in output)
+    assert provider.digest == hashlib.sha256(data).hexdigest()
+    assert provider.content_md5 == hashlib.md5(data).hexdigest()
+
+
+def test_fetch_stream_extract_rejects_corrupt_bundle(tmp_path, origin, meca_zip):
+    data = meca_zip()
+    wrong_md5 = b64encode(hashlib.md5(b"something else").digest()).decode()
+    origin.add("/meca.zip", data, {"Content-MD5": wrong_md5})
+    provider = MecaContentProvider()
+    provider.stream_extract = True
+    spec = provider.detect(f"{origin.url}/meca.zip".replace("http", "http+meca", 1))
+
+    with pytest.raises(IntegrityError):
+        list(provider.fetch(spec, str(tmp_path)))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,38 @@
+import base64
+from hashlib import md5
+
+import pytest
+from meca4binder.utils import canonical_content_md5, get_hashed_slug, get_slug
+
+DIGEST = md5(b"bundle").hexdigest()
+B64 = base64.b64encode(bytes.fromhex(DIGEST)).decode()
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({"Content-MD5": B64}, DIGEST),
+        ({"x-goog-hash": f"crc32c=AAAAAA==,md5={B64}"}, DIGEST),
+        ({"ETag": f'"{DIGEST.upper()}"'}, DIGEST),
+        ({"ETag": f'"{DIGEST}-12"'}, None),
+        ({"ETag": f'W/"{DIGEST}"'}, None),
+        ({"ETag": '"0x8DB7A2C6F3E2D41"'}, None),
+        ({"Content-MD5": "not base64!", "ETag": f'"{DIGEST}"'}, DIGEST),
+        ({"Content-Length": "123"}, None),
+    ],
+)
+def test_canonical_content_md5(headers, expected):
+    assert canonical_content_md5(headers) == expected
+
+
+def test_cloud_slug_is_location_independent():
+    a = get_slug("https://a.example.com/x/meca.zip", {"ETag": f'"{DIGEST}"'}, "cloud")
+    b = get_slug("https://b.example.org/y.zip?s=1", {"Content-MD5": B64}, "cloud")
+    assert a == b == f"meca-b-{DIGEST}"
+
+
+def test_cloud_slug_falls_back_to_url():
+    url = "https://a.example.com/x/meca.zip"
+    headers = {"ETag": '"opaque"'}
+    assert get_slug(url, headers, "cloud") == get_hashed_slug(url, '"opaque"')
+    assert get_slug(url, headers, "url") == get_hashed_slug(url, '"opaque"')
@@ -0,0 +1,93 @@
+import os
+import zipfile
+
+import pytest
+from tornado.httpclient import AsyncHTTPClient
+
+from meca4binder import MecaRepoProvider
+from meca4binder.validate import (
+    InvalidBundle,
+    RangesUnavailable,
+    validate_remote_bundle,
+)
+
+
+async def _validate(origin, path):
+    client = AsyncHTTPClient()
+    head = await client.fetch(f"{origin.url}{path}", method="HEAD")
+    return await validate_remote_bundle(client, f"{origin.url}{path}", head.headers)
+
+
+@pytest.mark.asyncio
+async def test_valid_bundle_is_checked_from_a_few_ranges(origin, meca_zip):
+    # the manifest is the first member, well before the central directory
+    data = meca_zip(
+        {"index.md": b"# Hello\n", "data/noise.bin": os.urandom(2 * 1024 * 1024)},
+        compression=zipfile.ZIP_STORED,
+    )
+    origin.add("/meca.zip", data, {"ETag": '"v1"'})
+
+    result = await _validate(origin, "/meca.zip")
+
+    assert result.article_source_dir == "bundle/"
+    assert result.requests == 2
+    assert result.bytes < 200 * 1024
+    gets = [r for r in origin.requests if r[0] == "GET"]
+    assert len(gets) == 2
+    assert all(headers["If-Range"] == '"v1"' for _, _, headers in gets)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "bundle, match",
+    [
+        (None, "not a zip file"),
+        ({"manifest": False}, "missing manifest.xml"),
+        ({"href": "elsewhere/"}, "elsewhere/ is not in the MECA bundle"),
+    ],
+)
+async def test_invalid_bundles_are_rejected(origin, meca_zip, bundle, match):
+    data = b"not a zip file" * 100 if bundle is None else meca_zip(**bundle)
+    origin.add("/meca.zip", data)
+    with pytest.raises(InvalidBundle, match=match):
+        await _validate(origin, "/meca.zip")
+
+
+@pytest.mark.asyncio
+async def test_malformed_manifest_is_rejected(origin, tmp_path):
+    bundle = tmp_path / "meca.zip"
+    with zipfile.ZipFile(bundle, "w") as zf:
+        zf.writestr("manifest.xml", b'<?xml version="1.0"?>\n<manifest><item')
+        zf.writestr("bundle/index.md", b"# Hello\n")
+    origin.add("/meca.zip", bundle.read_bytes())
+    with pytest.raises(InvalidBundle, match="not well formed"):
+        await _validate(origin, "/meca.zip")
+
+
+@pytest.mark.asyncio
+async def test_origin_without_ranges_is_not_validated(origin):
+    origin.add("/meca.zip", b"not a zip file")
+    origin.ranges = False
+    with pytest.raises(RangesUnavailable):
+        await _validate(origin, "/meca.zip")
+
+    provider = MecaRepoProvider(spec=f"{origin.url}/meca.zip", validate_bundle=True)
+    assert await provider.get_resolved_ref()
+    assert [r[0] for r in origin.requests] == ["HEAD", "HEAD"]
+
+
+@pytest.mark.asyncio
+async def test_resolution_rejects_invalid_bundles(origin, meca_zip):
+    origin.add("/good/meca.zip", meca_zip())
+    origin.add("/bad/meca.zip", meca_zip(manifest=False))
+
+    provider = MecaRepoProvider(spec=f"{origin.url}/good/meca.zip")
+    assert not provider.validate_bundle
+    provider = MecaRepoProvider(
+        spec=f"{origin.url}/good/meca.zip", validate_bundle=True
+    )
+    assert await provider.get_resolved_ref()
+
+    provider = MecaRepoProvider(spec=f"{origin.url}/bad/meca.zip", validate_bundle=True)
+    with pytest.raises(ValueError, match="Not a valid MECA bundle"):
+        await provider.get_resolved_ref()